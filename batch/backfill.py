@@ -0,0 +1,203 @@
+"""
+過去データのバックフィル。
+
+ユーザーと期間 (例: 2年分) を受け取り、sample/services の全メトリクスについて
+エンドポイントの最大日数ごとのチャンクに分割して取得する。
+完了したチャンクはローカルのチェックポイントに記録するため、中断しても続きから再開できる。
+
+    uv run python ../batch/backfill.py --start 2023-01-01 --end 2024-12-31 --out backfill
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import sqlite3
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# sample/ 配下のモジュールを読み込めるようにする
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sample"))
+
+from utils.api import ApiClient
+from utils.date_range import DATE_FORMAT, split_date_range
+from utils.logger import configure_logging, get_logger
+from sync import ACTIVITY_RESOURCES, Sink, make_sink, range_fetchers
+
+logger = get_logger("batch.backfill")
+
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(".state", "backfill.sqlite3")
+# レート制限の範囲内で同時に処理するチャンク数
+DEFAULT_MAX_CONCURRENCY = 8
+
+Chunk = Tuple[str, str, str]  # (メトリクス名, 開始日, 終了日)
+
+
+class BackfillCheckpoint:
+    """完了したチャンクを SQLite に記録する。"""
+    def __init__(self, path: str = DEFAULT_CHECKPOINT_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS completed_chunks (
+                user_id TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                start_date TEXT NOT NULL,
+                end_date TEXT NOT NULL,
+                completed_at TEXT NOT NULL,
+                PRIMARY KEY (user_id, metric, start_date, end_date)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def completed(self, user_id: str) -> set[Chunk]:
+        rows = self._conn.execute(
+            "SELECT metric, start_date, end_date FROM completed_chunks WHERE user_id = ?", (user_id,)
+        )
+        return set(rows.fetchall())
+
+    def mark_completed(self, user_id: str, chunk: Chunk) -> None:
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO completed_chunks VALUES (?, ?, ?, ?, ?)",
+                (user_id, *chunk, datetime.datetime.now().isoformat())
+            )
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class BackfillEngine:
+    """
+    チャンク単位の再開可能なバックフィル。
+    チャンクはワーカーで並行に処理され、実際の送信ペースは ApiClient のレート制限で調整される。
+    失敗したチャンクはチェックポイントに記録されないため、次回の実行で再取得される。
+    データの無いチャンク (204 や、デバイスを使い始める前の期間など) は完了として記録する。
+    """
+    def __init__(
+        self,
+        api_client: ApiClient,
+        sink: Sink,
+        user_id: str,
+        checkpoint: Optional[BackfillCheckpoint] = None,
+        activity_resources: Iterable[str] = ACTIVITY_RESOURCES,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    ):
+        self.sink = sink
+        self.user_id = user_id
+        self.checkpoint = checkpoint if checkpoint else BackfillCheckpoint()
+        self.max_concurrency = max_concurrency
+        self.fetchers = range_fetchers(api_client, activity_resources)
+
+    def plan(self, start_date: str, end_date: str, metrics: Optional[Iterable[str]] = None) -> List[Chunk]:
+        """期間を各メトリクスのエンドポイントの最大日数ごとのチャンクに分割する。"""
+        names = list(metrics) if metrics is not None else list(self.fetchers)
+        chunks = []
+        for metric in names:
+            _, max_days = self.fetchers[metric]
+            chunks.extend((metric, start, end) for start, end in split_date_range(start_date, end_date, max_days))
+        # 新しいチャンクを先に処理する (直近のデータほど早く利用できるように)
+        chunks.sort(key=lambda chunk: chunk[2], reverse=True)
+        return chunks
+
+    async def _process(self, chunk: Chunk) -> bool:
+        metric, start_date, end_date = chunk
+        fetcher, _ = self.fetchers[metric]
+        try:
+            data = await fetcher(start_date, end_date)
+        except Exception:
+            # エラーの詳細はサービスがログに記録している
+            logger.warning("Backfill chunk %s %s to %s for user %s failed.", metric, start_date, end_date, self.user_id)
+            return False
+        # データが無い場合 (None) は保存するものが無いだけで、再取得しても結果は変わらない
+        if data is not None:
+            await self.sink(self.user_id, metric, start_date, end_date, data)
+        self.checkpoint.mark_completed(self.user_id, chunk)
+        return True
+
+    async def run(self, start_date: str, end_date: str, metrics: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """
+        バックフィルを実行する。チェックポイント済みのチャンクはスキップする。
+        :return: {"planned", "skipped", "completed", "failed"} の件数
+        """
+        chunks = self.plan(start_date, end_date, metrics)
+        done = self.checkpoint.completed(self.user_id)
+        pending = [chunk for chunk in chunks if chunk not in done]
+        summary = {"planned": len(chunks), "skipped": len(chunks) - len(pending), "completed": 0, "failed": 0}
+        logger.info(
+            "Backfill for user %s from %s to %s: %s of %s chunks pending.", self.user_id, start_date, end_date, len(pending), len(chunks)
+        )
+
+        queue: asyncio.Queue[Chunk] = asyncio.Queue()
+        for chunk in pending:
+            queue.put_nowait(chunk)
+
+        async def worker() -> None:
+            while not queue.empty():
+                chunk = queue.get_nowait()
+                try:
+                    ok = await self._process(chunk)
+                except Exception as e:
+                    logger.exception("Backfill chunk %s for user %s raised: %s", chunk, self.user_id, e)
+                    ok = False
+                summary["completed" if ok else "failed"] += 1
+
+        async with asyncio.TaskGroup() as group:
+            for _ in range(min(self.max_concurrency, len(pending))):
+                group.create_task(worker())
+
+        logger.info("Backfill for user %s finished: %s", self.user_id, summary)
+        return summary
+
+
+async def main(args: argparse.Namespace) -> None:
+    from client import Client
+    from token_refresher import TokenRefresher
+    from users import resolve_credentials
+    from utils.transport import get_http_client, close_http_client
+
+    # --user はチェックポイントと保存先のラベルでもあるため、必ずそのユーザーの認証情報で取得する
+    client = Client(resolve_credentials(args.user, args.users))
+    http_client = get_http_client()
+    try:
+        access_token = await client.get_access_token(http_client)
+        if not access_token:
+            logger.error("Could not obtain an access token. Aborting backfill.")
+            return
+
+        # 長時間の実行中にトークンが失効しないよう、バックグラウンドで事前に更新する
+        async with TokenRefresher(client, http_client) as refresher:
+            api_client = refresher.attach(client.create_api_client(http_client, access_token))
+            engine = BackfillEngine(
+                api_client,
+                make_sink(args.out, args.format),
+                args.user,
+                checkpoint=BackfillCheckpoint(args.checkpoint),
+                max_concurrency=args.concurrency
+            )
+            await engine.run(args.start, args.end, args.metrics)
+    finally:
+        await close_http_client()
+
+
+if __name__ == "__main__":
+    yesterday = (datetime.date.today() - datetime.timedelta(days=1)).strftime(DATE_FORMAT)
+    parser = argparse.ArgumentParser(description="Fitbit の過去データをバックフィルする")
+    parser.add_argument("--users", default=None, help="ユーザーの認証情報ファイル (省略時は .env の認証情報)")
+    parser.add_argument("--user", default="-", help="--users から選ぶユーザーID (既定: 認証済みユーザー)")
+    parser.add_argument("--start", required=True, help="開始日 (YYYY-MM-DD)")
+    parser.add_argument("--end", default=yesterday, help="終了日 (YYYY-MM-DD, 既定: 昨日)")
+    parser.add_argument("--metrics", nargs="*", help="対象メトリクス (既定: 全て)")
+    parser.add_argument("--out", default="backfill", help="出力ディレクトリ")
+    parser.add_argument("--format", choices=["json", "parquet", "arrow"], default="json", help="保存形式")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH, help="チェックポイントファイル")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY, help="同時に処理するチャンク数")
+    args = parser.parse_args()
+    configure_logging()
+    asyncio.run(main(args))
@@ -0,0 +1,64 @@
+"""
+オフラインのベンチマーク。sample ディレクトリで実行する。
+
+    python -m benchmarks                                   # 全て実行して結果を表示
+    python -m benchmarks --filter request/ --quick         # 一部だけ、少ない回数で実行
+    python -m benchmarks --save benchmarks/baseline.json   # ベースラインとして保存
+    python -m benchmarks --compare benchmarks/baseline.json --threshold 0.1
+
+--compare で threshold を超えて遅くなった (またはメモリが増えた) ベンチマークがあれば終了コード 1 で終了する。
+"""
+import argparse
+import logging
+import sys
+
+from benchmarks.cases import all_benchmarks
+from benchmarks.harness import compare, format_comparison, format_table, load_results, run_benchmark, save_results
+from utils.logger import logger
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="リクエスト処理・デコード・集計のベンチマーク")
+    parser.add_argument("--filter", action="append", default=[], help="名前にこの文字列を含むものだけを実行する (複数指定可)")
+    parser.add_argument("--quick", action="store_true", help="計測回数を減らし、10,000 ユーザーの集計を除く")
+    parser.add_argument("--save", metavar="PATH", help="結果を JSON で保存する")
+    parser.add_argument("--compare", metavar="PATH", help="保存済みの結果 (ベースライン) と比較する")
+    parser.add_argument("--threshold", type=float, default=0.1, help="regression とみなす変化の割合")
+    parser.add_argument("--metric", default="p50", choices=["p50", "p90", "p99", "mean", "min"], help="比較に使う値")
+    parser.add_argument("--list", action="store_true", help="ベンチマークの一覧を表示する")
+    args = parser.parse_args()
+
+    benchmarks = [
+        benchmark for benchmark in all_benchmarks(args.quick)
+        if not args.filter or any(pattern in benchmark.name for pattern in args.filter)
+    ]
+    if args.list:
+        for benchmark in benchmarks:
+            print(benchmark.name)
+        return 0
+
+    # エラーのログ出力自体も計測対象だが、画面には出さない
+    logger.propagate = False
+    logger.addHandler(logging.NullHandler())
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    results = {}
+    for benchmark in benchmarks:
+        print(f"running {benchmark.name} ...", file=sys.stderr)
+        results[benchmark.name] = run_benchmark(benchmark).to_dict()
+    print(format_table(results))
+
+    if args.save:
+        save_results(args.save, results)
+        print(f"\nSaved results to {args.save}.")
+    if args.compare:
+        rows = compare(results, load_results(args.compare), args.threshold, args.metric)
+        print(f"\nCompared with {args.compare} ({args.metric}, threshold {args.threshold:.0%}):")
+        print(format_comparison(rows))
+        if any(row["regression"] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
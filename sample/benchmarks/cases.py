@@ -0,0 +1,301 @@
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from benchmarks.harness import Benchmark
+from errors import APIError
+from simulator import FitbitSimulator
+from utils.aggregate import DailySeries, UserMatrix
+from utils.api import ApiClient
+from utils.date_range import fetch_date_range, merge_range_responses, split_date_range
+from utils.json_stream import iter_json_array
+from utils.logger import logger
+from utils.metrics import Metrics
+from utils.rate_limit import RateLimiter
+from utils.retry import RetryPolicy
+from utils.timeseries import IntradaySeries
+from services.endpoints import ENDPOINTS
+
+
+USER_SCALES = (1, 100, 10000)
+# ローカルのシミュレーターではレート制限で待たないよう、予算を大きくする
+_UNLIMITED = 10 ** 9
+_BASE_URL = "https://api.fitbit.com"
+
+
+def _simulator_client(**options) -> ApiClient:
+    """レート制限と遅延の無いシミュレーターに接続した ApiClient (キャッシュ無し)"""
+    simulator = FitbitSimulator(rate_limit=_UNLIMITED, **options)
+    simulator.add_user("BENCH")
+    return ApiClient(
+        simulator.issue_access_token("BENCH"),
+        http_client=simulator.client(),
+        rate_limiter=RateLimiter(limit=_UNLIMITED),
+        retry_policy=RetryPolicy(max_retries=0)
+    )
+
+
+def _static_client(response: httpx.Response, metrics: Optional[Metrics] = None) -> ApiClient:
+    """常に同じレスポンスを返す ApiClient。ApiClient 自体のオーバーヘッドだけを計測する。"""
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(response.status_code, content=response.content, headers=response.headers)
+    return ApiClient(
+        "token",
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        rate_limiter=RateLimiter(limit=_UNLIMITED),
+        retry_policy=RetryPolicy(max_retries=0),
+        metrics=metrics
+    )
+
+
+def _intraday_payload(detail_level: str = "1sec") -> bytes:
+    """シミュレーターが生成する1日分の心拍数の日中データ (JSON)"""
+    simulator = FitbitSimulator()
+    simulator.add_user("BENCH")
+    path = ENDPOINTS["heart_rate_intraday"].path_for(date="2025-05-31", detail_level=detail_level)
+
+    async def fetch() -> bytes:
+        async with simulator.client() as client:
+            response = await client.get(f"{_BASE_URL}{path}", headers={"Authorization": f"Bearer {simulator.issue_access_token('BENCH')}"})
+            return response.content
+    return asyncio.run(fetch())
+
+
+def _daily_responses(users: int, days: int = 365, seed: int = 0) -> Dict[str, Any]:
+    """ユーザーごとの歩数の日付範囲レスポンス (activities-steps)"""
+    rng = np.random.default_rng(seed)
+    # 10,000 ユーザー分でもメモリに収まるよう、日付と値の文字列はレコード間で共有する
+    dates = np.arange(np.datetime64("2024-06-01"), np.datetime64("2024-06-01") + days).astype(str).tolist()
+    labels = [str(value) for value in range(20000)]
+    responses = {}
+    for user in range(users):
+        values = rng.integers(0, 20000, size=days).tolist()
+        responses[f"U{user:05d}"] = {"activities-steps": [{"dateTime": d, "value": labels[v]} for d, v in zip(dates, values)]}
+    return responses
+
+
+# ------------------------------------------------------------------------------
+# ApiClient のリクエスト1件あたりのオーバーヘッド
+# ------------------------------------------------------------------------------
+def request_success():
+    client = _static_client(httpx.Response(200, json={"hrv": []}))
+
+    async def run() -> None:
+        await client.get("/1/user/-/hrv/date/2025-05-31.json")
+    return run
+
+
+def request_success_with_metrics():
+    """計測 (utils.metrics) を有効にした場合"""
+    client = _static_client(httpx.Response(200, json={"hrv": []}), metrics=Metrics())
+
+    async def run() -> None:
+        await client.get("/1/user/-/hrv/date/2025-05-31.json")
+    return run
+
+
+def request_with_params():
+    client = _static_client(httpx.Response(200, json={"hrv": []}))
+
+    async def run() -> None:
+        await client.get("/1/user/-/hrv/date/2025-05-31.json", params={"timezone": "UTC"})
+    return run
+
+
+def request_error_mapping():
+    """404 を APIHttpError に変換するまで (ログ出力を含む)"""
+    client = _static_client(httpx.Response(404, json={"errors": [{"errorType": "not_found"}]}))
+
+    async def run() -> None:
+        try:
+            await client.get("/1/user/-/hrv/date/2025-05-31.json")
+        except APIError:
+            pass
+    return run
+
+
+def request_error_mapping_quiet():
+    """ログを出力しない場合の 404 の変換 (ログ出力のコストとの差分を見る)"""
+    client = _static_client(httpx.Response(404, json={"errors": [{"errorType": "not_found"}]}))
+
+    async def run() -> None:
+        level = logger.level
+        logger.setLevel(logging.CRITICAL)
+        try:
+            await client.get("/1/user/-/hrv/date/2025-05-31.json")
+        except APIError:
+            pass
+        finally:
+            logger.setLevel(level)
+    return run
+
+
+def request_concurrent_100():
+    """100件の異なる GET を同時に発行する"""
+    client = _static_client(httpx.Response(200, json={"hrv": []}))
+    endpoints = [f"/1/user/-/hrv/date/2025-{1 + i // 28:02d}-{1 + i % 28:02d}.json" for i in range(100)]
+
+    async def run() -> None:
+        await asyncio.gather(*(client.get(endpoint) for endpoint in endpoints))
+    return run
+
+
+# ------------------------------------------------------------------------------
+# 1秒間隔の心拍数の日中データのデコード
+# ------------------------------------------------------------------------------
+def decode_intraday_json():
+    payload = _intraday_payload()
+
+    def run() -> None:
+        json.loads(payload)
+    return run
+
+
+def decode_intraday_series():
+    """json.loads の後に IntradaySeries (配列) に変換する"""
+    payload = _intraday_payload()
+
+    def run() -> None:
+        IntradaySeries.from_dataset("2025-05-31", json.loads(payload)["activities-heart-intraday"]["dataset"], 1)
+    return run
+
+
+def decode_intraday_stream():
+    """64KiB ずつ届くレスポンスを iter_json_array で逐次デコードして IntradaySeries にする"""
+    payload = _intraday_payload()
+    chunk_size = 64 * 1024
+
+    async def chunks() -> AsyncIterator[bytes]:
+        for start in range(0, len(payload), chunk_size):
+            yield payload[start:start + chunk_size]
+
+    async def run() -> None:
+        await IntradaySeries.from_stream(
+            "2025-05-31", iter_json_array(chunks(), ("activities-heart-intraday", "dataset")), 1
+        )
+    return run
+
+
+# ------------------------------------------------------------------------------
+# 複数チャンクに分かれた日付範囲の取得と結合
+# ------------------------------------------------------------------------------
+def range_merge_responses():
+    """HRV 1年分 (30日ごとの13チャンク) のレスポンスの結合のみ"""
+    chunks = split_date_range("2024-06-01", "2025-05-31", ENDPOINTS["hrv_by_date_range"].max_range_days)
+    responses = [
+        {"hrv": [{"value": {"dailyRmssd": 40.0, "deepRmssd": 45.0}, "dateTime": start}] * 30}
+        for start, _ in chunks
+    ]
+
+    def run() -> None:
+        merge_range_responses(responses)
+    return run
+
+
+def range_fetch_hrv_year():
+    """
+    シミュレーターから HRV 1年分を分割して並行取得し、結合する。
+    シミュレーターは生成したレスポンスを再利用するため、2回目以降はクライアント側の処理だけが計測される。
+    """
+    client = _simulator_client()
+    endpoint = ENDPOINTS["hrv_by_date_range"]
+
+    async def run() -> None:
+        await fetch_date_range(
+            client, lambda start, end: endpoint.path_for(start=start, end=end), "2024-06-01", "2025-05-31", endpoint.max_range_days
+        )
+    return run
+
+
+def range_fetch_steps_three_years():
+    client = _simulator_client()
+    endpoint = ENDPOINTS["activity_time_series_by_date_range"]
+
+    async def run() -> None:
+        await fetch_date_range(
+            client, lambda start, end: endpoint.path_for(resource="steps", start=start, end=end),
+            "2022-06-01", "2025-05-31", endpoint.max_range_days
+        )
+    return run
+
+
+# ------------------------------------------------------------------------------
+# 日毎・週毎の集計
+# ------------------------------------------------------------------------------
+def rollup_single_user_responses(users: int):
+    """save() と同じく、ユーザーごとにレスポンスから DailySeries を作って集計する"""
+    responses = list(_daily_responses(users).values())
+
+    def run() -> None:
+        for response in responses:
+            series = DailySeries.from_response(response)
+            series.summary()
+            series.rollup("W")
+    return run
+
+
+def rollup_user_matrix(users: int):
+    """全ユーザー分を UserMatrix にまとめて集計する (行列の作成を含む)"""
+    responses = _daily_responses(users)
+
+    def run() -> None:
+        matrix = UserMatrix.from_responses(responses, "2024-06-01", "2025-05-31")
+        matrix.summary((50, 90))
+        matrix.rollup("W")
+        matrix.rollup("M")
+    return run
+
+
+def rollup_user_matrix_only(users: int):
+    """作成済みの UserMatrix の集計のみ"""
+    matrix = UserMatrix.from_responses(_daily_responses(users), "2024-06-01", "2025-05-31")
+
+    def run() -> None:
+        matrix.summary((50, 90))
+        matrix.rollup("W")
+        matrix.rollup("M")
+    return run
+
+
+def all_benchmarks(quick: bool = False) -> List[Benchmark]:
+    """
+    全てのベンチマーク。
+    :param quick: 計測回数を減らし、10,000 ユーザーの集計を除く (動作確認用)
+    """
+    scale = 0.1 if quick else 1.0
+
+    def n(iterations: int) -> int:
+        return max(3, int(iterations * scale))
+
+    benchmarks = [
+        Benchmark("request/success", request_success, iterations=n(2000), warmup=50, group="request"),
+        Benchmark("request/success_with_metrics", request_success_with_metrics, iterations=n(2000), warmup=50, group="request"),
+        Benchmark("request/with_params", request_with_params, iterations=n(2000), warmup=50, group="request"),
+        Benchmark("request/error_mapping", request_error_mapping, iterations=n(1000), warmup=20, group="request"),
+        Benchmark("request/error_mapping_quiet", request_error_mapping_quiet, iterations=n(1000), warmup=20, group="request"),
+        Benchmark("request/concurrent_100", request_concurrent_100, ops=100, iterations=n(50), warmup=3, group="request"),
+        Benchmark("decode/intraday_1sec_json", decode_intraday_json, iterations=n(20), group="decode"),
+        Benchmark("decode/intraday_1sec_series", decode_intraday_series, iterations=n(20), group="decode"),
+        Benchmark("decode/intraday_1sec_stream", decode_intraday_stream, iterations=n(10), group="decode"),
+        Benchmark("range/merge_hrv_year", range_merge_responses, ops=13, iterations=n(500), warmup=10, group="range"),
+        Benchmark("range/fetch_hrv_year", range_fetch_hrv_year, ops=13, iterations=n(50), warmup=3, group="range"),
+        Benchmark("range/fetch_steps_3_years", range_fetch_steps_three_years, ops=2, iterations=n(50), warmup=3, group="range"),
+    ]
+    for users in USER_SCALES:
+        if quick and users > 100:
+            continue
+        iterations = n(200 if users == 1 else 20 if users == 100 else 5)
+        warmup = 1 if users > 100 else 3
+        benchmarks += [
+            Benchmark(f"rollup/per_user_{users}", lambda users=users: rollup_single_user_responses(users),
+                      ops=users, iterations=iterations, warmup=warmup, group="rollup"),
+            Benchmark(f"rollup/matrix_{users}", lambda users=users: rollup_user_matrix(users),
+                      ops=users, iterations=iterations, warmup=warmup, group="rollup"),
+            Benchmark(f"rollup/matrix_only_{users}", lambda users=users: rollup_user_matrix_only(users),
+                      ops=users, iterations=iterations, warmup=warmup, group="rollup"),
+        ]
+    return benchmarks
@@ -0,0 +1,224 @@
+import asyncio
+import gc
+import inspect
+import json
+import os
+import platform
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List, Tuple, Union
+
+import numpy as np
+
+
+# 1回の計測で実行する処理。async 関数の場合は1つのイベントループの中で繰り返し実行する
+Operation = Callable[[], Union[None, Awaitable[None]]]
+
+PERCENTILES = (50, 90, 99)
+
+
+class Benchmark:
+    """
+    1つのベンチマーク。
+
+    :param setup: 計測の前に1回だけ呼ばれ、計測する処理 (引数なしの関数または async 関数) を返す
+    :param ops: 処理1回あたりの操作数 (リクエスト数、ユーザー数など)。スループットの計算に使う
+    :param iterations: 計測する回数
+    :param warmup: 計測前に捨てる回数
+    """
+    def __init__(
+        self,
+        name: str,
+        setup: Callable[[], Operation],
+        ops: int = 1,
+        iterations: int = 20,
+        warmup: int = 2,
+        group: str = ""
+    ):
+        self.name = name
+        self.setup = setup
+        self.ops = ops
+        self.iterations = iterations
+        self.warmup = warmup
+        self.group = group
+
+
+class BenchmarkResult:
+    def __init__(self, benchmark: Benchmark, samples: List[float], peak_memory: int):
+        self.name = benchmark.name
+        self.group = benchmark.group
+        self.ops = benchmark.ops
+        # 処理1回あたりの秒数
+        self.samples = samples
+        # 処理1回の間に tracemalloc で確保されたメモリの最大量 (バイト)
+        self.peak_memory = peak_memory
+
+    def to_dict(self) -> Dict[str, Any]:
+        samples = np.asarray(self.samples)
+        points = np.percentile(samples, PERCENTILES)
+        result = {
+            "group": self.group,
+            "iterations": len(self.samples),
+            "ops": self.ops,
+            "mean": float(samples.mean()),
+            "min": float(samples.min()),
+            **{f"p{q}": float(point) for q, point in zip(PERCENTILES, points)},
+            "ops_per_sec": float(self.ops / np.median(samples)),
+            "peak_memory": self.peak_memory,
+        }
+        return result
+
+
+async def _time_async(operation: Callable[[], Awaitable[None]], iterations: int) -> List[float]:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await operation()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _time_sync(operation: Callable[[], None], iterations: int) -> List[float]:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        operation()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def _run_async(benchmark: Benchmark, operation: Callable[[], Awaitable[None]]) -> Tuple[List[float], int]:
+    # ApiClient の RateLimiter などはイベントループに紐づくため、全ての計測を1つのループで行う
+    await _time_async(operation, benchmark.warmup)
+    gc.collect()
+    samples = await _time_async(operation, benchmark.iterations)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        await operation()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return samples, peak
+
+
+def _run_sync(benchmark: Benchmark, operation: Callable[[], None]) -> Tuple[List[float], int]:
+    _time_sync(operation, benchmark.warmup)
+    gc.collect()
+    samples = _time_sync(operation, benchmark.iterations)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return samples, peak
+
+
+def run_benchmark(benchmark: Benchmark) -> BenchmarkResult:
+    """
+    ウォームアップの後に iterations 回計測し、続けて tracemalloc を有効にした1回でピークメモリを計測する。
+    tracemalloc は処理を遅くするため、時間の計測とは分けている。
+    """
+    operation = benchmark.setup()
+    if inspect.iscoroutinefunction(operation):
+        samples, peak = asyncio.run(_run_async(benchmark, operation))
+    else:
+        samples, peak = _run_sync(benchmark, operation)
+    return BenchmarkResult(benchmark, samples, peak)
+
+
+def environment() -> Dict[str, Any]:
+    """結果を比較する際の参考情報 (実行環境が違うと結果は比較できない)"""
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+    }
+
+
+def save_results(path: str, results: Dict[str, Dict[str, Any]]) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), "results": results}, f, ensure_ascii=False, indent=2)
+
+
+def load_results(path: str) -> Dict[str, Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+
+def compare(
+    results: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    threshold: float = 0.1,
+    metric: str = "p50"
+) -> List[Dict[str, Any]]:
+    """
+    ベースラインと比較する。
+    :param threshold: この割合を超えて遅くなった (またはメモリが増えた) ものを regression とする
+    :return: [{"name", "metric", "baseline", "current", "change", "regression"}] (ベースラインに無いものは除く)
+    """
+    rows = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in (metric, "peak_memory"):
+            if not base.get(key):
+                continue
+            change = result[key] / base[key] - 1
+            rows.append({
+                "name": name,
+                "metric": key,
+                "baseline": base[key],
+                "current": result[key],
+                "change": change,
+                "regression": change > threshold,
+            })
+    return rows
+
+
+def format_seconds(value: float) -> str:
+    if value >= 1:
+        return f"{value:.2f}s"
+    if value >= 1e-3:
+        return f"{value * 1e3:.2f}ms"
+    return f"{value * 1e6:.1f}us"
+
+
+def format_bytes(value: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if abs(value) < 1024:
+            return f"{value:.0f}{unit}" if unit == "B" else f"{value:.1f}{unit}"
+        value /= 1024
+    return f"{value:.1f}GiB"
+
+
+def format_table(results: Dict[str, Dict[str, Any]]) -> str:
+    header = f"{'benchmark':<44} {'p50':>10} {'p90':>10} {'p99':>10} {'ops/s':>12} {'peak mem':>10}"
+    lines = [header, "-" * len(header)]
+    for name, result in results.items():
+        lines.append(
+            f"{name:<44} {format_seconds(result['p50']):>10} {format_seconds(result['p90']):>10} "
+            f"{format_seconds(result['p99']):>10} {result['ops_per_sec']:>12,.0f} {format_bytes(result['peak_memory']):>10}"
+        )
+    return "\n".join(lines)
+
+
+def format_comparison(rows: List[Dict[str, Any]]) -> str:
+    lines = []
+    for row in rows:
+        formatter = format_bytes if row["metric"] == "peak_memory" else format_seconds
+        mark = "REGRESSION" if row["regression"] else ("faster" if row["change"] < 0 else "")
+        lines.append(
+            f"{row['name']:<44} {row['metric']:<12} {formatter(row['baseline']):>10} -> {formatter(row['current']):>10} "
+            f"({row['change']:+.1%}) {mark}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,207 @@
+"""
+fitbit-sync: コマンドラインの入口。sample ディレクトリで実行する。
+
+    python cli.py fetch hrv --date 2025-05-31                        # 1つのメトリクスを取得して JSON を出力する
+    python cli.py fetch activity:steps --start 2025-05-01 --end 2025-05-31 --out steps.json
+    python cli.py backfill --start 2023-01-01 --out backfill --format parquet
+    python cli.py export hrv --source backfill --start 2024-01-01 --end 2024-12-31 --out hrv.csv
+    python cli.py serve --users users.json --port 8080
+
+サブコマンドは実行するときに必要なモジュールだけを import する。例えば fetch は取得するメトリクスのサービスだけを読み込み、
+numpy・pyarrow・Webhook のサーバーは読み込まない (cron などで短いコマンドを頻繁に実行する場合の起動時間を短くするため)。
+.env の読み込みと設定 (settings.get_settings) はプロセス内で1回だけ行う。
+"""
+import argparse
+import datetime
+import os
+import sys
+from typing import List, Optional
+
+from users import DEFAULT_USERS_PATH
+from utils.logger import configure_logging, get_logger
+
+logger = get_logger("cli")
+
+
+# batch/backfill.py の場所
+BATCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "batch")
+
+
+def _yesterday() -> str:
+    return (datetime.date.today() - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def _credentials(args: argparse.Namespace):
+    """--users を指定した場合はそのファイルの --user、省略した場合は .env の認証情報"""
+    from users import resolve_credentials
+    return resolve_credentials(args.user, args.users)
+
+
+# ------------------------------------------------------------------------------
+# fetch: 1つのメトリクスの取得
+# ------------------------------------------------------------------------------
+async def _fetch(args: argparse.Namespace) -> int:
+    from client import Client
+    from sync import range_fetcher
+    from utils.transport import get_http_client, close_http_client
+
+    cache = None
+    if not args.no_cache:
+        from utils.cache import ResponseCache
+        cache = ResponseCache()
+    # キャッシュのファイルは共有するが、キーはトークンの所有者ごとに分かれる (他のユーザーのレスポンスは返らない)
+    client = Client(_credentials(args), cache=cache)
+    http_client = get_http_client()
+    try:
+        access_token = await client.get_access_token(http_client)
+        if not access_token:
+            logger.error("Could not obtain an access token.")
+            return 1
+        owner = client.token_owner_mismatch()
+        if owner:
+            logger.error("The refresh token for user %s belongs to user %s.", args.user, owner)
+            return 1
+        fetcher, _ = range_fetcher(client.create_api_client(http_client, access_token), args.metric)
+        try:
+            data = await fetcher(args.start, args.end)
+        except Exception:
+            # エラーの詳細はサービスがログに記録している
+            return 1
+    finally:
+        await close_http_client()
+        if cache is not None:
+            cache.close()
+
+    import json
+    if args.out == "-":
+        json.dump(data, sys.stdout, ensure_ascii=False)
+        sys.stdout.write("\n")
+    else:
+        from tokens import atomic_write_text
+        atomic_write_text(args.out, json.dumps(data, ensure_ascii=False), mode=0o644)
+        logger.info("Wrote %s from %s to %s to %s.", args.metric, args.start, args.end, args.out)
+    return 0
+
+
+def fetch(args: argparse.Namespace) -> int:
+    from sync import RANGE_METRICS
+
+    # トークンのリフレッシュの前に確認する
+    kind, _, resource = args.metric.partition(":")
+    if args.metric not in RANGE_METRICS and not (kind == "activity" and resource):
+        logger.error("Unknown metric: %s. Choose from %s or activity:<resource>.", args.metric, ", ".join(RANGE_METRICS))
+        return 2
+    if args.date:
+        args.start = args.end = args.date
+    args.end = args.end or _yesterday()
+    args.start = args.start or args.end
+
+    import asyncio
+    return asyncio.run(_fetch(args))
+
+
+# ------------------------------------------------------------------------------
+# backfill: 過去データの一括取得 (batch/backfill.py)
+# ------------------------------------------------------------------------------
+def backfill(args: argparse.Namespace) -> int:
+    import asyncio
+
+    sys.path.insert(0, BATCH_DIR)
+    import backfill as engine
+
+    args.end = args.end or _yesterday()
+    args.checkpoint = args.checkpoint or engine.DEFAULT_CHECKPOINT_PATH
+    args.concurrency = args.concurrency or engine.DEFAULT_MAX_CONCURRENCY
+    asyncio.run(engine.main(args))
+    return 0
+
+
+# ------------------------------------------------------------------------------
+# export: 列指向の保存先からの書き出し
+# ------------------------------------------------------------------------------
+def export(args: argparse.Namespace) -> int:
+    from columnar import ColumnarStore, export_table
+
+    store = ColumnarStore(args.source, format=args.format)
+    table = store.read(args.metric, args.start, args.end or _yesterday(), user_ids=args.user or None, columns=args.columns)
+    rows = export_table(table, args.out)
+    logger.info("Exported %s rows of %s to %s.", rows, args.metric, args.out)
+    return 0
+
+
+# ------------------------------------------------------------------------------
+# serve: Subscriptions API の通知を受けて差分を取得する (webhook.py)
+# ------------------------------------------------------------------------------
+def serve(args: argparse.Namespace) -> int:
+    import asyncio
+    import webhook
+
+    args.path = args.path or webhook.DEFAULT_PATH
+    asyncio.run(webhook.main(args))
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="fitbit-sync", description="Fitbit のデータを取得・同期する")
+    parser.add_argument("--log-level", default=None, help="ログのレベル (既定: 環境変数 LOG_LEVEL または INFO)")
+    parser.add_argument("--log-format", choices=["text", "json"], default=None, help="ログの形式 (既定: 環境変数 LOG_FORMAT または text)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    fetch_parser = commands.add_parser("fetch", help="1つのメトリクスを取得して JSON で出力する")
+    fetch_parser.add_argument("metric", help="メトリクス (sleep, hrv, spo2, temp_skin, heart_rate, activity:<リソース>)")
+    fetch_parser.add_argument("--date", help="取得する日 (YYYY-MM-DD)。--start/--end の代わりに指定する")
+    fetch_parser.add_argument("--start", help="開始日 (YYYY-MM-DD, 既定: 終了日)")
+    fetch_parser.add_argument("--end", help="終了日 (YYYY-MM-DD, 既定: 昨日)")
+    fetch_parser.add_argument("--users", default=None, help="ユーザーの認証情報ファイル (省略時は .env の認証情報)")
+    fetch_parser.add_argument("--user", default="-", help="--users から選ぶユーザーID")
+    fetch_parser.add_argument("--out", default="-", help="出力ファイル (既定: 標準出力)")
+    fetch_parser.add_argument("--no-cache", action="store_true", help="レスポンスのキャッシュを使わない")
+    fetch_parser.set_defaults(handler=fetch)
+
+    backfill_parser = commands.add_parser("backfill", help="過去データを再開可能なチャンクに分けて取得する")
+    backfill_parser.add_argument("--users", default=None, help="ユーザーの認証情報ファイル (省略時は .env の認証情報)")
+    backfill_parser.add_argument("--user", default="-", help="--users から選ぶユーザーID (既定: 認証済みユーザー)")
+    backfill_parser.add_argument("--start", required=True, help="開始日 (YYYY-MM-DD)")
+    backfill_parser.add_argument("--end", help="終了日 (YYYY-MM-DD, 既定: 昨日)")
+    backfill_parser.add_argument("--metrics", nargs="*", help="対象メトリクス (既定: 全て)")
+    backfill_parser.add_argument("--out", default="backfill", help="出力ディレクトリ")
+    backfill_parser.add_argument("--format", choices=["json", "parquet", "arrow"], default="json", help="保存形式")
+    backfill_parser.add_argument("--checkpoint", help="チェックポイントファイル (既定: .state/backfill.sqlite3)")
+    backfill_parser.add_argument("--concurrency", type=int, help="同時に処理するチャンク数")
+    backfill_parser.set_defaults(handler=backfill)
+
+    export_parser = commands.add_parser("export", help="Parquet/Arrow で保存したデータを CSV・JSON Lines などに書き出す")
+    export_parser.add_argument("metric", help="メトリクス (例: hrv, activity:steps)")
+    export_parser.add_argument("--source", default="backfill", help="保存先のディレクトリ (backfill や sync の --out)")
+    export_parser.add_argument("--format", choices=["parquet", "arrow"], default="parquet", help="保存先の形式")
+    export_parser.add_argument("--start", required=True, help="開始日 (YYYY-MM-DD)")
+    export_parser.add_argument("--end", help="終了日 (YYYY-MM-DD, 既定: 昨日)")
+    export_parser.add_argument("--user", action="append", help="対象ユーザー (複数指定可, 既定: 全員)")
+    export_parser.add_argument("--columns", nargs="*", help="書き出す列 (既定: 全て)")
+    export_parser.add_argument("--out", default="-", help="出力ファイル (.csv, .parquet, .arrow, .jsonl, 既定: 標準出力に JSON Lines)")
+    export_parser.set_defaults(handler=export)
+
+    serve_parser = commands.add_parser("serve", help="Subscriptions API の通知を受けて差分を取得するサーバーを起動する")
+    serve_parser.add_argument("--users", default=DEFAULT_USERS_PATH, help="ユーザーの認証情報ファイル (JSON)")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument("--path", default=None, help="通知を受け取るパス (既定: /webhook)")
+    serve_parser.add_argument("--out", default="sync", help="出力ディレクトリ")
+    serve_parser.add_argument("--format", choices=["json", "parquet", "arrow"], default="json", help="保存形式")
+    serve_parser.add_argument("--workers", type=int, default=4, help="同時に処理する通知の数")
+    serve_parser.set_defaults(handler=serve)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    from config import load_environment
+
+    # LOG_* などを .env に書いた場合に備えて、ログの設定より先に読み込む
+    load_environment()
+    configure_logging(level=args.log_level, format=args.log_format)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
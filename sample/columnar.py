@@ -0,0 +1,224 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional
+from urllib.parse import quote
+
+from utils.date_range import record_date
+from utils.logger import get_logger
+
+# 読み出し・書き出しだけの場合に httpx などを読み込まないよう、型注釈でのみ使う
+if TYPE_CHECKING:
+    from sync import Sink
+
+logger = get_logger(__name__)
+
+
+# 対応する保存形式と拡張子
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+PARTITION_FIELDS = ("user_id", "metric", "date")
+
+
+def _require_pyarrow():
+    """pyarrow は任意の依存関係。使うときにだけ読み込む。"""
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+        import pyarrow.feather
+    except ImportError:
+        raise ImportError("pyarrow is required for columnar storage. Install it with 'pip install sample[parquet]'.")
+    return pyarrow
+
+
+def iter_records(data: Any) -> Iterable[Dict[str, Any]]:
+    """
+    範囲エンドポイントのレスポンス (リスト、またはリストを値に持つ dict) からレコードを取り出す。
+    例: {"activities-steps": [...]}, {"hrv": [...]}, {"sleep": [...]}, [{"dateTime": ..., "value": {...}}]
+    """
+    if isinstance(data, list):
+        yield from (record for record in data if isinstance(record, dict))
+    elif isinstance(data, dict):
+        for value in data.values():
+            if isinstance(value, list):
+                yield from (record for record in value if isinstance(record, dict))
+
+
+def flatten_record(record: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    """
+    ネストした dict を "value.dailyRmssd" のようなドット区切りの列に展開する。
+    リストなど列にできない値は JSON 文字列として保持する。
+    activities-* の "value" のような数値の文字列は数値に変換する。
+    """
+    row: Dict[str, Any] = {}
+    for key, value in record.items():
+        column = f"{prefix}{key}"
+        if isinstance(value, dict):
+            row.update(flatten_record(value, f"{column}."))
+        elif isinstance(value, list):
+            row[column] = json.dumps(value, ensure_ascii=False)
+        elif isinstance(value, str) and column == "value":
+            try:
+                row[column] = float(value)
+            except ValueError:
+                row[column] = value
+        elif isinstance(value, int) and not isinstance(value, bool) and not key.endswith("Id"):
+            # 同じ列が日によって整数と小数になってもスキーマが揃うよう、数値は float64 にする (logId などの ID は除く)
+            row[column] = float(value)
+        else:
+            row[column] = value
+    return row
+
+
+def rows_by_date(data: Any) -> Dict[str, List[Dict[str, Any]]]:
+    """レスポンスを日付ごとの行に分ける。日付の無いレコードは捨てる。"""
+    rows: Dict[str, List[Dict[str, Any]]] = {}
+    for record in iter_records(data):
+        date = record_date(record)
+        if date is None:
+            logger.warning("Skipping record without a date: %s", list(record.keys()))
+            continue
+        row = {k: v for k, v in flatten_record(record).items() if k not in PARTITION_FIELDS}
+        rows.setdefault(date, []).append(row)
+    return rows
+
+
+class ColumnarStore:
+    """
+    取得したデータを列指向のファイル (Parquet または Arrow IPC) に保存し、読み出す。
+
+        <root>/user_id=<ユーザーID>/metric=<メトリクス>/date=<YYYY-MM-DD>/part<拡張子>
+
+    日付ごとのパーティションに1ファイルを置くため、差分同期で新しい日を追加しても過去のファイルは書き換えない。
+    同じ日を取得し直した場合はその日のファイルだけを置き換える。
+    読み出しは pyarrow.dataset のフィルタでパーティションを絞り込むため、対象外のファイルは開かない。
+    """
+    def __init__(self, root: str, format: str = "parquet", compression: str = "zstd"):
+        if format not in FORMATS:
+            raise ValueError(f"Unsupported format: {format}. Supported: {list(FORMATS)}")
+        self.root = root
+        self.format = format
+        self.compression = compression
+
+    def _partition_dir(self, user_id: str, metric: str, date: str) -> str:
+        # "activity:steps" の ":" などはパーティション値としてエンコードする (読み出し時に pyarrow がデコードする)
+        return os.path.join(
+            self.root,
+            f"user_id={quote(user_id, safe='')}",
+            f"metric={quote(metric, safe='')}",
+            f"date={date}"
+        )
+
+    def _write_table(self, table, path: str) -> None:
+        pa = _require_pyarrow()
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".part-", suffix=".tmp")
+        os.close(fd)
+        try:
+            if self.format == "parquet":
+                pa.parquet.write_table(table, tmp_path, compression=self.compression)
+            else:
+                pa.feather.write_feather(table, tmp_path, compression=self.compression)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def write(self, user_id: str, metric: str, data: Any) -> int:
+        """
+        レスポンスを日付ごとのパーティションに書き出す。
+        :return: 書き出した日数
+        """
+        pa = _require_pyarrow()
+        days = rows_by_date(data)
+        for date, rows in days.items():
+            table = pa.Table.from_pylist(rows)
+            self._write_table(table, os.path.join(self._partition_dir(user_id, metric, date), f"part{FORMATS[self.format]}"))
+        logger.debug("Wrote %s day partitions of %s for user %s to %s.", len(days), metric, user_id, self.root)
+        return len(days)
+
+    def sink(self) -> "Sink":
+        """IncrementalSync / BackfillEngine に渡す sink を返す。書き込みはスレッドで行い、イベントループを止めない。"""
+        async def sink(user_id: str, metric: str, start_date: str, end_date: str, data: Any) -> None:
+            await asyncio.to_thread(self.write, user_id, metric, data)
+        return sink
+
+    def _partitioning(self):
+        pa = _require_pyarrow()
+        return pa.dataset.partitioning(
+            pa.schema([(field, pa.string()) for field in PARTITION_FIELDS]),
+            flavor="hive"
+        )
+
+    def read(
+        self,
+        metric: str,
+        start_date: str,
+        end_date: str,
+        user_ids: Optional[Iterable[str]] = None,
+        columns: Optional[List[str]] = None
+    ):
+        """
+        1つのメトリクスの start_date から end_date まで (両端を含む) を pyarrow.Table で返す。
+        user_ids を省略すると全ユーザーを対象にする。
+        条件はまずパーティション (user_id / metric / date) に対して評価されるため、該当するファイルだけが開かれる。
+        """
+        pa = _require_pyarrow()
+        if not os.path.isdir(self.root):
+            return pa.table({})
+        field = pa.dataset.field
+        condition = (field("metric") == metric) & (field("date") >= start_date) & (field("date") <= end_date)
+        if user_ids is not None:
+            condition &= field("user_id").isin(list(user_ids))
+
+        file_format = "ipc" if self.format == "arrow" else "parquet"
+        partitioning = self._partitioning()
+        fragments = list(pa.dataset.dataset(self.root, format=file_format, partitioning=partitioning).get_fragments(filter=condition))
+        if not fragments:
+            return pa.table({})
+        # 日によって列が異なる (データの無い項目がある) ため、対象ファイルのスキーマを統合してから読む
+        schema = pa.unify_schemas(
+            [fragment.physical_schema for fragment in fragments]
+            + [pa.schema([(name, pa.string()) for name in PARTITION_FIELDS])],
+            promote_options="permissive"
+        )
+        dataset = pa.dataset.dataset(
+            [fragment.path for fragment in fragments],
+            schema=schema,
+            format=file_format,
+            partitioning=partitioning,
+            partition_base_dir=self.root
+        )
+        if columns is not None:
+            columns = list(dict.fromkeys([*PARTITION_FIELDS, *columns]))
+        return dataset.to_table(columns=columns, filter=condition)
+
+
+def export_table(table, path: str) -> int:
+    """
+    ColumnarStore.read() の結果を書き出す。形式は拡張子で決める。
+    .csv, .parquet, .arrow はそのまま、それ以外 (.json, .jsonl) と "-" (標準出力) は1行1レコードの JSON にする。
+    :return: 書き出した行数
+    """
+    pa = _require_pyarrow()
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        import pyarrow.csv
+        pa.csv.write_csv(table, path)
+    elif extension == ".parquet":
+        pa.parquet.write_table(table, path)
+    elif extension == ".arrow":
+        pa.feather.write_feather(table, path)
+    else:
+        output = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+        try:
+            for batch in table.to_batches():
+                output.writelines(json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in batch.to_pylist())
+        finally:
+            if output is not sys.stdout:
+                output.close()
+    return table.num_rows
@@ -1,12 +1,28 @@
+import functools
 import os
-from dotenv import load_dotenv
 from errors import ConfigError
 
-load_dotenv(verbose=True)
+
+@functools.cache
+def load_environment() -> None:
+    """
+    .env を環境変数に読み込む。プロセス内で最初の1回だけ読み込み、import 時には読み込まない。
+    python-dotenv も必要になるまで読み込まない (起動時間を短くするため)。
+    """
+    from dotenv import load_dotenv
+    load_dotenv(verbose=True)
+
 
 class Config:
     def get(self, key: str) -> str:
+        load_environment()
         val = os.getenv(key)
         if val is None:
             raise ConfigError(f"Not found: {key}")
         return val
+
+
+@functools.cache
+def get_config() -> Config:
+    """プロセス共有の Config"""
+    return Config()
@@ -31,8 +31,9 @@ class APICommunicationError(APIError):
 
 class APIHttpError(APIError):
     """APIからのHTTPエラーレスポンス。"""
-    def __init__(self, status_code: int, response_text: str | None = None, message: str = "API HTTP error"):
+    def __init__(self, status_code: int, response_text: str | None = None, message: str = "API HTTP error", retry_after: float | None = None):
         super().__init__(f"{message}: Status {status_code}, Response: {response_text or 'N/A'}", status_code, response_text)
+        self.retry_after = retry_after # Retry-After ヘッダーの秒数 (あれば)
 
 class APIUnauthorizedError(APIHttpError):
     """APIからの401 Unauthorizedエラー。"""
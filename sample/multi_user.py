@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+import httpx
+
+from client import Client
+from users import UserCredentials, UserRegistry, DEFAULT_USERS_PATH
+from sync import IncrementalSync, Sink, make_sink
+from utils.api import ApiClient
+from utils.cache import ResponseCache
+from utils.concurrency import gather_bounded
+from utils.logger import configure_logging, get_logger
+from utils.rate_limit import RateLimiter
+from utils.transport import get_http_client, close_http_client
+from utils.watermark import WatermarkStore
+
+logger = get_logger(__name__)
+
+
+# ユーザーごとに実行する処理: (認証情報, そのユーザーの ApiClient) を受け取る
+Job = Callable[[UserCredentials, ApiClient], Awaitable[Any]]
+
+# 同時に同期するユーザー数の上限
+DEFAULT_MAX_CONCURRENT_USERS = 32
+
+
+class MultiUserRunner:
+    """
+    複数ユーザーを1つのイベントループ上で並行に同期する。
+
+    全ユーザーがプロセス共有の httpx.AsyncClient (コネクションプール) を使い、
+    レート制限の予算はユーザーごとの RateLimiter で管理する。
+    cache は全ユーザーで共有するが、キーにはアクセストークンの所有者が含まれるため、他のユーザーのレスポンスは返らない。
+    あるユーザーの失敗 (トークンの失効など) は他のユーザーに影響しない。
+    """
+    def __init__(
+        self,
+        users: Iterable[UserCredentials],
+        job: Job,
+        http_client: Optional[httpx.AsyncClient] = None,
+        cache: Optional[ResponseCache] = None,
+        max_concurrent_users: int = DEFAULT_MAX_CONCURRENT_USERS
+    ):
+        self.users = list(users)
+        self.job = job
+        self.cache = cache
+        self.max_concurrent_users = max_concurrent_users
+        self._http_client = http_client
+        self.rate_limiters: Dict[str, RateLimiter] = {user.user_id: RateLimiter() for user in self.users}
+
+    async def _run_user(self, user: UserCredentials, http_client: httpx.AsyncClient) -> Any:
+        client = Client(user, cache=self.cache, rate_limiter=self.rate_limiters[user.user_id])
+        access_token = await client.get_access_token(http_client)
+        if not access_token:
+            logger.error("Skipping user %s: could not obtain an access token.", user.user_id)
+            return None
+        owner = client.token_owner_mismatch()
+        if owner:
+            logger.error("Skipping user %s: the refresh token belongs to user %s.", user.user_id, owner)
+            return None
+        return await self.job(user, client.create_api_client(http_client, access_token))
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        全ユーザーの処理を実行する。
+        :return: {ユーザーID: job の戻り値} (失敗したユーザーは None)
+        """
+        http_client = self._http_client if self._http_client else get_http_client()
+        return await gather_bounded(
+            {user.user_id: self._run_user(user, http_client) for user in self.users},
+            max_concurrency=self.max_concurrent_users
+        )
+
+
+def incremental_sync_job(sink: Sink, store: Optional[WatermarkStore] = None, **sync_options) -> Job:
+    """各ユーザーで IncrementalSync を実行する job を返す。"""
+    store = store if store else WatermarkStore()
+
+    async def job(user: UserCredentials, api_client: ApiClient) -> Any:
+        return await IncrementalSync(api_client, sink, user.user_id, store=store, **sync_options).run()
+    return job
+
+
+async def main(args: argparse.Namespace) -> None:
+    from settings import get_settings
+
+    settings = get_settings()
+    registry = UserRegistry(args.users, settings.client_id, settings.client_secret)
+    runner = MultiUserRunner(
+        registry,
+        incremental_sync_job(make_sink(args.out, args.format)),
+        # 1つのキャッシュを共有する (キーはユーザーごとに分かれる)
+        cache=ResponseCache(),
+        max_concurrent_users=args.concurrency
+    )
+    try:
+        results = await runner.run()
+    finally:
+        await close_http_client()
+    failed = [user_id for user_id, result in results.items() if result is None]
+    logger.info("Synced %s of %s users. Failed: %s", len(results) - len(failed), len(results), failed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="複数ユーザーの Fitbit データを同期する")
+    parser.add_argument("--users", default=DEFAULT_USERS_PATH, help="ユーザーの認証情報ファイル (JSON)")
+    parser.add_argument("--out", default="sync", help="出力ディレクトリ")
+    parser.add_argument("--format", choices=["json", "parquet", "arrow"], default="json", help="保存形式")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_CONCURRENT_USERS, help="同時に同期するユーザー数")
+    args = parser.parse_args()
+    configure_logging()
+    asyncio.run(main(args))
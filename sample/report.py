@@ -0,0 +1,322 @@
+"""
+Client.save() の取得結果を端末に表示するレポーター。
+
+表示は全て文字列として組み立ててから1回で書き出し、書き込みはスレッドで行うため、
+大量の出力でもイベントループを止めない。バッチ処理では使わない (Client.save() に渡さない)。
+"""
+import asyncio
+import sys
+from typing import IO, Any, Dict, List, Optional
+
+import numpy as np
+
+from utils.aggregate import DailySeries, format_date
+from utils.api import ApiClient
+from utils.transport import get_transport_manager
+
+
+class ConsoleReporter:
+    """
+    :param stream: 出力先 (既定は標準出力)
+    :param verbose: True の場合は睡眠ステージの記録を1件ずつ、皮膚温度などのレスポンスをそのまま表示する。
+        False の場合は睡眠ステージを種類ごとの件数と合計時間にまとめる
+    """
+    def __init__(self, stream: Optional[IO[str]] = None, verbose: bool = False):
+        self.stream = stream
+        self.verbose = verbose
+
+    async def report(self, client: Any, api_client: ApiClient, target_date: str, results: Dict[str, Any]) -> None:
+        text = self.render(client, api_client, target_date, results)
+        await asyncio.to_thread(self.write, text)
+
+    def write(self, text: str) -> None:
+        stream = self.stream if self.stream is not None else sys.stdout
+        stream.write(text)
+        stream.flush()
+
+    def render(self, client: Any, api_client: ApiClient, target_date: str, results: Dict[str, Any]) -> str:
+        """
+        :param client: 取得に使った Client (表示する期間の計算とキャッシュの統計に使う)
+        :param results: Client.fetch_metrics() の戻り値
+        """
+        lines: List[str] = []
+        out = lines.append
+
+        out(f"\nFitbitデータ取得プログラム ({target_date} のデータ)")
+        out("==============================================")
+
+        # --- 睡眠データの表示 ---
+        sleep_data = results["sleep"]
+        if sleep_data and sleep_data.get("sleep"):
+            out("睡眠データ取得成功:")
+            if sleep_data.get("summary"):
+                stage_minutes = sleep_data['summary'].get('stages') or {}
+                out(f"  総睡眠時間 (分): {sleep_data['summary'].get('totalMinutesAsleep')}, "
+                    + f"深い眠り（分）: {stage_minutes.get('deep')}, "
+                    + f"浅い眠り（分）: {stage_minutes.get('light')}, "
+                    + f"レム睡眠（分）: {stage_minutes.get('rem')}, "
+                    + f"覚醒状態（分）: {stage_minutes.get('wake')}")
+            if sleep_data.get("sleep"):
+                for i, record in enumerate(sleep_data["sleep"]):
+                    out(f"  睡眠レコード {i+1}: 開始時刻: {record.get('startTime')}, 睡眠効率: {record.get('efficiency')}%") # minutesAsleep/timeInBed
+                    stages = record.get("levels", {}).get("data", [])
+                    if self.verbose:
+                        for j, log in enumerate(stages):
+                            out(f"    ログ {j+1}: 時刻: {log.get('dateTime')}, 種類: {log.get('level')}, 時間（秒）: {log.get('seconds')}")
+                    else:
+                        # 1晩で数十〜数百件あるため、種類ごとにまとめる
+                        for level, (count, seconds) in _summarize_stages(stages).items():
+                            out(f"    {level}: {count} 回, 合計 {seconds // 60} 分")
+        else:
+            out("睡眠データ無し")
+
+        # --- 体温データの表示 ---
+        out("\n--- 体温データ ---")
+
+        # 皮膚温度 (単日)
+        skin_temp_single_date_data = results["skin_temp"]
+        if self.verbose:
+            out(str(skin_temp_single_date_data))
+        if skin_temp_single_date_data and skin_temp_single_date_data.get("tempSkin"):
+            out(f"\n皮膚温度 ({target_date}):")
+            for record in skin_temp_single_date_data["tempSkin"]:
+                out(f"  記録ID: {record.get('logId')}, 日時: {record.get('dateTime')}, "
+                    + f"値: {record.get('value').get('value')}°C (基準からの偏差), "
+                    + f"夜間平均: {record.get('value').get('nightlyMean')}") # nightlyMean はない場合がある
+
+        # 皮膚温度 (期間) - 例: target_date から3日前までのデータを取得
+        start_date_temp, end_date_temp = client._trailing_range(target_date, days=3)
+        skin_temp_range_data = results["skin_temp_range"]
+        if self.verbose:
+            out(str(skin_temp_range_data))
+        if skin_temp_range_data and skin_temp_range_data.get("tempSkin"):
+            out(f"\n皮膚温度 ({start_date_temp} - {end_date_temp}):")
+            for record in skin_temp_range_data["tempSkin"]:
+                out(f"  記録ID: {record.get('logId')}, 日時: {record.get('dateTime')}, "
+                    + f"値: {record.get('value').get('value')}°C (基準からの偏差), "
+                    + f"夜間平均: {record.get('value').get('nightlyMean')}") # nightlyMean はない場合がある
+
+        # 体幹温度 (単日) - 注意: このAPIは一部のデバイス/ユーザーでのみ利用可能です。
+        core_temp_data = results["core_temp"]
+        if self.verbose:
+            out(str(core_temp_data))
+        if core_temp_data and core_temp_data.get("tempCore"):
+            out(f"\n体幹温度 ({target_date}):")
+            for record in core_temp_data["tempCore"]:
+                out(f"  記録ID: {record.get('logId')}, 日時: {record.get('dateTime')}, "
+                    + f"値: {record.get('value')}°C, 集計期間(分): {record.get('logType')}") # logTypeは集計期間を示唆
+
+        # --- SpO2 データの表示 ---
+        out("\n--- SpO2データ ---")
+
+        # SpO2 (単日)
+        spo2_single_date_data = results["spo2"]
+        if spo2_single_date_data and spo2_single_date_data.get("value"):
+            out(f"\nSpO2 ({target_date}):")
+            out(f"  平均: {spo2_single_date_data['value'].get('avg')}%, "
+                + f"最小: {spo2_single_date_data['value'].get('min')}%, "
+                + f"最大: {spo2_single_date_data['value'].get('max')}%")
+        elif spo2_single_date_data: # データはあるが 'value' キーがない場合 (e.g., 204 No Content)
+            out(f"\nSpO2 ({target_date}): データがありませんでした。")
+
+
+        # SpO2 (期間) - 例: target_date から3日前までのデータを取得
+        start_date_spo2, end_date_spo2 = client._trailing_range(target_date, days=3)
+        spo2_range_data = results["spo2_range"]
+        if spo2_range_data: # レスポンスのキーが "spo2" で、その中にリストが入る
+            out(f"\nSpO2 ({start_date_spo2} - {end_date_spo2}):")
+            for day_data in spo2_range_data:
+                if day_data.get("value"):
+                    out(f"  日付: {day_data.get('dateTime')}, "
+                        + f"平均: {day_data['value'].get('avg')}%, "
+                        + f"最小: {day_data['value'].get('min')}%, "
+                        + f"最大: {day_data['value'].get('max')}%")
+                else:
+                    out(f"  日付: {day_data.get('dateTime')}, データがありませんでした。")
+
+
+        # --- 心拍数データの表示 ---
+        out("\n--- 心拍数データ ---")
+
+        # 心拍変動 (HRV) (単日)
+        hrv_single_date_data = results["hrv"]
+        if hrv_single_date_data and hrv_single_date_data.get("hrv"):
+            out(f"\n心拍変動 (HRV) ({target_date}):")
+            for record in hrv_single_date_data["hrv"]:
+                if record.get("value") and record["value"].get("dailyRmssd") is not None:
+                    out(f"  RMSSD: {record['value']['dailyRmssd']}, "
+                        + f"低周波 (LF): {record['value'].get('deepRmssd')}") # deepRmssd は睡眠中のHRVの指標
+                else:
+                    out(f"  HRVデータ詳細なし: {record}")
+
+
+        # 心拍変動 (HRV) (期間)
+        start_date_hrv, end_date_hrv = client._trailing_range(target_date, days=7)
+        hrv_range_data = results["hrv_range"]
+        if hrv_range_data and hrv_range_data.get("hrv"):
+            out(f"\n心拍変動 (HRV) ({start_date_hrv} - {end_date_hrv}):")
+            for record in hrv_range_data["hrv"]:
+                if record.get("value") and record["value"].get("dailyRmssd") is not None:
+                    out(f"  日付: {record.get('dateTime')}, RMSSD: {record['value']['dailyRmssd']}, "
+                        + f"低周波 (LF): {record['value'].get('deepRmssd')}")
+                else:
+                    out(f"  日付: {record.get('dateTime')}, HRVデータ詳細なし")
+
+
+        # 心拍数時系列 (Intraday) - 1分間の詳細レベルで取得
+        hr_intraday_data = results["heart_rate_intraday"]
+        if hr_intraday_data and hr_intraday_data.get("activities-heart-intraday"):
+            out(f"\n日中心拍数 ({target_date}, 1分間隔):")
+            out(f"  データセット数: {len(hr_intraday_data['activities-heart-intraday'].get('dataset', []))}")
+            # 詳細なデータ表示は長くなるため、一部のみ、または集計値の表示を推奨
+            for entry in hr_intraday_data["activities-heart-intraday"].get("dataset", [])[:5]: # 最初の5件
+                out(f"    時刻: {entry.get('time')}, 心拍数: {entry.get('value')}")
+
+
+        # 心拍数時系列 (Date Range) - 日毎のサマリー
+        # 例: target_date から過去7日間のデータを取得 (end_date が target_date となる)
+        base_date_hr_range, end_date_hr_range = client._trailing_range(target_date, days=7)
+        hr_date_range_data = results["heart_rate_range"]
+        if hr_date_range_data and hr_date_range_data.get("activities-heart"):
+            out(f"\n心拍数サマリー ({base_date_hr_range} - {end_date_hr_range}):")
+            for day_summary in hr_date_range_data["activities-heart"]:
+                out(f"  日付: {day_summary.get('dateTime')}")
+                if day_summary.get("value") and day_summary["value"].get("heartRateZones"):
+                    resting_hr = day_summary["value"].get('restingHeartRate', 'N/A')
+                    out(f"    安静時心拍数: {resting_hr}")
+                    out("    心拍ゾーン:")
+                    for zone in day_summary["value"]["heartRateZones"]:
+                        out(f"      {zone.get('name')}: "
+                            + f"閾値 {zone.get('min')}-{zone.get('max')} bpm, "
+                            + f"滞在時間 {zone.get('minutes')} 分, "
+                            + f"消費カロリー {zone.get('caloriesOut')}")
+                else:
+                    out("    心拍数データ詳細なし")
+
+        out("\n==============================================")
+        out("処理完了")
+
+
+        target_date_summary = client.ACTIVITY_SUMMARY_DATE
+        out(f"\n--- {target_date_summary}のアクティビティサマリー ---")
+        daily_summary = results["activity_summary"]
+
+        if daily_summary and daily_summary.get("summary"):
+            summary = daily_summary["summary"]
+            steps = summary.get("steps", "N/A")
+            calories_out = summary.get("caloriesOut", "N/A")
+
+            total_distance = "N/A"
+            if summary.get("distances"):
+                for dist_entry in summary["distances"]:
+                    if dist_entry.get("activity") == "total": # "total" が総距離を示す
+                        total_distance = dist_entry.get("distance", "N/A")
+                        break
+                    
+            out(f"  歩数: {steps} 歩")
+            out(f"  総消費カロリー: {calories_out} kcal")
+            out(f"  総移動距離: {total_distance} km")
+        elif daily_summary is None: # APIエラーまたはその他の予期せぬエラー
+             out(f"  {target_date_summary}のアクティビティサマリーの取得中にエラーが発生しました。詳細はログを確認してください。")
+        else: # データが存在しない場合 (例: 204 No Content)
+            out(f"  {target_date_summary}のアクティビティサマリーデータはありませんでした。")
+
+        # --- B. 過去7日間の日毎の歩数と集計 ---
+        out(f"\n--- 過去7日間の日毎の歩数 (今日基準) ---")
+        # 'today' を基準日とし、'7d' (過去7日間) のデータを取得
+        steps_7d_data = results["steps_7d"]
+
+        if steps_7d_data and steps_7d_data.get("activities-steps"):
+            steps_7d = DailySeries.from_response(steps_7d_data)
+            if len(steps_7d):
+                out("  日毎の歩数:")
+                for date, value in zip(steps_7d.dates, steps_7d.values):
+                    out(f"    {format_date(date)}: {value:.0f} 歩")
+
+                steps_summary = steps_7d.summary()
+                out(f"  過去7日間の合計歩数: {steps_summary['total']:.0f} 歩")
+                out(f"  過去7日間の平均歩数: {steps_summary['mean'] or 0:.0f} 歩/日")
+            else:
+                out("  過去7日間の歩数データが空でした。")
+        elif steps_7d_data is None:
+            out(f"  過去7日間の歩数データの取得中にエラーが発生しました。詳細はログを確認してください。")
+        else:
+            out("  過去7日間の歩数データは取得できませんでした（データなしまたは空の応答）。")
+
+
+        # --- C. 特定の期間 (例: 先週月曜日から日曜日) の総消費カロリー ---
+        start_date_calories, end_date_calories = client._last_week_range()
+
+        out(f"\n--- {start_date_calories} から {end_date_calories} の消費カロリー ---")
+        calories_last_week = results["calories_last_week"]
+
+        if calories_last_week and calories_last_week.get("activities-calories"):
+            calories = DailySeries.from_response(calories_last_week)
+            if len(calories):
+                out("  日毎の消費カロリー:")
+                for date, value in zip(calories.dates, calories.values):
+                    out(f"    {format_date(date)}: {value:.0f} kcal")
+
+                calories_summary = calories.summary()
+                out(f"  期間中の合計消費カロリー: {calories_summary['total']:.0f} kcal")
+                out(f"  期間中の平均消費カロリー: {calories_summary['mean'] or 0:.0f} kcal/日")
+            else:
+                out(f"  {start_date_calories} から {end_date_calories} のカロリーデータが空でした。")
+        elif calories_last_week is None:
+            out(f"  {start_date_calories} から {end_date_calories} のカロリーデータの取得中にエラーが発生しました。")
+        else:
+            out(f"  {start_date_calories} から {end_date_calories} のカロリーデータは取得できませんでした。")
+
+
+        # --- D. 過去1ヶ月間の日毎の移動距離と集計 ---
+        out(f"\n--- 過去1ヶ月間の日毎の移動距離 (今日基準, '1m'ピリオド使用) ---")
+        distance_1m_data = results["distance_1m"]
+
+        if distance_1m_data and distance_1m_data.get("activities-distance"):
+            distance_1m = DailySeries.from_response(distance_1m_data)
+            if len(distance_1m):
+                out("  日毎の移動距離:")
+                for date, value in zip(distance_1m.dates, distance_1m.values):
+                    if np.isnan(value):
+                        out(f"    {format_date(date)}: データ形式エラー")
+                    else:
+                        out(f"    {format_date(date)}: {value:.2f} km")
+
+                # 実際に移動があった日 (0 km でない日) のみを集計対象とする
+                distance_summary = distance_1m.summary()
+                if distance_summary["nonzero_days"] > 0:
+                    out(f"\n  過去1ヶ月間の合計移動距離 (記録日ベース): {distance_summary['total']:.2f} km")
+                    out(f"  過去1ヶ月間の平均移動距離 (記録日ベース): {distance_summary['nonzero_mean']:.2f} km/日")
+                    out(f"  (記録があった日数: {distance_summary['nonzero_days']}日 / 全{len(distance_1m)}日中)")
+                elif len(distance_1m): # データはあるが全て0kmだった場合
+                    out(f"\n  過去1ヶ月間の合計移動距離: 0.00 km")
+                else: # entries が空のケース (通常は上の条件で捕捉されるはず)
+                    out("  過去1ヶ月間の移動距離データが空でした。")
+
+            else: # "activities-distance" キーはあるが、その値 (リスト) が空の場合
+                out("  過去1ヶ月間の移動距離データが空でした。")
+        elif distance_1m_data is None:
+            out(f"  過去1ヶ月間の移動距離データの取得中にエラーが発生しました。")
+        else:
+            out("  過去1ヶ月間の移動距離データは取得できませんでした（データなしまたは空の応答）。")
+
+        stats = api_client.stats
+        out(f"\nAPIリクエスト数: {stats['requests']} (再試行: {stats['retries']}, 再試行上限到達: {stats['retries_exhausted']}, "
+            + f"相乗り: {stats['coalesced']}, 範囲から応答: {stats['derived']})")
+        out(f"エンドポイント別のレート制限消費: {api_client.cost_by_endpoint}")
+        if client.cache is not None:
+            cache_stats = client.cache.get_stats()
+            out(f"キャッシュ: ヒット {cache_stats['hits']}, ミス {cache_stats['misses']}, エントリ数 {cache_stats['entries']}")
+        transport_stats = get_transport_manager().stats
+        out(f"コネクション: 新規 {transport_stats.connections_opened}, 再利用 {transport_stats.reused_requests} / {transport_stats.requests} リクエスト")
+        return "\n".join(lines) + "\n"
+
+
+def _summarize_stages(stages: List[Dict[str, Any]]) -> Dict[str, tuple]:
+    """睡眠ステージの記録を {種類: (回数, 合計秒数)} にまとめる (最初に現れた順)"""
+    summary: Dict[str, List[int]] = {}
+    for log in stages:
+        entry = summary.setdefault(log.get("level", "unknown"), [0, 0])
+        entry[0] += 1
+        entry[1] += log.get("seconds") or 0
+    return {level: (count, seconds) for level, (count, seconds) in summary.items()}
@@ -1,15 +1,12 @@
-from utils.logger import logger
-from typing import Dict, Any, List, Optional # Optional を追加
-from errors import APIError # errors.py があると仮定
-from utils.api import ApiClient # utils/api.py があると仮定
+import datetime
+from typing import Dict, Any, Optional
 
-class Activity:
-    def __init__(self, client: ApiClient):
-        if not isinstance(client, ApiClient):
-            raise TypeError("client must be an instance of ApiClient")
-        self.client = client
-        self.API_VERSION = "1"  # Activity APIのバージョン
+from services.base import BaseService
+from utils.date_range import fetch_endpoints, parse_datetime, split_intraday_windows
+from utils.timeseries import IntradaySeries, DETAIL_LEVEL_SECONDS
 
+
+class Activity(BaseService):
     async def get_summary_by_date(self, date: str) -> Optional[Dict[str, Any]]:
         """
         特定の日付のアクティビティサマリーを取得します。
@@ -18,22 +15,7 @@ class Activity:
         :param date: 取得する日付 (YYYY-MM-DD形式)
         :return: アクティビティサマリーデータ、またはエラー時はNone
         """
-        endpoint = f"/{self.API_VERSION}/user/-/activities/date/{date}.json"
-        try:
-            activity_data = await self.client.get(endpoint)
-            if activity_data:
-                logger.info(f"Successfully fetched activity summary for {date}.")
-            else:
-                # 204 No Content や空のレスポンスの場合
-                logger.info(f"No activity summary content returned for {date} (e.g., 204 No Content or empty response).")
-            return activity_data
-        except APIError as e:
-            logger.error(f"An API error occurred while fetching activity summary for {date}: {e}")
-            return None
-        except Exception as e:
-            # APIError以外の予期せぬエラーをキャッチ
-            logger.exception(f"An unexpected non-API error occurred while fetching activity summary for {date}: {e}")
-            return None
+        return await self._get("activity_summary", "activity summary", f"for {date}", date=date)
 
     async def get_time_series(
         self, resource_path: str, base_date: str, period: str
@@ -47,62 +29,72 @@ class Activity:
         :param period: 期間 ('1d', '7d', '30d', '1w', '1m', '3m', '6m', '1y')
         :return: 時系列データ、またはエラー時はNone
         """
-        # 有効なリソースパス (Fitbit APIドキュメント参照)
-        valid_resources = [
-            "calories", "steps", "distance", "floors", "elevation",
-            "minutesSedentary", "minutesLightlyActive",
-            "minutesFairlyActive", "minutesVeryActive", "activityCalories"
-        ]
-        if resource_path not in valid_resources:
-            logger.error(f"Invalid resource_path for time series: {resource_path}. Supported: {valid_resources}")
-            return None
-
-        endpoint = f"/{self.API_VERSION}/user/-/activities/{resource_path}/date/{base_date}/{period}.json"
-        try:
-            series_data = await self.client.get(endpoint)
-            if series_data:
-                logger.info(f"Successfully fetched {resource_path} time series for {base_date}/{period}.")
-            else:
-                logger.info(f"No {resource_path} time series content returned for {base_date}/{period}.")
-            return series_data
-        except APIError as e:
-            logger.error(f"An API error occurred while fetching {resource_path} time series for {base_date}/{period}: {e}")
-            return None
-        except Exception as e:
-            logger.exception(f"An unexpected non-API error occurred while fetching {resource_path} time series for {base_date}/{period}: {e}")
-            return None
+        return await self._get(
+            "activity_time_series", f"{resource_path} time series", f"for {base_date}/{period}",
+            resource=resource_path, date=base_date, period=period
+        )
 
     async def get_time_series_by_date_range(
         self, resource_path: str, start_date: str, end_date: str
     ) -> Optional[Dict[str, Any]]:
         """
         特定のリソースの時系列データを日付範囲で取得します。
+        APIの上限 (1095日) を超える期間は分割して取得します。
 
         :param resource_path: 取得するリソース ('steps', 'calories', 'distance'など)
         :param start_date: 開始日 (YYYY-MM-DD形式)
         :param end_date: 終了日 (YYYY-MM-DD形式)
         :return: 時系列データ、またはエラー時はNone
         """
-        valid_resources = [
-            "calories", "steps", "distance", "floors", "elevation",
-            "minutesSedentary", "minutesLightlyActive",
-            "minutesFairlyActive", "minutesVeryActive", "activityCalories"
-        ]
-        if resource_path not in valid_resources:
-            logger.error(f"Invalid resource_path for time series by date range: {resource_path}. Supported: {valid_resources}")
-            return None
+        return await self._get_range(
+            "activity_time_series_by_date_range", f"{resource_path} time series", start_date, end_date,
+            resource=resource_path
+        )
 
-        endpoint = f"/{self.API_VERSION}/user/-/activities/{resource_path}/date/{start_date}/{end_date}.json"
-        try:
-            series_data = await self.client.get(endpoint)
-            if series_data:
-                logger.info(f"Successfully fetched {resource_path} time series for range {start_date} to {end_date}.")
-            else:
-                logger.info(f"No {resource_path} time series content returned for range {start_date} to {end_date}.")
-            return series_data
-        except APIError as e:
-            logger.error(f"An API error occurred while fetching {resource_path} time series for range {start_date} to {end_date}: {e}")
-            return None
-        except Exception as e:
-            logger.exception(f"An unexpected non-API error occurred while fetching {resource_path} time series for range {start_date} to {end_date}: {e}")
+    async def get_intraday_series(
+        self,
+        resource_path: str,
+        start: str | datetime.datetime,
+        end: str | datetime.datetime,
+        detail_level: str = "1min"
+    ) -> Optional[IntradaySeries]:
+        """
+        特定のリソースの日中データ (intraday) を任意の日時範囲で取得します。
+        APIは1リクエストで1日分までのため、日ごとの区間に分割して並行取得し、1つの系列に連結します。
+
+        :param resource_path: 取得するリソース ('steps', 'calories', 'distance', 'floors', 'elevation')
+        :param start: 開始日時 ("YYYY-MM-DDTHH:MM" 形式または datetime。日付のみの場合は 00:00)
+        :param end: 終了日時 (分単位で含む。日付のみの場合は 23:59)
+        :param detail_level: '1min', '5min', '15min'
+        :return: start の日を起点とする IntradaySeries、またはエラー時はNone
+        """
+        full_day = self.endpoint("activity_intraday")
+        partial_day = self.endpoint("activity_intraday_by_time")
+        if self._invalid(full_day, resource_path, detail_level):
             return None
+
+        async def fetch() -> IntradaySeries:
+            windows = split_intraday_windows(parse_datetime(start), parse_datetime(end, end_of_day=True))
+            endpoints = []
+            for date, start_time, end_time in windows:
+                if start_time == "00:00" and end_time == "23:59":
+                    # 丸1日分は時刻指定の無い形式にする (他の処理とキャッシュを共有できる)
+                    endpoints.append(full_day.path_for(resource=resource_path, date=date, detail_level=detail_level))
+                else:
+                    endpoints.append(partial_day.path_for(
+                        resource=resource_path, date=date, detail_level=detail_level, start_time=start_time, end_time=end_time
+                    ))
+            responses = await fetch_endpoints(self.client, endpoints)
+
+            key = f"activities-{resource_path}-intraday"
+            return IntradaySeries.concat([
+                IntradaySeries.from_dataset(
+                    date,
+                    (response or {}).get(key, {}).get("dataset", []),
+                    interval=DETAIL_LEVEL_SECONDS[detail_level],
+                    typecode="f" if resource_path in ("calories", "distance", "elevation") else "H"
+                )
+                for (date, _, _), response in zip(windows, responses)
+            ])
+
+        return await self._call(f"intraday {resource_path} series", f"for {start} to {end}, detail: {detail_level}", fetch())
@@ -0,0 +1,100 @@
+from typing import Any, Awaitable, Dict, Optional
+
+from errors import APIError
+from utils.api import ApiClient
+from utils.date_range import fetch_date_range
+from utils.logger import get_logger
+from services.endpoints import ENDPOINTS, Endpoint
+
+logger = get_logger(__name__)
+
+
+class BaseService:
+    """
+    各サービスの共通処理。エンドポイントは services.endpoints の定義から組み立てる。
+    API エラーや予期せぬエラーはログに記録して None を返す。
+
+    :param raise_errors: True の場合、エラーはログに記録した上で送出する。None はデータが無い (204 や空のレスポンス) 場合だけになるため、
+        差分同期などエラーと空の結果を区別する必要がある呼び出し元で使う
+    """
+    def __init__(self, client: ApiClient, raise_errors: bool = False):
+        if not isinstance(client, ApiClient):
+            raise TypeError("client must be an instance of ApiClient")
+        self.client = client
+        self.raise_errors = raise_errors
+
+    @staticmethod
+    def endpoint(name: str) -> Endpoint:
+        return ENDPOINTS[name]
+
+    async def _call(self, subject: str, log_suffix: str, awaitable: Awaitable[Any]) -> Any:
+        """
+        awaitable を実行し、結果をログに記録して返す。エラーの場合は None を返す (raise_errors の場合は送出する)。
+        :param subject: ログに使う取得対象 (例: "HRV data")
+        :param log_suffix: ログに使う対象範囲 (例: "for 2025-05-31")
+        """
+        try:
+            data = await awaitable
+            if data:
+                logger.info("Successfully fetched %s %s.", subject, log_suffix)
+            else:
+                # 204 No Content や空のレスポンスの場合
+                logger.info("No %s content returned %s.", subject, log_suffix)
+            return data
+        except APIError as e:
+            logger.error("An API error occurred while fetching %s %s: %s", subject, log_suffix, e)
+            if self.raise_errors:
+                raise
+            return None
+        except Exception as e:
+            logger.exception("An unexpected non-API error occurred while fetching %s %s: %s", subject, log_suffix, e)
+            if self.raise_errors:
+                raise
+            return None
+
+    def _invalid(self, endpoint: Endpoint, resource: Optional[str] = None, detail_level: Optional[str] = None) -> bool:
+        """パラメーターがエンドポイントで使えない場合はログに記録して True を返す (raise_errors の場合は ValueError を送出する)。"""
+        error = endpoint.check(resource=resource, detail_level=detail_level)
+        if error:
+            logger.error(error)
+            if self.raise_errors:
+                raise ValueError(error)
+            return True
+        return False
+
+    async def _get(self, name: str, subject: str, log_suffix: str, **params: Any) -> Any:
+        """単一のリクエストで取得する。"""
+        return await self._request("GET", name, subject, log_suffix, **params)
+
+    async def _request(
+        self,
+        method: str,
+        name: str,
+        subject: str,
+        log_suffix: str,
+        custom_headers: Optional[Dict[str, str]] = None,
+        **params: Any
+    ) -> Any:
+        """単一のリクエストを発行する。"""
+        endpoint = self.endpoint(name)
+        if self._invalid(endpoint, params.get("resource"), params.get("detail_level")):
+            return None
+        # path_for の呼び出しもエラーハンドリングの対象にする
+        async def send() -> Any:
+            return await self.client.request(method, endpoint.path_for(**params), custom_headers=custom_headers)
+        return await self._call(subject, log_suffix, send())
+
+    async def _get_range(self, name: str, subject: str, start_date: str, end_date: str, **params: Any) -> Any:
+        """日付範囲で取得する。エンドポイントの最大日数を超える期間は分割して並行取得する。"""
+        endpoint = self.endpoint(name)
+        if self._invalid(endpoint, params.get("resource"), params.get("detail_level")):
+            return None
+        return await self._call(
+            subject,
+            f"for range {start_date} to {end_date}",
+            fetch_date_range(
+                self.client,
+                lambda start, end: endpoint.path_for(start=start, end=end, **params),
+                start_date, end_date, endpoint.max_range_days
+            )
+        )
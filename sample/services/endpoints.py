@@ -0,0 +1,167 @@
+import functools
+import re
+from typing import Any, Dict, Optional, Sequence
+
+
+# パスのプレースホルダーごとの書式 (エンドポイントの照合に使う)
+_PLACEHOLDER_PATTERNS = {
+    "date": r"\d{4}-\d{2}-\d{2}|today",
+    "start": r"\d{4}-\d{2}-\d{2}|today",
+    "end": r"\d{4}-\d{2}-\d{2}|today",
+    "period": r"\d+[dwmy]",
+    "detail_level": r"\d+(?:sec|min)",
+    "start_time": r"\d{2}:\d{2}",
+    "end_time": r"\d{2}:\d{2}",
+}
+_DEFAULT_PLACEHOLDER_PATTERN = r"[^/]+"
+
+# アクティビティの時系列で取得できるリソース
+ACTIVITY_TIME_SERIES_RESOURCES = [
+    "calories", "steps", "distance", "floors", "elevation",
+    "minutesSedentary", "minutesLightlyActive",
+    "minutesFairlyActive", "minutesVeryActive", "activityCalories"
+]
+# 日中データ (intraday) を取得できるアクティビティのリソースと詳細レベル
+ACTIVITY_INTRADAY_RESOURCES = ["calories", "steps", "distance", "floors", "elevation"]
+ACTIVITY_INTRADAY_DETAIL_LEVELS = ["1min", "5min", "15min"]
+HEART_RATE_INTRADAY_DETAIL_LEVELS = ["1sec", "1min", "5min", "15min"]
+# Subscriptions API で購読できるコレクション
+SUBSCRIPTION_COLLECTIONS = ["activities", "body", "foods", "sleep", "userRevokedAccess"]
+
+
+class Endpoint:
+    """
+    Fitbit Web API の1つのエンドポイントの定義。
+
+    :param path: ユーザー以下のパスのテンプレート (例: "hrv/date/{start}/{end}.json")
+    :param max_range_days: 日付範囲エンドポイントの1リクエストあたりの最大日数
+    :param detail_levels: 日中データの詳細レベル
+    :param resources: {resource} に指定できる値
+    :param cacheable: レスポンスをキャッシュしてよいか
+    :param settle_days: データが確定するまでの日数 (これより古い日付のレスポンスは期限なしでキャッシュする)。None はキャッシュの既定値
+    :param cost: 1リクエストが消費するレート制限の回数
+    """
+    def __init__(
+        self,
+        name: str,
+        path: str,
+        version: str = "1",
+        max_range_days: Optional[int] = None,
+        detail_levels: Sequence[str] = (),
+        resources: Optional[Sequence[str]] = None,
+        cacheable: bool = True,
+        settle_days: Optional[int] = None,
+        cost: int = 1
+    ):
+        self.name = name
+        self.path = path
+        self.version = version
+        self.max_range_days = max_range_days
+        self.detail_levels = list(detail_levels)
+        self.resources = list(resources) if resources is not None else None
+        self.cacheable = cacheable
+        self.settle_days = settle_days
+        self.cost = cost
+
+    @functools.cached_property
+    def pattern(self) -> re.Pattern:
+        # 起動時に全エンドポイントの正規表現をコンパイルしないよう、最初に使うときにコンパイルする
+        return re.compile(
+            rf"^/{re.escape(self.version)}/user/(?P<user_id>[^/]+)/"
+            + re.sub(
+                r"\\\{(\w+)\\\}",
+                lambda m: f"(?P<{m.group(1)}>{_PLACEHOLDER_PATTERNS.get(m.group(1), _DEFAULT_PLACEHOLDER_PATTERN)})",
+                re.escape(self.path)
+            )
+            + "$"
+        )
+
+    def path_for(self, user_id: str = "-", **params: Any) -> str:
+        return f"/{self.version}/user/{user_id}/{self.path.format(**params)}"
+
+    def match(self, path: str) -> Optional[Dict[str, str]]:
+        """path がこのエンドポイントであれば、パスのパラメーター (user_id を含む) を返す。"""
+        match = self.pattern.match(path)
+        return match.groupdict() if match else None
+
+    def check(self, resource: Optional[str] = None, detail_level: Optional[str] = None) -> Optional[str]:
+        """パラメーターがこのエンドポイントで使えるか確認し、使えない場合はエラーメッセージを返す。"""
+        if resource is not None and self.resources is not None and resource not in self.resources:
+            return f"Invalid resource_path for {self.name}: {resource}. Supported: {self.resources}"
+        if detail_level is not None and detail_level not in self.detail_levels:
+            return f"Invalid detail_level for {self.name}: {detail_level}. Supported: {self.detail_levels}"
+        return None
+
+    def __repr__(self) -> str:
+        return f"Endpoint({self.name!r}, /{self.version}/user/-/{self.path})"
+
+
+# より限定的なパス (activities/heart/...) を汎用的なパス (activities/{resource}/...) より前に置くこと
+_ENDPOINT_LIST = [
+    # --- Sleep ---
+    Endpoint("sleep_by_date", "sleep/date/{date}.json", version="1.2", settle_days=3),
+    Endpoint("sleep_by_date_range", "sleep/date/{start}/{end}.json", version="1.2", max_range_days=100, settle_days=3),
+    # beforeDate / afterDate と pagination.next でページを辿る一覧。クエリで結果が変わり、新しい記録も増えるためキャッシュしない
+    Endpoint("sleep_list", "sleep/list.json", version="1.2", cacheable=False),
+
+    # --- Heart Rate ---
+    Endpoint("hrv_by_date", "hrv/date/{date}.json", settle_days=2),
+    Endpoint("hrv_by_date_range", "hrv/date/{start}/{end}.json", max_range_days=30, settle_days=2),
+    Endpoint(
+        "heart_rate_intraday", "activities/heart/date/{date}/1d/{detail_level}.json",
+        max_range_days=1, detail_levels=HEART_RATE_INTRADAY_DETAIL_LEVELS, settle_days=2
+    ),
+    Endpoint(
+        "heart_rate_intraday_by_time", "activities/heart/date/{date}/1d/{detail_level}/time/{start_time}/{end_time}.json",
+        max_range_days=1, detail_levels=HEART_RATE_INTRADAY_DETAIL_LEVELS, settle_days=2
+    ),
+    Endpoint("heart_rate_by_date_range", "activities/heart/date/{start}/{end}.json", max_range_days=365, settle_days=2),
+
+    # --- SpO2 ---
+    Endpoint("spo2_by_date", "spo2/date/{date}.json", settle_days=2),
+    Endpoint("spo2_by_date_range", "spo2/date/{start}/{end}.json", max_range_days=30, settle_days=2),
+
+    # --- Temperature ---
+    Endpoint("temp_skin_by_date", "temp/skin/date/{date}.json", settle_days=2),
+    Endpoint("temp_skin_by_date_range", "temp/skin/date/{start}/{end}.json", max_range_days=30, settle_days=2),
+    Endpoint("temp_core_by_date", "temp/core/date/{date}.json", settle_days=2),
+
+    # --- Activity ---
+    Endpoint("activity_summary", "activities/date/{date}.json", settle_days=3),
+    Endpoint(
+        "activity_intraday", "activities/{resource}/date/{date}/1d/{detail_level}.json",
+        max_range_days=1, detail_levels=ACTIVITY_INTRADAY_DETAIL_LEVELS, resources=ACTIVITY_INTRADAY_RESOURCES, settle_days=3
+    ),
+    Endpoint(
+        "activity_intraday_by_time", "activities/{resource}/date/{date}/1d/{detail_level}/time/{start_time}/{end_time}.json",
+        max_range_days=1, detail_levels=ACTIVITY_INTRADAY_DETAIL_LEVELS, resources=ACTIVITY_INTRADAY_RESOURCES, settle_days=3
+    ),
+    Endpoint(
+        "activity_time_series", "activities/{resource}/date/{date}/{period}.json",
+        resources=ACTIVITY_TIME_SERIES_RESOURCES, settle_days=3
+    ),
+    Endpoint(
+        "activity_time_series_by_date_range", "activities/{resource}/date/{start}/{end}.json",
+        max_range_days=1095, resources=ACTIVITY_TIME_SERIES_RESOURCES, settle_days=3
+    ),
+
+    # --- Subscriptions ---
+    Endpoint("subscriptions", "apiSubscriptions.json", cacheable=False),
+    Endpoint("subscription", "apiSubscriptions/{subscription_id}.json", cacheable=False),
+    Endpoint("collection_subscriptions", "{resource}/apiSubscriptions.json", resources=SUBSCRIPTION_COLLECTIONS, cacheable=False),
+    Endpoint(
+        "collection_subscription", "{resource}/apiSubscriptions/{subscription_id}.json",
+        resources=SUBSCRIPTION_COLLECTIONS, cacheable=False
+    ),
+]
+
+ENDPOINTS: Dict[str, Endpoint] = {endpoint.name: endpoint for endpoint in _ENDPOINT_LIST}
+
+
+@functools.lru_cache(maxsize=4096)
+def find_endpoint(path: str) -> Optional[Endpoint]:
+    """リクエストのパス (例: "/1/user/-/hrv/date/2025-05-31.json") に対応するエンドポイントを返す。"""
+    for endpoint in _ENDPOINT_LIST:
+        if endpoint.pattern.match(path):
+            return endpoint
+    return None
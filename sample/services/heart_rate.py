@@ -1,51 +1,44 @@
-from utils.logger import logger
-from typing import Dict, Any, Optional
-from errors import APIError # errors.py が存在すると仮定
-from utils.api import ApiClient # utils/api.py が存在すると仮定
+from typing import Dict, Any, AsyncIterator, List, Optional
 
-class HeartRate:
-    def __init__(self, client: ApiClient):
-        if not isinstance(client, ApiClient):
-            raise TypeError("client must be an instance of ApiClient")
-        self.client = client
-        self.API_VERSION = "1"  # Heart Rate APIs version is 1
+from errors import APIError
+from services.base import BaseService
+from utils.json_stream import iter_batches
+from utils.logger import get_logger
+from utils.timeseries import IntradaySeries, DETAIL_LEVEL_SECONDS
 
+logger = get_logger(__name__)
+
+# 日中心拍数のレスポンス中で、時系列の配列を指すキー
+INTRADAY_DATASET_PATH = ("activities-heart-intraday", "dataset")
+
+
+class HeartRate(BaseService):
     # --- Heart Rate Variability (HRV) ---
     async def get_hrv_by_date(self, date: str) -> Dict[str, Any] | None:
         """指定された日付の心拍変動(HRV)データを取得します。"""
-        endpoint = f"/{self.API_VERSION}/user/-/hrv/date/{date}.json"
-        try:
-            hrv_data = await self.client.get(endpoint)
-            if hrv_data:
-                logger.info(f"Successfully fetched HRV data for {date}.")
-            else:
-                logger.info(f"No HRV data content returned for {date}.")
-            return hrv_data
-        except APIError as e:
-            logger.error(f"An API error occurred while fetching HRV data for {date}: {e}")
-            return None
-        except Exception as e:
-            logger.exception(f"An unexpected non-API error occurred while fetching HRV data for {date}: {e}")
-            return None
+        return await self._get("hrv_by_date", "HRV data", f"for {date}", date=date)
 
     async def get_hrv_by_date_range(self, start_date: str, end_date: str) -> Dict[str, Any] | None:
-        """指定された期間の心拍変動(HRV)データを取得します。"""
-        endpoint = f"/{self.API_VERSION}/user/-/hrv/date/{start_date}/{end_date}.json"
-        try:
-            hrv_data = await self.client.get(endpoint)
-            if hrv_data:
-                logger.info(f"Successfully fetched HRV data for range {start_date} to {end_date}.")
-            else:
-                logger.info(f"No HRV data content returned for range {start_date} to {end_date}.")
-            return hrv_data
-        except APIError as e:
-            logger.error(f"An API error occurred while fetching HRV data for range {start_date} to {end_date}: {e}")
-            return None
-        except Exception as e:
-            logger.exception(f"An unexpected non-API error occurred while fetching HRV data for range {start_date} to {end_date}: {e}")
-            return None
+        """指定された期間の心拍変動(HRV)データを取得します。30日を超える期間は分割して取得します。"""
+        return await self._get_range("hrv_by_date_range", "HRV data", start_date, end_date)
 
     # --- Heart Rate Time Series ---
+    @staticmethod
+    def _intraday_request(
+        date: str,
+        detail_level: str,
+        start_time: Optional[str],
+        end_time: Optional[str]
+    ) -> tuple[str, Dict[str, Any], str]:
+        """(エンドポイント名, パスのパラメーター, ログ用の説明) を返す"""
+        if start_time and end_time:
+            return (
+                "heart_rate_intraday_by_time",
+                {"date": date, "detail_level": detail_level, "start_time": start_time, "end_time": end_time},
+                f"for {date}, detail: {detail_level}, time: {start_time}-{end_time}"
+            )
+        return "heart_rate_intraday", {"date": date, "detail_level": detail_level}, f"for {date}, detail: {detail_level}"
+
     async def get_heart_rate_intraday_by_date(
         self,
         date: str,
@@ -54,24 +47,68 @@ class HeartRate:
         end_time: Optional[str] = None # HH:mm
     ) -> Dict[str, Any] | None:
         """指定された日付の日中心拍数時系列データを取得します。"""
-        if start_time and end_time:
-            endpoint = f"/{self.API_VERSION}/user/-/activities/heart/date/{date}/1d/{detail_level}/time/{start_time}/{end_time}.json"
-            log_suffix = f"for {date}, detail: {detail_level}, time: {start_time}-{end_time}"
-        else:
-            endpoint = f"/{self.API_VERSION}/user/-/activities/heart/date/{date}/1d/{detail_level}.json"
-            log_suffix = f"for {date}, detail: {detail_level}"
+        name, params, log_suffix = self._intraday_request(date, detail_level, start_time, end_time)
+        return await self._get(name, "intraday heart rate data", log_suffix, **params)
+
+    async def iter_heart_rate_intraday(
+        self,
+        date: str,
+        detail_level: str = "1sec", # "1sec" or "1min"
+        start_time: Optional[str] = None, # HH:mm
+        end_time: Optional[str] = None, # HH:mm
+        batch_size: Optional[int] = None
+    ) -> AsyncIterator[Dict[str, Any] | List[Dict[str, Any]]]:
+        """
+        指定された日付の日中心拍数時系列 (activities-heart-intraday.dataset) を受信しながら1点ずつ返します。
+        batch_size を指定すると batch_size 点ずつのリストで返します。
+        1秒単位 (最大86,400点) でもレスポンス全体を保持しないため、メモリ使用量が一定に保たれます。
+
+            async for batch in heart_rate.iter_heart_rate_intraday("2025-05-31", batch_size=3600):
+                ...
+
+        途中でデータが欠けたまま終了しないよう、エラーはログに記録した上で送出します。
+        """
+        name, params, log_suffix = self._intraday_request(date, detail_level, start_time, end_time)
+        endpoint = self.endpoint(name)
+        error = endpoint.check(detail_level=detail_level)
+        if error:
+            raise ValueError(error)
+        points = self.client.stream_json_array(endpoint.path_for(**params), INTRADAY_DATASET_PATH)
+        if batch_size:
+            points = iter_batches(points, batch_size)
+        count = 0
         try:
-            hr_data = await self.client.get(endpoint)
-            if hr_data:
-                logger.info(f"Successfully fetched intraday heart rate data {log_suffix}.")
-            else:
-                logger.info(f"No intraday heart rate data content returned {log_suffix}.")
-            return hr_data
+            async for item in points:
+                count += len(item) if batch_size else 1
+                yield item
         except APIError as e:
-            logger.error(f"An API error occurred while fetching intraday heart rate data {log_suffix}: {e}")
+            logger.error("An API error occurred while streaming intraday heart rate data %s: %s", log_suffix, e)
+            raise
+        logger.info("Streamed %s intraday heart rate points %s.", count, log_suffix)
+
+    async def get_heart_rate_intraday_series(
+        self,
+        date: str,
+        detail_level: str = "1sec", # "1sec" or "1min"
+        start_time: Optional[str] = None, # HH:mm
+        end_time: Optional[str] = None # HH:mm
+    ) -> IntradaySeries | None:
+        """
+        指定された日付の日中心拍数時系列を IntradaySeries で取得します。
+        受信しながら型付き配列に詰めるため、dict のリストを経由しません。
+        """
+        log_suffix = f"for {date}, detail: {detail_level}"
+        try:
+            return await IntradaySeries.from_stream(
+                date,
+                self.iter_heart_rate_intraday(date, detail_level, start_time, end_time),
+                interval=DETAIL_LEVEL_SECONDS.get(detail_level)
+            )
+        except APIError:
+            # iter_heart_rate_intraday でログ出力済み
             return None
         except Exception as e:
-            logger.exception(f"An unexpected non-API error occurred while fetching intraday heart rate data {log_suffix}: {e}")
+            logger.exception("An unexpected non-API error occurred while building intraday heart rate series %s: %s", log_suffix, e)
             return None
 
     async def get_heart_rate_by_date_range(
@@ -81,20 +118,6 @@ class HeartRate:
     ) -> Dict[str, Any] | None:
         """
         指定された期間 (base_date から end_date まで) の日毎の心拍数サマリーデータを取得します。
-        期間は最大30日間です。
+        APIの上限 (1年) を超える期間は分割して取得します。
         """
-        endpoint = f"/{self.API_VERSION}/user/-/activities/heart/date/{base_date}/{end_date}.json"
-        log_suffix = f"for range {base_date} to {end_date}"
-        try:
-            hr_data = await self.client.get(endpoint)
-            if hr_data:
-                logger.info(f"Successfully fetched heart rate data {log_suffix}.")
-            else:
-                logger.info(f"No heart rate data content returned {log_suffix}.")
-            return hr_data
-        except APIError as e:
-            logger.error(f"An API error occurred while fetching heart rate data {log_suffix}: {e}")
-            return None
-        except Exception as e:
-            logger.exception(f"An unexpected non-API error occurred while fetching heart rate data {log_suffix}: {e}")
-            return None
+        return await self._get_range("heart_rate_by_date_range", "heart rate data", base_date, end_date)
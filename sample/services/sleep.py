@@ -1,31 +1,88 @@
-from utils.logger import logger
-from typing import Dict, Any
+import asyncio
+from typing import Dict, Any, AsyncIterator, Optional
+from urllib.parse import parse_qsl, urlsplit
+
 from errors import APIError
+from services.base import BaseService
+from utils.logger import get_logger
 
-from utils.api import ApiClient
-from utils.logger import logger
+logger = get_logger(__name__)
 
+# 睡眠ログ一覧の1ページあたりの最大件数
+SLEEP_LIST_MAX_LIMIT = 100
 
-class Sleep:
-    def __init__(self, client: ApiClient):
-        if not isinstance(client, ApiClient):
-            raise TypeError("client must be an instance of ApiClient")
-        self.client = client
-        self.API_VERSION = "1.2"
 
+class Sleep(BaseService):
     async def get_by_date(self, date: str) -> Dict[str, Any] | None:
-        endpoint = f"/{self.API_VERSION}/user/-/sleep/date/{date}.json"
+        return await self._get("sleep_by_date", "sleep data", f"for {date}", date=date)
+
+    async def get_by_date_range(self, start_date: str, end_date: str) -> Dict[str, Any] | None:
+        """指定された期間の睡眠ログを取得します。100日を超える期間は分割して取得します。"""
+        return await self._get_range("sleep_by_date_range", "sleep data", start_date, end_date)
+
+    async def iter_log_list(
+        self,
+        before_date: Optional[str] = None,
+        after_date: Optional[str] = None,
+        sort: Optional[str] = None,
+        limit: int = SLEEP_LIST_MAX_LIMIT
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        睡眠ログの一覧 (Get Sleep Log List) を1件ずつ返します。pagination.next を辿って最後のページまで取得します。
+        before_date と after_date はどちらか一方を指定します。API の制約により、sort は before_date なら "desc"、
+        after_date なら "asc" のみ指定でき (省略時もその値)、それ以外は ValueError を送出します。
+        1ページを返している間に次のページを先に取得するため、ページ間でリクエストの待ち時間が発生しません。
+
+            async for log in sleep.iter_log_list(after_date="2022-06-01"):
+                ...
 
+        途中で終了した場合は先に取得中のページをキャンセルします。
+        途中でデータが欠けたまま終了しないよう、エラーはログに記録した上で送出します。
+        """
+        if (before_date is None) == (after_date is None):
+            raise ValueError("Specify exactly one of before_date or after_date.")
+        expected_sort = "desc" if before_date else "asc"
+        if sort is not None and sort != expected_sort:
+            raise ValueError(f"sort must be '{expected_sort}' with {'before_date' if before_date else 'after_date'}: {sort}")
+        if not 1 <= limit <= SLEEP_LIST_MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {SLEEP_LIST_MAX_LIMIT}: {limit}")
+        params: Dict[str, Any] = {"sort": expected_sort, "offset": 0, "limit": limit}
+        if before_date:
+            params["beforeDate"] = before_date
+        else:
+            params["afterDate"] = after_date
+        log_suffix = f"before {before_date}" if before_date else f"after {after_date}"
+
+        path = self.endpoint("sleep_list").path_for()
+        page = asyncio.ensure_future(self.client.get(path, params=params))
+        pages = count = 0
         try:
-            sleep_data = await self.client.get(endpoint)
-            if sleep_data:
-                logger.info(f"Successfully fetched sleep data for {date}.")
-            else:
-                logger.info(f"No sleep data content returned for {date} (e.g., 204 No Content or empty response).")
-            return sleep_data
+            while page is not None:
+                data = await page
+                page = None
+                pages += 1
+                records = (data or {}).get("sleep") or []
+                next_url = ((data or {}).get("pagination") or {}).get("next")
+                if records and next_url:
+                    # 現在のページを返している間に次のページを取得する
+                    next_path, next_params = _split_next_url(next_url)
+                    page = asyncio.ensure_future(self.client.get(next_path, params=next_params))
+                for record in records:
+                    count += 1
+                    yield record
         except APIError as e:
-            logger.error(f"An API error occurred while fetching sleep data for {date}: {e}")
-            return None
-        except Exception as e:
-            logger.exception(f"An unexpected non-API error occurred while fetching sleep data for {date}: {e}")
-            return None
+            logger.error("An API error occurred while listing sleep logs %s: %s", log_suffix, e)
+            raise
+        finally:
+            if page is not None:
+                page.cancel()
+                if page.done() and not page.cancelled():
+                    # 失敗していた場合に "exception was never retrieved" とならないよう取り出しておく
+                    page.exception()
+        logger.info("Listed %s sleep logs %s in %s pages.", count, log_suffix, pages)
+
+
+def _split_next_url(url: str) -> tuple[str, Dict[str, str]]:
+    """pagination.next (絶対 URL) を ApiClient に渡すパスとクエリパラメーターに分ける"""
+    parts = urlsplit(url)
+    return parts.path, dict(parse_qsl(parts.query))
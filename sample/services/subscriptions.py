@@ -0,0 +1,62 @@
+from typing import Dict, Any, Optional
+
+from services.base import BaseService
+
+
+# 複数のサブスクライバー (通知先) を登録している場合に、通知先を指定するヘッダー
+HEADER_SUBSCRIBER_ID = "X-Fitbit-Subscriber-Id"
+
+
+class Subscriptions(BaseService):
+    """
+    Fitbit Subscriptions API。ユーザーのデータが更新されたときに、登録したサブスクライバー (webhook) へ通知させる。
+    collection を省略すると全てのコレクション (activities, body, foods, sleep, userRevokedAccess) を対象にする。
+    """
+    @staticmethod
+    def _headers(subscriber_id: Optional[str]) -> Optional[Dict[str, str]]:
+        return {HEADER_SUBSCRIBER_ID: subscriber_id} if subscriber_id else None
+
+    async def add(
+        self, subscription_id: str, collection: Optional[str] = None, subscriber_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        サブスクリプションを登録します。通知の subscriptionId には subscription_id が入ります。
+
+        :param subscription_id: アプリ側で決めるサブスクリプションのID (ユーザーIDなど)
+        :param collection: 購読するコレクション ('activities', 'sleep' など)。省略時は全て
+        :param subscriber_id: 通知先のサブスクライバーID。省略時は既定のサブスクライバー
+        :return: 登録されたサブスクリプション、またはエラー時はNone
+        """
+        if collection:
+            return await self._request(
+                "POST", "collection_subscription", "subscription", f"{subscription_id} for {collection}",
+                custom_headers=self._headers(subscriber_id), resource=collection, subscription_id=subscription_id
+            )
+        return await self._request(
+            "POST", "subscription", "subscription", f"{subscription_id} for all collections",
+            custom_headers=self._headers(subscriber_id), subscription_id=subscription_id
+        )
+
+    async def list(self, collection: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """登録済みのサブスクリプションの一覧 ({"apiSubscriptions": [...]}) を取得します。"""
+        if collection:
+            return await self._get("collection_subscriptions", "subscriptions", f"for {collection}", resource=collection)
+        return await self._get("subscriptions", "subscriptions", "for all collections")
+
+    async def delete(
+        self, subscription_id: str, collection: Optional[str] = None, subscriber_id: Optional[str] = None
+    ) -> bool:
+        """
+        サブスクリプションを削除します。
+
+        :return: 削除できた場合は True
+        """
+        async def delete() -> bool:
+            if collection:
+                path = self.endpoint("collection_subscription").path_for(resource=collection, subscription_id=subscription_id)
+            else:
+                path = self.endpoint("subscription").path_for(subscription_id=subscription_id)
+            await self.client.delete(path, custom_headers=self._headers(subscriber_id))
+            return True
+
+        return bool(await self._call("subscription deletion", f"for {subscription_id}", delete()))
@@ -1,26 +1,33 @@
+import functools
 import os
-from dotenv import load_dotenv
+from config import load_environment
+from tokens import atomic_write_text
+from utils.logger import get_logger
 
-load_dotenv(verbose=True)
+logger = get_logger(__name__)
 
 
 # ここは個人ごとのデータから取得するようにする
 class Settings:
-    client_id = os.getenv("CLIENT_ID")
-    client_secret = os.getenv("CLIENT_SECRET")
-    refresh_token = os.getenv("REFRESH_TOKEN")
     scopes = ["sleep", "activity", "bloodpressure"]
 
+    def __init__(self):
+        # import 時ではなく、最初に Settings を作るときに .env を読み込む
+        load_environment()
+        self.client_id = os.getenv("CLIENT_ID")
+        self.client_secret = os.getenv("CLIENT_SECRET")
+        self.refresh_token = os.getenv("REFRESH_TOKEN")
+
     def update_refresh_token(self, new_token: str, env_file_path: str = ".env") -> bool:
         lines = []
         try:
             with open(env_file_path, "r", encoding="utf-8") as f:
                 lines = f.readlines()
         except FileNotFoundError:
-            print(f"エラー: .env ファイルが見つかりません ({env_file_path})")
+            logger.error(".env file not found (%s).", env_file_path)
             return False
         except IOError as e:
-            print(f"エラー: ファイルの読み込みに失敗しました ({env_file_path}): {e}")
+            logger.error("Failed to read %s: %s", env_file_path, e)
             return False
 
         updated_lines = []
@@ -41,14 +48,20 @@ class Settings:
                 updated_lines.append(line) # 元の行をそのまま追加
 
         if not token_found:
-            print(f"エラー: REFRESH_TOKEN がファイル内に見つかりませんでした ({env_file_path})。更新は行われませんでした。")
+            logger.error("REFRESH_TOKEN was not found in %s. The file was not updated.", env_file_path)
             return False
 
         try:
-            with open(env_file_path, "w", encoding="utf-8") as f:
-                f.writelines(updated_lines)
-            print(f"REFRESH_TOKEN が正常に更新されました ({env_file_path})。")
+            # 書き込み途中で中断されても .env が壊れないよう、一時ファイル経由で置き換える
+            atomic_write_text(env_file_path, "".join(updated_lines), mode=os.stat(env_file_path).st_mode & 0o777)
+            logger.info("Updated REFRESH_TOKEN in %s.", env_file_path)
             return True
         except IOError as e:
-            print(f"エラー: ファイルへの書き込みに失敗しました ({env_file_path}): {e}")
+            logger.error("Failed to write %s: %s", env_file_path, e)
             return False
+
+
+@functools.cache
+def get_settings() -> Settings:
+    """プロセス共有の Settings (.env の読み込みは1回だけ行う)"""
+    return Settings()
@@ -0,0 +1,557 @@
+import asyncio
+import base64
+import datetime
+import json
+import math
+import random
+import secrets
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs
+
+import httpx
+
+from services.endpoints import Endpoint, find_endpoint
+from utils.date_range import DATE_FORMAT
+from utils.rate_limit import DEFAULT_RATE_LIMIT, DEFAULT_RATE_LIMIT_WINDOW, HEADER_RATE_LIMIT, HEADER_RATE_LIMIT_REMAINING, HEADER_RATE_LIMIT_RESET
+from utils.timeseries import DETAIL_LEVEL_SECONDS, parse_time_of_day
+
+
+# アクセストークンの有効期間 (Fitbit と同じ 8 時間)
+ACCESS_TOKEN_LIFETIME = 28800
+
+# 注入するエラーの既定のステータスコード
+DEFAULT_ERROR_STATUSES = (500, 502, 503)
+
+# Subscriptions API のエンドポイント (登録・削除の状態をシミュレーター内に保持する)
+_SUBSCRIPTION_ENDPOINTS = {"subscriptions", "subscription", "collection_subscriptions", "collection_subscription"}
+
+# 睡眠ログの一覧 (sleep_list) で返す過去の日数
+SLEEP_LIST_HISTORY_DAYS = 3 * 365
+
+# 時系列の期間 ("7d", "1w", "3m" など) の日数
+_PERIOD_DAYS = {"d": 1, "w": 7, "m": 30, "y": 365}
+
+# アクティビティのリソースごとの1日の合計値の範囲
+_ACTIVITY_DAILY_RANGES = {
+    "steps": (2000, 15000),
+    "calories": (1600, 3200),
+    "distance": (1.5, 11.0),
+    "floors": (0, 25),
+    "elevation": (0, 75),
+    "minutesSedentary": (500, 900),
+    "minutesLightlyActive": (100, 300),
+    "minutesFairlyActive": (0, 60),
+    "minutesVeryActive": (0, 60),
+    "activityCalories": (200, 1500),
+}
+
+
+def _json_response(status_code: int, data: Any = None, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+    if data is None:
+        return httpx.Response(status_code, headers=headers)
+    return httpx.Response(
+        status_code,
+        content=json.dumps(data).encode(),
+        headers={"Content-Type": "application/json", **(headers or {})}
+    )
+
+
+def _error(status_code: int, error_type: str, message: str, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+    """Fitbit と同じ形式のエラーレスポンス"""
+    return _json_response(status_code, {"errors": [{"errorType": error_type, "message": message}], "success": False}, headers)
+
+
+def _dates(start: datetime.date, end: datetime.date) -> List[datetime.date]:
+    return [start + datetime.timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def _format_time(seconds: int) -> str:
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class _UserState:
+    """シミュレーター上の1ユーザー分の状態 (リフレッシュトークンとレート制限のウィンドウ)"""
+    def __init__(self, user_id: str, refresh_token: str):
+        self.user_id = user_id
+        self.refresh_token = refresh_token
+        self.window_start: Optional[float] = None
+        self.used = 0
+
+
+class FitbitSimulator:
+    """
+    オフラインで負荷試験・ベンチマークを行うための Fitbit Web API のシミュレーター。
+    httpx.MockTransport のハンドラーとして動作するため、ApiClient や Client にそのまま渡せる。
+
+        simulator = FitbitSimulator(latency=0.05, error_rate=0.01)
+        refresh_token = simulator.add_user("ABC123")
+        http_client = simulator.client()                # Client.get_access_token / ApiClient に渡す
+
+    - services.endpoints に登録されたエンドポイント (睡眠、心拍数と1秒間隔の日中データ、HRV、SpO2、皮膚温、
+      アクティビティ、サブスクリプション) に、本物に近い形のデータを返す。値は (seed, ユーザー, エンドポイント, 日付) から
+      決まるため、同じ条件では毎回同じデータになる
+    - ユーザーごとに固定ウィンドウのレート制限 (既定は1時間あたり150回) を適用し、Fitbit-Rate-Limit-* ヘッダーを返す。
+      超過したリクエストには 429 と Retry-After を返す
+    - latency / jitter 秒の遅延と、bandwidth (バイト/秒) に応じた転送時間を加える
+    - error_rate の確率、または inject_errors で予約した回数だけ 5xx などのエラーを返す
+    - トークンのリフレッシュでは毎回リフレッシュトークンをローテーションし、使用済みのトークンは invalid_grant にする
+    """
+    def __init__(
+        self,
+        seed: int = 0,
+        rate_limit: int = DEFAULT_RATE_LIMIT,
+        rate_limit_window: float = DEFAULT_RATE_LIMIT_WINDOW,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        bandwidth: Optional[float] = None,
+        error_rate: float = 0.0,
+        error_statuses: Sequence[int] = DEFAULT_ERROR_STATUSES,
+        client_id: Optional[str] = None,
+        client_secret: Optional[str] = None,
+        clock: Callable[[], float] = time.monotonic,
+        payload_cache_size: int = 256
+    ):
+        self.seed = seed
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_statuses = list(error_statuses)
+        # None の場合はクライアントの認証情報を検証しない
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.clock = clock
+        self._random = random.Random(seed)
+        self._users: Dict[str, _UserState] = {}
+        self._access_tokens: Dict[str, Tuple[str, float]] = {}
+        self._injected: List[int] = []
+        self._subscriptions: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # 1秒間隔の日中データなどの生成は重いため、同じパスのレスポンスは再利用する
+        self._payloads: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._payload_cache_size = payload_cache_size
+        self.stats: Dict[str, Any] = {"requests": 0, "rate_limited": 0, "injected_errors": 0, "token_refreshes": 0, "bytes": 0, "by_endpoint": {}}
+
+    # ------------------------------------------------------------------------------
+    # ユーザーとトークン
+    # ------------------------------------------------------------------------------
+    def add_user(self, user_id: str, refresh_token: Optional[str] = None) -> str:
+        """ユーザーを登録し、そのユーザーのリフレッシュトークンを返す。"""
+        refresh_token = refresh_token or secrets.token_urlsafe(24)
+        self._users[user_id] = _UserState(user_id, refresh_token)
+        return refresh_token
+
+    def refresh_token_for(self, user_id: str) -> str:
+        """現在有効なリフレッシュトークン"""
+        return self._users[user_id].refresh_token
+
+    def expire_access_tokens(self, user_id: Optional[str] = None) -> None:
+        """発行済みのアクセストークンを失効させる (401 からの再認証の確認用)。"""
+        for token, (owner, _) in list(self._access_tokens.items()):
+            if user_id is None or owner == user_id:
+                del self._access_tokens[token]
+
+    def issue_access_token(self, user_id: str) -> str:
+        """トークンのリフレッシュを経ずにアクセストークンを発行する (ApiClient を直接使う場合)。"""
+        access_token = secrets.token_urlsafe(32)
+        self._access_tokens[access_token] = (user_id, time.time() + ACCESS_TOKEN_LIFETIME)
+        return access_token
+
+    def inject_errors(self, status_code: int, count: int = 1) -> None:
+        """次の count 回の API リクエストに status_code を返す。"""
+        self._injected.extend([status_code] * count)
+
+    def reset_rate_limits(self) -> None:
+        for user in self._users.values():
+            user.window_start = None
+            user.used = 0
+
+    def client(self, **kwargs) -> httpx.AsyncClient:
+        """このシミュレーターに接続する httpx.AsyncClient"""
+        return httpx.AsyncClient(transport=self.transport(), **kwargs)
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    # ------------------------------------------------------------------------------
+    # リクエスト処理
+    # ------------------------------------------------------------------------------
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.stats["requests"] += 1
+        if request.url.path == "/oauth2/token":
+            response = self._handle_token(request)
+        else:
+            response = self._handle_api(request)
+        await self._delay(len(response.content))
+        self.stats["bytes"] += len(response.content)
+        return response
+
+    async def _delay(self, size: int) -> None:
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if self.bandwidth:
+            delay += size / self.bandwidth
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _handle_token(self, request: httpx.Request) -> httpx.Response:
+        if self.client_id is not None:
+            expected = base64.b64encode(f"{self.client_id}:{self.client_secret}".encode()).decode()
+            if request.headers.get("Authorization") != f"Basic {expected}":
+                return _error(401, "invalid_client", "Invalid authorization header.")
+        form = {key: values[0] for key, values in parse_qs(request.content.decode()).items()}
+        if form.get("grant_type") != "refresh_token":
+            return _error(400, "unsupported_grant_type", f"Unsupported grant_type: {form.get('grant_type')}")
+        user = next((user for user in self._users.values() if user.refresh_token == form.get("refresh_token")), None)
+        if user is None:
+            return _error(400, "invalid_grant", f"Refresh token invalid: {form.get('refresh_token')}")
+
+        self.stats["token_refreshes"] += 1
+        user.refresh_token = secrets.token_urlsafe(24)
+        access_token = self.issue_access_token(user.user_id)
+        return _json_response(200, {
+            "access_token": access_token,
+            "expires_in": ACCESS_TOKEN_LIFETIME,
+            "refresh_token": user.refresh_token,
+            "scope": "activity heartrate sleep oxygen_saturation temperature",
+            "token_type": "Bearer",
+            "user_id": user.user_id,
+        })
+
+    def _authenticate(self, request: httpx.Request) -> Optional[_UserState]:
+        authorization = request.headers.get("Authorization", "")
+        entry = self._access_tokens.get(authorization.removeprefix("Bearer "))
+        if entry is None or entry[1] <= time.time():
+            return None
+        return self._users.get(entry[0])
+
+    def _consume(self, user: _UserState) -> Tuple[bool, Dict[str, str]]:
+        """レート制限を1回分消費する。:return: (許可されたか, Fitbit-Rate-Limit-* ヘッダー)"""
+        now = self.clock()
+        if user.window_start is None or now >= user.window_start + self.rate_limit_window:
+            user.window_start = now
+            user.used = 0
+        allowed = user.used < self.rate_limit
+        if allowed:
+            user.used += 1
+        reset = max(1, math.ceil(user.window_start + self.rate_limit_window - now))
+        return allowed, {
+            HEADER_RATE_LIMIT: str(self.rate_limit),
+            HEADER_RATE_LIMIT_REMAINING: str(self.rate_limit - user.used),
+            HEADER_RATE_LIMIT_RESET: str(reset),
+        }
+
+    def _handle_api(self, request: httpx.Request) -> httpx.Response:
+        user = self._authenticate(request)
+        if user is None:
+            return _error(401, "invalid_token", "Access token invalid or expired.")
+        allowed, headers = self._consume(user)
+        if not allowed:
+            self.stats["rate_limited"] += 1
+            return _error(429, "system", "Too Many Requests", {**headers, "Retry-After": headers[HEADER_RATE_LIMIT_RESET]})
+        if self._injected or (self.error_rate and self._random.random() < self.error_rate):
+            status_code = self._injected.pop(0) if self._injected else self._random.choice(self.error_statuses)
+            self.stats["injected_errors"] += 1
+            return _error(status_code, "system", "Injected error", headers)
+
+        path = request.url.path
+        endpoint, params = self._resolve(path)
+        if endpoint is None:
+            return _error(404, "not_found", f"Unknown endpoint: {path}", headers)
+        by_endpoint = self.stats["by_endpoint"]
+        by_endpoint[endpoint.name] = by_endpoint.get(endpoint.name, 0) + 1
+
+        error = endpoint.check(resource=params.get("resource"), detail_level=params.get("detail_level"))
+        if error:
+            return _error(400, "validation", error, headers)
+        if endpoint.name in _SUBSCRIPTION_ENDPOINTS:
+            return self._handle_subscription(request.method, user, endpoint, params, headers)
+        if request.method != "GET":
+            return _error(405, "request", f"Method not allowed: {request.method}", headers)
+        if endpoint.name == "sleep_list":
+            return self._handle_sleep_list(request, user, headers)
+        try:
+            body = self._payload(user.user_id, endpoint, params, path)
+        except ValueError as e:
+            return _error(400, "validation", str(e), headers)
+        return httpx.Response(200, content=body, headers={"Content-Type": "application/json", **headers})
+
+    @staticmethod
+    def _resolve(path: str) -> Tuple[Optional[Endpoint], Dict[str, str]]:
+        endpoint = find_endpoint(path)
+        return (endpoint, endpoint.match(path)) if endpoint else (None, {})
+
+    def _handle_subscription(
+        self, method: str, user: _UserState, endpoint: Endpoint, params: Dict[str, str], headers: Dict[str, str]
+    ) -> httpx.Response:
+        collection = params.get("resource")
+        subscription_id = params.get("subscription_id")
+        if method == "GET":
+            subscriptions = [
+                subscription for (owner, _), subscription in self._subscriptions.items()
+                if owner == user.user_id and (collection is None or subscription.get("collectionType") == collection)
+            ]
+            return _json_response(200, {"apiSubscriptions": subscriptions}, headers)
+        if subscription_id is None:
+            return _error(405, "request", f"Method not allowed: {method}", headers)
+        if method == "POST":
+            subscription = {"ownerId": user.user_id, "ownerType": "user", "subscriberId": "1", "subscriptionId": subscription_id}
+            if collection:
+                subscription["collectionType"] = collection
+            created = (user.user_id, subscription_id) not in self._subscriptions
+            self._subscriptions[(user.user_id, subscription_id)] = subscription
+            return _json_response(201 if created else 200, subscription, headers)
+        if method == "DELETE":
+            if self._subscriptions.pop((user.user_id, subscription_id), None) is None:
+                return _error(404, "not_found", f"Subscription not found: {subscription_id}", headers)
+            return _json_response(204, headers=headers)
+        return _error(405, "request", f"Method not allowed: {method}", headers)
+
+    def _handle_sleep_list(self, request: httpx.Request, user: _UserState, headers: Dict[str, str]) -> httpx.Response:
+        """
+        睡眠ログの一覧。beforeDate (新しい順) または afterDate (古い順) から、過去 SLEEP_LIST_HISTORY_DAYS 日分の記録を
+        offset / limit でページに分けて返す (両端の日を含む)。pagination.next は offset を進めた URL。
+        """
+        query = request.url.params
+        before, after, sort = query.get("beforeDate"), query.get("afterDate"), query.get("sort")
+        try:
+            limit, offset = int(query.get("limit", "0")), int(query.get("offset", "0"))
+            if (before is None) == (after is None):
+                raise ValueError("Exactly one of beforeDate or afterDate is required.")
+            if sort != ("desc" if before else "asc"):
+                raise ValueError("sort must be 'desc' with beforeDate and 'asc' with afterDate.")
+            if not 1 <= limit <= 100 or offset < 0:
+                raise ValueError("limit must be between 1 and 100 and offset must not be negative.")
+            today = datetime.date.today()
+            first = today - datetime.timedelta(days=SLEEP_LIST_HISTORY_DAYS - 1)
+            if before:
+                days = _dates(first, min(self._parse_date(before), today))[::-1]
+            else:
+                days = _dates(max(self._parse_date(after), first), today)
+        except ValueError as e:
+            return _error(400, "validation", str(e), headers)
+
+        page = days[offset:offset + limit]
+        more = offset + limit < len(days)
+        pagination = {
+            "limit": limit,
+            "next": str(request.url.copy_set_param("offset", offset + limit)) if more else "",
+            "offset": offset,
+            "previous": str(request.url.copy_set_param("offset", max(0, offset - limit))) if offset else "",
+            "sort": sort,
+            **({"beforeDate": before} if before else {"afterDate": after}),
+        }
+        return _json_response(200, {"sleep": [self._sleep(user.user_id, day) for day in page], "pagination": pagination}, headers)
+
+    # ------------------------------------------------------------------------------
+    # データの生成
+    # ------------------------------------------------------------------------------
+    def _payload(self, user_id: str, endpoint: Endpoint, params: Dict[str, str], path: str) -> bytes:
+        key = (user_id, path)
+        body = self._payloads.get(key)
+        if body is not None:
+            self._payloads.move_to_end(key)
+            return body
+        body = json.dumps(self._generate(user_id, endpoint, params), separators=(",", ":")).encode()
+        self._payloads[key] = body
+        if len(self._payloads) > self._payload_cache_size:
+            self._payloads.popitem(last=False)
+        return body
+
+    def _rng(self, user_id: str, kind: str, day: datetime.date) -> random.Random:
+        return random.Random(f"{self.seed}:{user_id}:{kind}:{day.isoformat()}")
+
+    @staticmethod
+    def _parse_date(value: str) -> datetime.date:
+        if value == "today":
+            return datetime.date.today()
+        return datetime.datetime.strptime(value, DATE_FORMAT).date()
+
+    def _date_range(self, endpoint: Endpoint, params: Dict[str, str]) -> List[datetime.date]:
+        if "start" in params:
+            start, end = self._parse_date(params["start"]), self._parse_date(params["end"])
+            if end < start:
+                raise ValueError(f"End date {end} is before start date {start}.")
+            if endpoint.max_range_days is not None and (end - start).days + 1 > endpoint.max_range_days:
+                raise ValueError(f"The date range must not exceed {endpoint.max_range_days} days.")
+            return _dates(start, end)
+        end = self._parse_date(params["date"])
+        period = params.get("period")
+        if period:
+            days = int(period[:-1]) * _PERIOD_DAYS[period[-1]]
+            return _dates(end - datetime.timedelta(days=days - 1), end)
+        return [end]
+
+    def _generate(self, user_id: str, endpoint: Endpoint, params: Dict[str, str]) -> Any:
+        days = self._date_range(endpoint, params)
+        name = endpoint.name
+        if name.startswith("sleep"):
+            records = [self._sleep(user_id, day) for day in days]
+            if name == "sleep_by_date":
+                return {"sleep": records, "summary": self._sleep_summary(records)}
+            return {"sleep": records}
+        if name.startswith("hrv"):
+            return {"hrv": [self._hrv(user_id, day) for day in days]}
+        if name.startswith("spo2"):
+            records = [self._spo2(user_id, day) for day in days]
+            return records[0] if name == "spo2_by_date" else records
+        if name.startswith("temp_skin"):
+            return {"tempSkin": [self._temp_skin(user_id, day) for day in days]}
+        if name == "temp_core_by_date":
+            return {"tempCore": []}
+        if name == "heart_rate_by_date_range":
+            return {"activities-heart": [self._heart_rate_day(user_id, day) for day in days]}
+        if name.startswith("heart_rate_intraday"):
+            return self._heart_rate_intraday(user_id, days[0], params)
+        if name == "activity_summary":
+            return self._activity_summary(user_id, days[0])
+        if name.startswith("activity_intraday"):
+            return self._activity_intraday(user_id, days[0], params)
+        if name.startswith("activity_time_series"):
+            resource = params["resource"]
+            return {f"activities-{resource}": [
+                {"dateTime": day.isoformat(), "value": self._format_activity(resource, self._activity_total(user_id, resource, day))}
+                for day in days
+            ]}
+        raise ValueError(f"No payload for endpoint: {name}")
+
+    def _sleep(self, user_id: str, day: datetime.date) -> Dict[str, Any]:
+        rng = self._rng(user_id, "sleep", day)
+        start = datetime.datetime.combine(day - datetime.timedelta(days=1), datetime.time(22)) + datetime.timedelta(minutes=rng.randint(0, 150))
+        in_bed = rng.randint(330, 540)
+        awake = rng.randint(20, 70)
+        asleep = in_bed - awake
+        deep = int(asleep * rng.uniform(0.12, 0.22))
+        rem = int(asleep * rng.uniform(0.18, 0.26))
+        return {
+            "dateOfSleep": day.isoformat(),
+            "duration": in_bed * 60000,
+            "efficiency": round(asleep / in_bed * 100),
+            "endTime": (start + datetime.timedelta(minutes=in_bed)).isoformat(timespec="milliseconds"),
+            "infoCode": 0,
+            "isMainSleep": True,
+            "levels": {"summary": {
+                "deep": {"count": rng.randint(2, 6), "minutes": deep, "thirtyDayAvgMinutes": deep},
+                "light": {"count": rng.randint(20, 35), "minutes": asleep - deep - rem, "thirtyDayAvgMinutes": asleep - deep - rem},
+                "rem": {"count": rng.randint(4, 9), "minutes": rem, "thirtyDayAvgMinutes": rem},
+                "wake": {"count": rng.randint(15, 35), "minutes": awake, "thirtyDayAvgMinutes": awake},
+            }},
+            "logId": int(day.strftime("%Y%m%d")) * 1000 + rng.randint(0, 999),
+            "logType": "auto_detected",
+            "minutesAfterWakeup": 0,
+            "minutesAsleep": asleep,
+            "minutesAwake": awake,
+            "minutesToFallAsleep": 0,
+            "startTime": start.isoformat(timespec="milliseconds"),
+            "timeInBed": in_bed,
+            "type": "stages",
+        }
+
+    @staticmethod
+    def _sleep_summary(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "totalMinutesAsleep": sum(record["minutesAsleep"] for record in records),
+            "totalSleepRecords": len(records),
+            "totalTimeInBed": sum(record["timeInBed"] for record in records),
+        }
+
+    def _hrv(self, user_id: str, day: datetime.date) -> Dict[str, Any]:
+        rng = self._rng(user_id, "hrv", day)
+        daily = rng.uniform(20, 70)
+        return {"value": {"dailyRmssd": round(daily, 3), "deepRmssd": round(daily * rng.uniform(1.0, 1.3), 3)}, "dateTime": day.isoformat()}
+
+    def _spo2(self, user_id: str, day: datetime.date) -> Dict[str, Any]:
+        rng = self._rng(user_id, "spo2", day)
+        avg = rng.uniform(94, 98.5)
+        return {"dateTime": day.isoformat(), "value": {"avg": round(avg, 1), "min": round(avg - rng.uniform(1, 4), 1), "max": round(min(100.0, avg + rng.uniform(0.5, 2)), 1)}}
+
+    def _temp_skin(self, user_id: str, day: datetime.date) -> Dict[str, Any]:
+        rng = self._rng(user_id, "temp_skin", day)
+        return {"dateTime": day.isoformat(), "value": {"nightlyRelative": round(rng.gauss(0, 0.6), 1)}, "logType": "dedicated_temp_sensor"}
+
+    def _resting_heart_rate(self, user_id: str, day: datetime.date) -> int:
+        return self._rng(user_id, "resting_heart_rate", day).randint(52, 72)
+
+    def _heart_rate_day(self, user_id: str, day: datetime.date) -> Dict[str, Any]:
+        rng = self._rng(user_id, "heart_rate_zones", day)
+        resting = self._resting_heart_rate(user_id, day)
+        zones = []
+        bounds = [30, 98, 137, 166, 220]
+        for name, low, high, minutes in zip(
+            ["Out of Range", "Fat Burn", "Cardio", "Peak"], bounds, bounds[1:],
+            [rng.randint(1200, 1400), rng.randint(20, 120), rng.randint(0, 40), rng.randint(0, 10)]
+        ):
+            zones.append({"caloriesOut": round(minutes * rng.uniform(1.2, 9.0), 2), "max": high, "min": low, "minutes": minutes, "name": name})
+        return {"dateTime": day.isoformat(), "value": {"customHeartRateZones": [], "heartRateZones": zones, "restingHeartRate": resting}}
+
+    @staticmethod
+    def _window(params: Dict[str, str], interval: int) -> range:
+        start = parse_time_of_day(params["start_time"]) if params.get("start_time") else 0
+        end = parse_time_of_day(params["end_time"]) + 59 if params.get("end_time") else 86399
+        return range(start - start % interval, min(end, 86399) + 1, interval)
+
+    def _heart_rate_intraday(self, user_id: str, day: datetime.date, params: Dict[str, str]) -> Dict[str, Any]:
+        interval = DETAIL_LEVEL_SECONDS[params["detail_level"]]
+        resting = self._resting_heart_rate(user_id, day)
+        rng = self._rng(user_id, "heart_rate_intraday", day)
+        phase = rng.uniform(0, 2 * math.pi)
+        dataset = []
+        value = float(resting)
+        for second in self._window(params, interval):
+            # 日中は高く夜間は安静時心拍数に近い、ゆっくり変化する値 (ランダムウォーク + 日内変動)
+            target = resting + 25 * max(0.0, math.sin(second / 86400 * 2 * math.pi - math.pi / 3 + phase * 0.1))
+            value += (target - value) * 0.05 + rng.gauss(0, 1.5)
+            dataset.append({"time": _format_time(second), "value": max(40, int(value))})
+        return {
+            "activities-heart": [self._heart_rate_day(user_id, day)],
+            "activities-heart-intraday": {"dataset": dataset, "datasetInterval": interval, "datasetType": "second" if interval == 1 else "minute"},
+        }
+
+    def _activity_total(self, user_id: str, resource: str, day: datetime.date) -> float:
+        low, high = _ACTIVITY_DAILY_RANGES[resource]
+        return self._rng(user_id, f"activity:{resource}", day).uniform(low, high)
+
+    @staticmethod
+    def _format_activity(resource: str, value: float) -> str:
+        # 時系列の値は文字列で返される
+        return f"{value:.2f}" if resource == "distance" else str(int(value))
+
+    def _activity_intraday(self, user_id: str, day: datetime.date, params: Dict[str, str]) -> Dict[str, Any]:
+        resource = params["resource"]
+        interval = DETAIL_LEVEL_SECONDS[params["detail_level"]]
+        total = self._activity_total(user_id, resource, day)
+        rng = self._rng(user_id, f"activity_intraday:{resource}", day)
+        dataset = []
+        for second in self._window(params, interval):
+            hour = second / 3600
+            # 起きている時間帯 (7時から23時) にだけ活動量を配分する
+            weight = rng.expovariate(1.0) if 7 <= hour < 23 else 0.0
+            value = total / (16 * 3600 / interval) * weight
+            dataset.append({"time": _format_time(second), "value": round(value, 3) if resource == "distance" else int(value)})
+        return {
+            f"activities-{resource}": [{"dateTime": day.isoformat(), "value": self._format_activity(resource, total)}],
+            f"activities-{resource}-intraday": {"dataset": dataset, "datasetInterval": interval // 60, "datasetType": "minute"},
+        }
+
+    def _activity_summary(self, user_id: str, day: datetime.date) -> Dict[str, Any]:
+        total = {resource: self._activity_total(user_id, resource, day) for resource in _ACTIVITY_DAILY_RANGES}
+        return {
+            "activities": [],
+            "goals": {"activeMinutes": 30, "caloriesOut": 2500, "distance": 8.05, "floors": 10, "steps": 10000},
+            "summary": {
+                "activityCalories": int(total["activityCalories"]),
+                "caloriesOut": int(total["calories"]),
+                "distances": [{"activity": "total", "distance": round(total["distance"], 2)}],
+                "elevation": round(total["elevation"], 1),
+                "fairlyActiveMinutes": int(total["minutesFairlyActive"]),
+                "floors": int(total["floors"]),
+                "heartRateZones": self._heart_rate_day(user_id, day)["value"]["heartRateZones"],
+                "lightlyActiveMinutes": int(total["minutesLightlyActive"]),
+                "restingHeartRate": self._resting_heart_rate(user_id, day),
+                "sedentaryMinutes": int(total["minutesSedentary"]),
+                "steps": int(total["steps"]),
+                "veryActiveMinutes": int(total["minutesVeryActive"]),
+            },
+        }
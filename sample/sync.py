@@ -0,0 +1,217 @@
+import asyncio
+import contextlib
+import datetime
+import importlib
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from tokens import atomic_write_text
+from utils.api import ApiClient
+from utils.concurrency import gather_bounded
+from utils.date_range import DATE_FORMAT, split_date_range, split_range_response
+from utils.logger import get_logger
+from utils.watermark import WatermarkStore
+from services.endpoints import ENDPOINTS, Endpoint
+
+logger = get_logger(__name__)
+
+
+# 取得したデータの保存先: (user_id, metric, start_date, end_date, data) を受け取る
+Sink = Callable[[str, str, str, str, Any], Awaitable[None]]
+
+# 差分同期の対象とするアクティビティのリソース
+ACTIVITY_RESOURCES = ["steps", "calories", "distance", "floors", "minutesSedentary", "minutesVeryActive"]
+
+# 日付範囲で取得できるメトリクス: メトリクス名 -> (サービスのモジュール, クラス, メソッド, エンドポイント名)
+# サービスは使うときにだけ import する (1つのメトリクスだけを取得するコマンドの起動を速くするため)
+RANGE_METRICS = {
+    "sleep": ("services.sleep", "Sleep", "get_by_date_range", "sleep_by_date_range"),
+    "hrv": ("services.heart_rate", "HeartRate", "get_hrv_by_date_range", "hrv_by_date_range"),
+    "spo2": ("services.spo2", "Spo2", "get_by_date_range", "spo2_by_date_range"),
+    "temp_skin": ("services.temperature", "Temperature", "get_skin_temp_by_date_range", "temp_skin_by_date_range"),
+    "heart_rate": ("services.heart_rate", "HeartRate", "get_heart_rate_by_date_range", "heart_rate_by_date_range"),
+}
+# "activity:<リソース>" のメトリクス
+ACTIVITY_METRIC = ("services.activity", "Activity", "get_time_series_by_date_range", "activity_time_series_by_date_range")
+
+# データが確定するまでの日数 (エンドポイントに指定が無い場合)
+DEFAULT_SETTLE_DAYS = 3
+
+RangeFetcher = Callable[[str, str], Awaitable[Any]]
+
+
+def _metric_spec(metric: str) -> tuple[str, str, str, str, str]:
+    """メトリクスの (サービスのモジュール, クラス, メソッド, エンドポイント名, アクティビティのリソース)"""
+    kind, _, resource = metric.partition(":")
+    if kind == "activity" and resource:
+        return (*ACTIVITY_METRIC, resource)
+    if metric in RANGE_METRICS:
+        return (*RANGE_METRICS[metric], "")
+    raise ValueError(f"Unknown metric: {metric}")
+
+
+def metric_endpoint(metric: str) -> Endpoint:
+    """メトリクスを取得する日付範囲エンドポイント"""
+    return ENDPOINTS[_metric_spec(metric)[3]]
+
+
+def range_fetcher(
+    api_client: ApiClient,
+    metric: str,
+    services: Optional[Dict[str, Any]] = None
+) -> tuple[RangeFetcher, int]:
+    """
+    1つのメトリクスの ((開始日, 終了日) から範囲データを取得する関数, 1リクエストの最大日数)。
+    取得する関数はエラーをログに記録した上で送出し、データが無い (204 や空のレスポンス) 場合は None を返す。
+    :param services: 作成済みのサービス ({クラス名: インスタンス})。複数のメトリクスで共有する場合に渡す
+    """
+    module_name, class_name, method_name, endpoint_name, resource = _metric_spec(metric)
+
+    services = services if services is not None else {}
+    service = services.get(class_name)
+    if service is None:
+        service = services[class_name] = getattr(importlib.import_module(module_name), class_name)(
+            client=api_client, raise_errors=True
+        )
+    method = getattr(service, method_name)
+    fetcher = (lambda start, end: method(resource, start, end)) if resource else method
+    return fetcher, ENDPOINTS[endpoint_name].max_range_days
+
+
+def range_fetchers(
+    api_client: ApiClient,
+    activity_resources: Iterable[str] = ACTIVITY_RESOURCES
+) -> Dict[str, tuple[RangeFetcher, int]]:
+    """
+    日付範囲で取得できるメトリクスの一覧。
+    :return: {メトリクス名: ((開始日, 終了日) から範囲データを取得する関数, 1リクエストの最大日数)}
+    """
+    services: Dict[str, Any] = {}
+    metrics = [*RANGE_METRICS, *(f"activity:{resource}" for resource in activity_resources)]
+    return {metric: range_fetcher(api_client, metric, services) for metric in metrics}
+
+
+def json_file_sink(directory: str) -> Sink:
+    """
+    日ごとに <directory>/<user_id>/<metric>/<YYYY-MM-DD>.json へ書き出す sink (内容はその日の分のレスポンス)。
+    差分同期は確定前の直近の日を取得し直すため、同じ日のファイルは置き換え、取得し直した期間にレコードの無くなった日の
+    ファイルは削除する (ディレクトリに同じ日が重複しない)。日に分けられない値 (睡眠の "summary" など) は保存しない。
+    """
+    def write(user_id: str, metric: str, start_date: str, end_date: str, data: Any) -> None:
+        path = os.path.join(directory, user_id, metric.replace(":", "_"))
+        os.makedirs(path, exist_ok=True)
+        days = split_range_response(data)
+        for date, response in days.items():
+            atomic_write_text(os.path.join(path, f"{date}.json"), json.dumps(response, ensure_ascii=False), mode=0o644)
+        for date, _ in split_date_range(start_date, end_date, 1):
+            if date not in days:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(path, f"{date}.json"))
+
+    async def sink(user_id: str, metric: str, start_date: str, end_date: str, data: Any) -> None:
+        # 期間によっては数百ファイルになるため、書き込みはスレッドで行い、イベントループを止めない
+        await asyncio.to_thread(write, user_id, metric, start_date, end_date, data)
+    return sink
+
+
+def make_sink(directory: str, format: str = "json") -> Sink:
+    """
+    保存形式に応じた sink を返す。
+    :param format: "json" (チャンクごとの JSON ファイル)、"parquet" または "arrow" (columnar.ColumnarStore)
+    """
+    if format == "json":
+        return json_file_sink(directory)
+    from columnar import ColumnarStore
+    return ColumnarStore(directory, format=format).sink()
+
+
+class IncrementalSync:
+    """
+    ユーザー・メトリクスごとのハイウォーターマークに基づく差分同期。
+
+    実行のたびに「マークの翌日から end_date まで」の未取得期間だけを日付範囲エンドポイントで取得し、
+    sink への保存が完了してからマークを進める。初回 (マーク無し) は initial_days 日分を取得する。
+    データの無い期間 (204 や空のレスポンス) もマークを進め、エラーの場合だけ進めない。
+
+    マークはエンドポイントの settle_days より前 (データが確定した日) までしか進めないため、
+    直近の数日は確定するまで毎回取得し直す。
+    """
+    def __init__(
+        self,
+        api_client: ApiClient,
+        sink: Sink,
+        user_id: str,
+        store: Optional[WatermarkStore] = None,
+        initial_days: int = 30,
+        activity_resources: Iterable[str] = ACTIVITY_RESOURCES,
+        max_concurrency: Optional[int] = None
+    ):
+        self.sink = sink
+        self.user_id = user_id
+        self.store = store if store else WatermarkStore()
+        self.initial_days = initial_days
+        self.max_concurrency = max_concurrency
+
+        # メトリクス名 -> (開始日, 終了日) から範囲データを取得する関数
+        self.fetchers = {
+            metric: fetcher for metric, (fetcher, _) in range_fetchers(api_client, activity_resources).items()
+        }
+
+    def pending_range(self, metric: str, end_date: str) -> Optional[tuple[str, str]]:
+        """metric の未取得期間 (開始日, 終了日)。取得済みの場合は None"""
+        last_date = self.store.get(self.user_id, metric)
+        end = datetime.datetime.strptime(end_date, DATE_FORMAT).date()
+        if last_date:
+            start = datetime.datetime.strptime(last_date, DATE_FORMAT).date() + datetime.timedelta(days=1)
+        else:
+            start = end - datetime.timedelta(days=self.initial_days - 1)
+        if start > end:
+            return None
+        return start.strftime(DATE_FORMAT), end_date
+
+    async def _sync_metric(self, metric: str, end_date: str) -> Optional[tuple[str, str]]:
+        pending = self.pending_range(metric, end_date)
+        if pending is None:
+            logger.debug("%s for user %s is up to date (%s).", metric, self.user_id, end_date)
+            return None
+        start_date, end_date = pending
+        # JSON 形式のログではフィールドとして出力される
+        fields = {"user_id": self.user_id, "metric": metric, "start_date": start_date, "end_date": end_date}
+
+        try:
+            data = await self.fetchers[metric](start_date, end_date)
+        except Exception:
+            # エラーの詳細はサービスがログに記録している。マークは進めずに次回再取得する
+            logger.warning("Incremental sync of %s for user %s failed for %s to %s.", metric, self.user_id, start_date, end_date, extra=fields)
+            return None
+
+        if data is not None:
+            await self.sink(self.user_id, metric, start_date, end_date, data)
+        settled = self._settled_date(metric)
+        self.store.advance(self.user_id, metric, min(end_date, settled))
+        logger.info("Synced %s for user %s from %s to %s.", metric, self.user_id, start_date, end_date, extra=fields)
+        return pending
+
+    @staticmethod
+    def _settled_date(metric: str) -> str:
+        """metric のデータが確定している最後の日 (エンドポイントの settle_days より前)"""
+        settle_days = metric_endpoint(metric).settle_days
+        settle_days = DEFAULT_SETTLE_DAYS if settle_days is None else settle_days
+        return (datetime.date.today() - datetime.timedelta(days=settle_days + 1)).strftime(DATE_FORMAT)
+
+    async def run(self, end_date: Optional[str] = None, metrics: Optional[Iterable[str]] = None) -> Dict[str, Optional[tuple[str, str]]]:
+        """
+        未取得期間を同期する。各メトリクスは並行に取得され、失敗は他のメトリクスに影響しない。
+
+        :param end_date: 同期する最終日 (既定は昨日)
+        :param metrics: 対象メトリクス (既定は全て)
+        :return: {メトリクス名: 同期した (開始日, 終了日)} (同期しなかった・失敗した場合は None)
+        """
+        if end_date is None:
+            end_date = (datetime.date.today() - datetime.timedelta(days=1)).strftime(DATE_FORMAT)
+        names = list(metrics) if metrics is not None else list(self.fetchers)
+        return await gather_bounded(
+            {metric: self._sync_metric(metric, end_date) for metric in names},
+            max_concurrency=self.max_concurrency
+        )
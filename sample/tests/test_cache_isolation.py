@@ -0,0 +1,59 @@
+"""
+複数ユーザーで共有した ResponseCache が、他のユーザーのレスポンスを返さないことの確認。
+
+    python -m unittest discover -s tests -t .     # sample ディレクトリで実行する
+"""
+import os
+import tempfile
+import unittest
+
+from simulator import FitbitSimulator
+from utils.api import ApiClient
+from utils.cache import ResponseCache
+from utils.rate_limit import RateLimiter
+from services.endpoints import ENDPOINTS
+
+
+class SharedCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(os.path.join(self.directory.name, "responses.sqlite3"))
+        self.simulator = FitbitSimulator()
+        for user_id in ("A", "B"):
+            self.simulator.add_user(user_id)
+        self.http_client = self.simulator.client()
+
+    async def asyncTearDown(self):
+        await self.http_client.aclose()
+        self.cache.close()
+        self.directory.cleanup()
+
+    def api_client(self, user_id: str) -> ApiClient:
+        return ApiClient(
+            self.simulator.issue_access_token(user_id),
+            http_client=self.http_client,
+            rate_limiter=RateLimiter(limit=10 ** 6),
+            cache=self.cache,
+            user_id=user_id
+        )
+
+    async def test_users_do_not_share_cached_responses(self):
+        path = ENDPOINTS["hrv_by_date_range"].path_for(start="2025-05-01", end="2025-05-30")
+        first = await self.api_client("A").get(path)
+        second = await self.api_client("B").get(path)
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.cache.stats["hits"], 0)
+        self.assertEqual(self.simulator.stats["by_endpoint"]["hrv_by_date_range"], 2)
+
+    async def test_same_user_reuses_cached_response(self):
+        path = ENDPOINTS["hrv_by_date_range"].path_for(start="2025-05-01", end="2025-05-30")
+        first = await self.api_client("A").get(path)
+        again = await self.api_client("A").get(path)
+
+        self.assertEqual(first, again)
+        self.assertEqual(self.cache.stats["hits"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
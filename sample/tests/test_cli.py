@@ -0,0 +1,75 @@
+"""cli の fetch をシミュレーターに対して実行する確認。"""
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import cli
+import settings
+from simulator import FitbitSimulator
+
+
+class FetchUsersTest(unittest.TestCase):
+    def setUp(self):
+        # トークン (.state) とレスポンスのキャッシュ (.cache) はカレントディレクトリに保存される
+        self.directory = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.directory.name)
+        self.simulator = FitbitSimulator()
+        entries = [
+            {"user_id": user_id, "refresh_token": self.simulator.add_user(user_id)} for user_id in ("A", "B")
+        ]
+        with open("users.json", "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        environment = {"CLIENT_ID": "client", "CLIENT_SECRET": "secret", "REFRESH_TOKEN": "unused"}
+        self.environment = mock.patch.dict(os.environ, environment)
+        self.environment.start()
+        settings.get_settings.cache_clear()
+
+        clients = []
+
+        def get_http_client():
+            if not clients:
+                clients.append(self.simulator.client())
+            return clients[0]
+
+        async def close_http_client():
+            if clients:
+                await clients.pop().aclose()
+        self.transport = mock.patch.multiple(
+            "utils.transport", get_http_client=get_http_client, close_http_client=close_http_client
+        )
+        self.transport.start()
+
+    def tearDown(self):
+        self.transport.stop()
+        self.environment.stop()
+        settings.get_settings.cache_clear()
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def fetch(self, user_id: str, *options: str) -> int:
+        return cli.main(["fetch", "hrv", "--start", "2025-05-01", "--end", "2025-05-30",
+                         "--users", "users.json", "--user", user_id, "--out", f"{user_id}.json", *options])
+
+    def read(self, user_id: str):
+        with open(f"{user_id}.json", encoding="utf-8") as f:
+            return json.load(f)
+
+    def test_users_do_not_share_the_cache_file(self):
+        self.assertEqual(self.fetch("A"), 0)
+        self.assertEqual(self.fetch("B"), 0)
+
+        self.assertNotEqual(self.read("A"), self.read("B"))
+        self.assertEqual(self.simulator.stats["by_endpoint"]["hrv_by_date_range"], 2)
+
+    def test_cached_response_is_reused_for_the_same_user(self):
+        self.fetch("A")
+        self.fetch("A")
+
+        self.assertEqual(self.simulator.stats["by_endpoint"]["hrv_by_date_range"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
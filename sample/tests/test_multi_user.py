@@ -0,0 +1,56 @@
+"""MultiUserRunner で1つの ResponseCache を共有した場合の確認。"""
+import os
+import tempfile
+import unittest
+
+from multi_user import MultiUserRunner
+from simulator import FitbitSimulator
+from users import UserCredentials
+from utils.cache import ResponseCache
+from services.endpoints import ENDPOINTS
+
+
+class SharedCacheRunnerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # Client はトークンをカレントディレクトリの .state に保存する
+        self.directory = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.directory.name)
+        self.cache = ResponseCache(os.path.join(self.directory.name, "responses.sqlite3"))
+        self.simulator = FitbitSimulator()
+        self.refresh_tokens = {user_id: self.simulator.add_user(user_id) for user_id in ("A", "B")}
+        self.http_client = self.simulator.client()
+
+    async def asyncTearDown(self):
+        await self.http_client.aclose()
+        self.cache.close()
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    async def run_users(self, users):
+        path = ENDPOINTS["sleep_by_date_range"].path_for(start="2025-05-01", end="2025-05-30")
+
+        async def job(user, api_client):
+            return await api_client.get(path)
+        runner = MultiUserRunner(users, job, http_client=self.http_client, cache=self.cache)
+        return await runner.run()
+
+    def user(self, user_id: str, refresh_token: str) -> UserCredentials:
+        return UserCredentials(user_id, "client", "secret", refresh_token)
+
+    async def test_each_user_gets_own_data(self):
+        results = await self.run_users([self.user(user_id, token) for user_id, token in self.refresh_tokens.items()])
+
+        self.assertIsNotNone(results["A"])
+        self.assertNotEqual(results["A"], results["B"])
+        self.assertEqual(self.cache.stats["hits"], 0)
+
+    async def test_refresh_token_of_another_user_is_rejected(self):
+        results = await self.run_users([self.user("B", self.refresh_tokens["A"])])
+
+        self.assertIsNone(results["B"])
+        self.assertNotIn("sleep_by_date_range", self.simulator.stats["by_endpoint"])
+
+
+if __name__ == "__main__":
+    unittest.main()
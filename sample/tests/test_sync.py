@@ -0,0 +1,53 @@
+"""IncrementalSync と json_file_sink の確認。"""
+import datetime
+import json
+import os
+import tempfile
+import unittest
+
+from simulator import FitbitSimulator
+from sync import IncrementalSync, json_file_sink
+from utils.api import ApiClient
+from utils.date_range import record_date
+from utils.rate_limit import RateLimiter
+from utils.watermark import WatermarkStore
+
+
+class JsonFileSinkTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.simulator = FitbitSimulator()
+        self.simulator.add_user("A")
+        self.http_client = self.simulator.client()
+        self.store = WatermarkStore(os.path.join(self.directory.name, "watermarks.sqlite3"))
+
+    async def asyncTearDown(self):
+        await self.http_client.aclose()
+        self.directory.cleanup()
+
+    def sync(self) -> IncrementalSync:
+        api_client = ApiClient(
+            self.simulator.issue_access_token("A"), http_client=self.http_client, rate_limiter=RateLimiter(limit=10 ** 6)
+        )
+        sink = json_file_sink(os.path.join(self.directory.name, "out"))
+        return IncrementalSync(api_client, sink, "A", store=self.store, initial_days=10, activity_resources=["steps"])
+
+    async def test_refetched_days_replace_files(self):
+        first = await self.sync().run(metrics=["hrv"])
+        second = await self.sync().run(metrics=["hrv"])
+        # 2回目は確定前の直近の日だけを取得し直す
+        self.assertGreater(second["hrv"][0], first["hrv"][0])
+        self.assertEqual(second["hrv"][1], first["hrv"][1])
+
+        path = os.path.join(self.directory.name, "out", "A", "hrv")
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        expected = [(yesterday - datetime.timedelta(days=days)).isoformat() + ".json" for days in range(9, -1, -1)]
+        self.assertEqual(sorted(os.listdir(path)), expected)
+        for name in expected:
+            with open(os.path.join(path, name), encoding="utf-8") as f:
+                records = json.load(f)["hrv"]
+            self.assertEqual({record_date(record) for record in records}, {name[:10]})
+
+
+if __name__ == "__main__":
+    unittest.main()
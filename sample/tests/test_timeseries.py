@@ -0,0 +1,52 @@
+"""IntradaySeries.resample の集約結果の確認。"""
+import unittest
+
+from utils.timeseries import TYPECODE_FLOAT32, TYPECODE_UINT8, IntradaySeries
+
+
+def _series() -> IntradaySeries:
+    # 00:00:00-00:00:02 (1分目)、00:01:00 と 00:01:30 (2分目)、00:05:59 (6分目)
+    dataset = [
+        {"time": "00:00:00", "value": 60},
+        {"time": "00:00:01", "value": 62},
+        {"time": "00:00:02", "value": 67},
+        {"time": "00:01:00", "value": 80},
+        {"time": "00:01:30", "value": 70},
+        {"time": "00:05:59", "value": 90},
+    ]
+    return IntradaySeries.from_dataset("2025-05-31", dataset, 1)
+
+
+class ResampleTest(unittest.TestCase):
+    def test_aggregations(self):
+        expected = {
+            "mean": [63.0, 75.0, 90.0],
+            "sum": [189.0, 150.0, 90.0],
+            "min": [60, 70, 90],
+            "max": [67, 80, 90],
+            "first": [60, 80, 90],
+            "last": [67, 70, 90],
+        }
+        for how, values in expected.items():
+            with self.subTest(how=how):
+                result = _series().resample(60, how)
+                self.assertEqual(list(result.seconds), [0, 60, 300])
+                self.assertEqual(list(result.values), values)
+                self.assertEqual(result.interval, 60)
+
+    def test_value_types(self):
+        series = _series()
+        self.assertEqual(series.values.typecode, TYPECODE_UINT8)
+        self.assertEqual(series.resample(60, "mean").values.typecode, TYPECODE_FLOAT32)
+        self.assertEqual(series.resample(60, "max").values.typecode, TYPECODE_UINT8)
+
+    def test_empty_and_invalid(self):
+        self.assertEqual(len(IntradaySeries.from_dataset("2025-05-31", [], 1).resample(60)), 0)
+        with self.assertRaises(ValueError):
+            _series().resample(0)
+        with self.assertRaises(ValueError):
+            _series().resample(60, "median")
+
+
+if __name__ == "__main__":
+    unittest.main()
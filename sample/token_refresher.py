@@ -0,0 +1,80 @@
+import asyncio
+import time
+from typing import List, Optional
+
+import httpx
+
+from utils.api import ApiClient
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+# 有効期限のこの秒数前にリフレッシュする
+DEFAULT_REFRESH_MARGIN = 5 * 60
+# リフレッシュの間隔の下限 (失敗時や有効期間が短いトークンで連続実行しないため)
+MIN_REFRESH_INTERVAL = 10.0
+
+
+class TokenRefresher:
+    """
+    アクセストークンを有効期限の margin 秒前にバックグラウンドで更新し、
+    登録された ApiClient の Authorization ヘッダーを差し替える。
+    長時間のバックフィルでも、期限切れ直後のリクエストがリフレッシュを待たされることが無くなる。
+
+        async with TokenRefresher(client, http_client) as refresher:
+            refresher.attach(api_client)
+            ...
+    """
+    def __init__(self, client, http_client: httpx.AsyncClient, margin: float = DEFAULT_REFRESH_MARGIN):
+        """
+        :param client: client.Client (トークンの保存とリフレッシュを行う)
+        """
+        self.client = client
+        self.http_client = http_client
+        self.margin = margin
+        self._api_clients: List[ApiClient] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def attach(self, api_client: ApiClient) -> ApiClient:
+        self._api_clients.append(api_client)
+        return api_client
+
+    def seconds_until_refresh(self) -> float:
+        expires_at = self.client.tokens.get("expires_at") or 0
+        return max(MIN_REFRESH_INTERVAL, expires_at - self.margin - time.time())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.seconds_until_refresh())
+            try:
+                access_token = await self.client.get_access_token(self.http_client, min_validity=self.margin)
+            except Exception as e:
+                logger.exception("Background token refresh failed: %s", e)
+                continue
+            if not access_token:
+                logger.error("Background token refresh did not return an access token. Retrying later.")
+                continue
+            for api_client in self._api_clients:
+                api_client.set_access_token(access_token)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
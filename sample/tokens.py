@@ -1,14 +1,161 @@
+import json
+import os
+import tempfile
+from typing import Any, ClassVar, Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+DEFAULT_TOKEN_STORE_PATH = os.path.join(".state", "tokens.json")
+
+
+def atomic_write_text(path: str, text: str, mode: int = 0o600) -> None:
+    """同じディレクトリの一時ファイルに書き出してから置き換える。書き込み途中の状態は他から見えない。"""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class FileLock:
+    """flock によるプロセス間の排他ロック。fcntl が使えない環境ではプロセス内のみ有効。"""
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def acquire(self) -> None:
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class TokenStore:
+    """
+    ユーザーごとのトークン情報を JSON ファイルに永続化する。
+    書き込みは一時ファイルへの書き出し後に os.replace で置き換えるため、途中で中断されても壊れない。
+    ファイル全体の読み書きはストア全体のロックで、トークンのリフレッシュはユーザーごとのロックで他プロセスと排他する。
+
+    読み込んだ内容はファイルの inode・更新時刻・サイズと共にパスごとに保持し、ファイルが置き換えられるまで再利用する
+    (多数のユーザーが同じファイルを使う場合に、トークンを確認するたびにファイル全体を読み直さないため)。
+    """
+    # パス -> ((inode, 更新時刻, サイズ), 内容)。同じパスの TokenStore で共有する
+    _cache: ClassVar[Dict[str, Tuple[Tuple[int, int, int], Dict[str, Dict[str, Any]]]]] = {}
+
+    def __init__(self, path: str = DEFAULT_TOKEN_STORE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def lock(self, user_key: Optional[str] = None) -> FileLock:
+        """user_key を指定するとそのユーザー専用のロック、省略するとストア全体のロックを返す。"""
+        if user_key is None:
+            return FileLock(f"{self.path}.lock")
+        return FileLock(f"{self.path}.{user_key}.lock")
+
+    def _read_all(self) -> Dict[str, Dict[str, Any]]:
+        """ファイルの内容。返した辞書は共有されるため変更しないこと"""
+        try:
+            # 読み込みの前に確認するため、確認後に置き換えられても次の呼び出しで読み直される
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return {}
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cached = self._cache.get(self.path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as e:
+            logger.error("Token store %s is corrupted and will be ignored: %s", self.path, e)
+            return {}
+        self._cache[self.path] = (signature, data)
+        return data
+
+    def load(self, user_key: str) -> Dict[str, Any]:
+        return self._read_all().get(user_key, {})
+
+    def save(self, user_key: str, token_data: Dict[str, Any]) -> None:
+        """
+        user_key のトークン情報を置き換える。他のユーザーの情報はそのまま残す。
+        ストア全体のロックを待つため、イベントループからは asyncio.to_thread で呼び出す。
+        """
+        with self.lock():
+            data = dict(self._read_all())
+            data[user_key] = token_data
+            atomic_write_text(self.path, json.dumps(data, ensure_ascii=False, indent=2))
+
 
 class Tokens:
-    access_token = ""
-    expires_at = 0
-    expires_is = 0
-    scope = []
-    token_type = "Bearer"
-    user_id = ""
+    """1ユーザー分のトークン情報。store を渡すと、その内容で初期化される。"""
+    FIELDS = ("access_token", "refresh_token", "expires_at", "scope", "token_type", "user_id")
+
+    def __init__(self, store: Optional[TokenStore] = None, user_key: str = "-"):
+        self.access_token = ""
+        self.refresh_token = ""
+        self.expires_at = 0
+        self.scope = []
+        self.token_type = "Bearer"
+        self.user_id = ""
+        self.store = store
+        self.user_key = user_key
+        if store:
+            self.update(store.load(user_key))
 
-    def get(self, key: str) -> str:
-        getattr(self, key)
+    def get(self, key: str) -> Any:
+        return getattr(self, key, None)
 
-    def set(self, key: str, value: str):
+    def set(self, key: str, value: Any):
         setattr(self, key, value)
+
+    def update(self, token_data: Dict[str, Any]) -> None:
+        for key in self.FIELDS:
+            if token_data.get(key) is not None:
+                self.set(key, token_data[key])
+
+    def reload(self) -> None:
+        """他のタスク・プロセスが更新したトークンを読み込み直す。"""
+        if self.store:
+            self.update(self.store.load(self.user_key))
+
+    def persist(self) -> None:
+        """store に保存する。ファイルのロックを待つため、イベントループからは asyncio.to_thread で呼び出す。"""
+        if self.store:
+            self.store.save(self.user_key, self.to_dict())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: self.get(key) for key in self.FIELDS}
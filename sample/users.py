@@ -0,0 +1,127 @@
+import json
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
+
+from errors import ConfigError
+from tokens import FileLock, atomic_write_text
+from utils.logger import get_logger
+
+if TYPE_CHECKING:
+    from settings import Settings
+
+logger = get_logger(__name__)
+
+
+DEFAULT_USERS_PATH = "users.json"
+
+
+class UserCredentials:
+    """
+    1ユーザー分の認証情報。Settings と同じ属性を持つため、そのまま Client に渡せる。
+    ローテーションされたリフレッシュトークンは所属する UserRegistry のファイルに書き戻す。
+    """
+    def __init__(
+        self,
+        user_id: str,
+        client_id: str,
+        client_secret: str,
+        refresh_token: str,
+        scopes: Optional[List[str]] = None,
+        registry: Optional["UserRegistry"] = None
+    ):
+        self.user_id = user_id
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_token = refresh_token
+        self.scopes = scopes or ["sleep", "activity", "heartrate"]
+        self._registry = registry
+
+    def update_refresh_token(self, new_token: str) -> bool:
+        self.refresh_token = new_token
+        if self._registry is None:
+            return True
+        return self._registry.save()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "user_id": self.user_id,
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "refresh_token": self.refresh_token,
+            "scopes": self.scopes,
+        }
+
+
+class UserRegistry:
+    """
+    複数ユーザーの認証情報を JSON ファイルから読み込む。
+
+    [{"user_id": "ABC123", "refresh_token": "...", "client_id": "...", "client_secret": "..."}, ...]
+
+    client_id / client_secret を省略したユーザーには default_client_id / default_client_secret を使う。
+    """
+    def __init__(self, path: str = DEFAULT_USERS_PATH, default_client_id: Optional[str] = None, default_client_secret: Optional[str] = None):
+        self.path = path
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            raise ConfigError(f"Users file not found: {path}")
+        except json.JSONDecodeError as e:
+            raise ConfigError(f"Users file is not valid JSON ({path}): {e}")
+
+        self.users: List[UserCredentials] = []
+        for entry in entries:
+            client_id = entry.get("client_id", default_client_id)
+            client_secret = entry.get("client_secret", default_client_secret)
+            if not entry.get("user_id") or not entry.get("refresh_token") or not client_id or not client_secret:
+                raise ConfigError(f"Incomplete credentials in users file ({path}): {entry.get('user_id')}")
+            self.users.append(UserCredentials(
+                entry["user_id"], client_id, client_secret, entry["refresh_token"], entry.get("scopes"), registry=self
+            ))
+        logger.debug("Loaded %s users from %s.", len(self.users), path)
+
+    def save(self) -> bool:
+        """
+        現在の認証情報をファイルに書き戻す。
+        他のユーザーのリフレッシュと同時に書き込んでもローテーションされたトークンを失わないよう、
+        ファイルのロックを取ってから一意な一時ファイルに書き出して置き換える。ロックを待つため、イベントループからは
+        asyncio.to_thread で呼び出す。
+        """
+        try:
+            with FileLock(f"{self.path}.lock"):
+                text = json.dumps([user.to_dict() for user in self.users], ensure_ascii=False, indent=2)
+                atomic_write_text(self.path, text)
+            return True
+        except OSError as e:
+            logger.error("Failed to write users file (%s): %s", self.path, e)
+            return False
+
+    def get(self, user_id: str) -> Optional["UserCredentials"]:
+        for user in self.users:
+            if user.user_id == user_id:
+                return user
+        return None
+
+    def __iter__(self):
+        return iter(self.users)
+
+    def __len__(self):
+        return len(self.users)
+
+
+def resolve_credentials(user_id: str = "-", users_path: Optional[str] = None) -> Union[UserCredentials, "Settings"]:
+    """
+    1人のユーザーの認証情報。users_path を指定した場合はそのファイルの user_id、省略した場合は .env の認証情報を返す。
+    .env の認証情報は認証済みユーザー ("-") のものなので、users_path を省略した場合に他の user_id は指定できない。
+    """
+    from settings import get_settings
+
+    settings = get_settings()
+    if users_path is None:
+        if user_id != "-":
+            raise ConfigError(f"User {user_id} requires a users file; the .env credentials are for the authenticated user ('-').")
+        return settings
+    user = UserRegistry(users_path, settings.client_id, settings.client_secret).get(user_id)
+    if user is None:
+        raise ConfigError(f"User {user_id} is not in {users_path}")
+    return user
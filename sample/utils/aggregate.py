@@ -0,0 +1,247 @@
+import warnings
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+# 日付範囲のレスポンスで値を取り出す位置 (メトリクスごと)
+VALUE_PATHS = {
+    "hrv": ("value", "dailyRmssd"),
+    "spo2": ("value", "avg"),
+    "temp_skin": ("value", "nightlyRelative"),
+    "heart_rate": ("value", "restingHeartRate"),
+}
+
+# 週の始まり (月曜日)。1970-01-05 は月曜日
+_MONDAY_EPOCH = np.datetime64("1970-01-05", "D")
+
+
+def _records(data: Any) -> List[Dict[str, Any]]:
+    """{"activities-steps": [...]} / {"hrv": [...]} / [...] のいずれからもレコードのリストを取り出す。"""
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        for value in data.values():
+            if isinstance(value, list):
+                return value
+    return []
+
+
+def _lookup(record: Dict[str, Any], path: Sequence[str]) -> Any:
+    value: Any = record
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def _to_float_array(raw: List[Any]) -> np.ndarray:
+    """文字列・数値・None の混在したリストを float64 配列に一括変換する。変換できない値は NaN。"""
+    try:
+        return np.asarray([np.nan if v is None else v for v in raw], dtype=np.float64)
+    except (TypeError, ValueError):
+        # 不正な値が混ざっている場合のみ1件ずつ変換する
+        values = np.full(len(raw), np.nan)
+        for i, v in enumerate(raw):
+            try:
+                values[i] = float(v)
+            except (TypeError, ValueError):
+                pass
+        return values
+
+
+def period_starts(dates: np.ndarray, period: str) -> np.ndarray:
+    """
+    各日付が属する期間の開始日を返す。
+    :param period: "D" (日)、"W" (月曜始まりの週)、"M" (月)
+    """
+    if period == "D":
+        return dates
+    if period == "W":
+        return dates - (dates - _MONDAY_EPOCH).astype(np.int64) % 7
+    if period == "M":
+        return dates.astype("datetime64[M]").astype("datetime64[D]")
+    raise ValueError(f"Unsupported period: {period}. Supported: D, W, M")
+
+
+def _group_boundaries(keys: np.ndarray) -> np.ndarray:
+    """昇順に並んだ keys の各グループの先頭インデックス"""
+    return np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+
+
+class DailySeries:
+    """
+    1ユーザー分の日毎の値 (歩数、消費カロリー、RMSSD など)。
+    日付は datetime64[D]、値は float64 で保持し、欠損や変換できない値は NaN になる。
+    """
+    def __init__(self, dates: np.ndarray, values: np.ndarray):
+        order = np.argsort(dates, kind="stable")
+        self.dates = dates[order]
+        self.values = values[order]
+
+    @classmethod
+    def from_response(
+        cls,
+        data: Any,
+        value_path: Sequence[str] = ("value",),
+        date_key: str = "dateTime"
+    ) -> "DailySeries":
+        """
+        日付範囲のレスポンスから生成する。文字列の値 ("1234") はまとめて数値に変換する。
+
+            DailySeries.from_response(steps_data)                                  # activities-steps
+            DailySeries.from_response(hrv_data, VALUE_PATHS["hrv"])                # hrv の dailyRmssd
+        """
+        records = [record for record in _records(data) if isinstance(record, dict) and record.get(date_key)]
+        dates = np.asarray([record[date_key][:10] for record in records], dtype="datetime64[D]")
+        values = _to_float_array([_lookup(record, value_path) for record in records])
+        return cls(dates, values)
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def between(self, start_date: str, end_date: str) -> "DailySeries":
+        """start_date から end_date まで (両端を含む)"""
+        low = np.searchsorted(self.dates, np.datetime64(start_date, "D"), side="left")
+        high = np.searchsorted(self.dates, np.datetime64(end_date, "D"), side="right")
+        return DailySeries(self.dates[low:high], self.values[low:high])
+
+    # --- 集計 ---
+    def summary(self, percentiles: Sequence[float] = ()) -> Dict[str, Any]:
+        return summarize(self.values, percentiles)
+
+    def rollup(self, period: str = "W") -> Dict[str, np.ndarray]:
+        """
+        期間ごとに集計する。
+        :return: {"start": 期間の開始日, "sum", "mean", "days" (値のある日数), "nonzero_days"}
+        """
+        if len(self) == 0:
+            empty = np.asarray([], dtype=np.float64)
+            return {"start": np.asarray([], dtype="datetime64[D]"), "sum": empty, "mean": empty, "days": empty, "nonzero_days": empty}
+        keys = period_starts(self.dates, period)
+        starts = _group_boundaries(keys)
+        present = ~np.isnan(self.values)
+        sums = np.add.reduceat(np.where(present, self.values, 0.0), starts)
+        days = np.add.reduceat(present.astype(np.int64), starts)
+        nonzero = np.add.reduceat((present & (self.values != 0)).astype(np.int64), starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / days
+        return {"start": keys[starts], "sum": sums, "mean": means, "days": days, "nonzero_days": nonzero}
+
+
+def summarize(values: np.ndarray, percentiles: Sequence[float] = ()) -> Dict[str, Any]:
+    """
+    1次元の値の集計。NaN (欠損) は除いて計算する。
+    :return: {"days", "total", "mean", "min", "max", "nonzero_days", "nonzero_mean", "p<q>"...}
+             値が1つも無い場合の mean などは None
+    """
+    present = values[~np.isnan(values)]
+    nonzero = present[present != 0]
+    result: Dict[str, Any] = {
+        "days": int(present.size),
+        "total": float(present.sum()),
+        "mean": float(present.mean()) if present.size else None,
+        "min": float(present.min()) if present.size else None,
+        "max": float(present.max()) if present.size else None,
+        "nonzero_days": int(nonzero.size),
+        # 実際に記録があった日 (値が0でない日) だけの平均
+        "nonzero_mean": float(nonzero.mean()) if nonzero.size else None,
+    }
+    if percentiles:
+        points = np.percentile(present, percentiles) if present.size else [None] * len(percentiles)
+        for q, point in zip(percentiles, points):
+            result[f"p{q:g}"] = None if point is None else float(point)
+    return result
+
+
+def heart_rate_zone_minutes(data: Any) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    """
+    心拍数の日付範囲レスポンス (activities-heart) からゾーンごとの滞在時間を取り出す。
+    :return: (日付, ゾーン名, [日数 x ゾーン数] の分数の行列)
+    """
+    records = [record for record in _records(data) if isinstance(record, dict) and record.get("dateTime")]
+    zone_names: List[str] = []
+    for record in records:
+        for zone in _lookup(record, ("value", "heartRateZones")) or []:
+            if zone.get("name") not in zone_names:
+                zone_names.append(zone.get("name"))
+    minutes = np.full((len(records), len(zone_names)), np.nan)
+    for i, record in enumerate(records):
+        for zone in _lookup(record, ("value", "heartRateZones")) or []:
+            if zone.get("minutes") is not None:
+                minutes[i, zone_names.index(zone.get("name"))] = zone["minutes"]
+    dates = np.asarray([record["dateTime"][:10] for record in records], dtype="datetime64[D]")
+    return dates, zone_names, minutes
+
+
+class UserMatrix:
+    """
+    複数ユーザーの日毎の値を [ユーザー数 x 日数] の行列にまとめ、全ユーザー分を一括で集計する。
+    データの無い日は NaN。
+    """
+    def __init__(self, series_by_user: Dict[str, DailySeries], start_date: str, end_date: str):
+        self.user_ids = list(series_by_user.keys())
+        self.dates = np.arange(np.datetime64(start_date, "D"), np.datetime64(end_date, "D") + 1)
+        self.values = np.full((len(self.user_ids), len(self.dates)), np.nan)
+        for row, user_id in enumerate(self.user_ids):
+            series = series_by_user[user_id].between(start_date, end_date)
+            columns = (series.dates - self.dates[0]).astype(np.int64)
+            self.values[row, columns] = series.values
+
+    @classmethod
+    def from_responses(
+        cls,
+        responses: Dict[str, Any],
+        start_date: str,
+        end_date: str,
+        value_path: Sequence[str] = ("value",)
+    ) -> "UserMatrix":
+        """{ユーザーID: 日付範囲のレスポンス} から生成する。"""
+        return cls(
+            {user_id: DailySeries.from_response(data, value_path) for user_id, data in responses.items() if data is not None},
+            start_date, end_date
+        )
+
+    def summary(self, percentiles: Sequence[float] = ()) -> Dict[str, np.ndarray]:
+        """ユーザーごとの集計 (各値は user_ids と同じ順の配列)"""
+        present = ~np.isnan(self.values)
+        filled = np.where(present, self.values, 0.0)
+        days = present.sum(axis=1)
+        nonzero_days = (present & (self.values != 0)).sum(axis=1)
+        totals = filled.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result = {
+                "days": days,
+                "total": totals,
+                "mean": totals / days,
+                "nonzero_days": nonzero_days,
+                "nonzero_mean": totals / nonzero_days,
+            }
+        if percentiles and self.values.size:
+            # 全て NaN の行は NaN になる (その際の RuntimeWarning は抑制する)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                points = np.nanpercentile(self.values, percentiles, axis=1)
+            for q, point in zip(percentiles, points):
+                result[f"p{q:g}"] = point
+        return result
+
+    def rollup(self, period: str = "W") -> Dict[str, np.ndarray]:
+        """
+        期間ごとに全ユーザー分を集計する。
+        :return: {"start": 期間の開始日, "sum" / "mean" / "days" / "nonzero_days": [ユーザー数 x 期間数]}
+        """
+        keys = period_starts(self.dates, period)
+        starts = _group_boundaries(keys)
+        present = ~np.isnan(self.values)
+        sums = np.add.reduceat(np.where(present, self.values, 0.0), starts, axis=1)
+        days = np.add.reduceat(present.astype(np.int64), starts, axis=1)
+        nonzero = np.add.reduceat((present & (self.values != 0)).astype(np.int64), starts, axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / days
+        return {"start": keys[starts], "sum": sums, "mean": means, "days": days, "nonzero_days": nonzero}
+
+
+def format_date(value: np.datetime64) -> str:
+    return str(value.astype("datetime64[D]"))
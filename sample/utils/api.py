@@ -1,30 +1,96 @@
+import asyncio
+import contextlib
+import time
 import httpx
-from typing import Any, Dict, Optional
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Sequence
 
-from utils.logger import logger
+from utils.logger import get_logger
 from errors import APIError, APIUnauthorizedError, APIForbiddenError, APIRequestSetupError, APIHttpError, APICommunicationError
 from constants import API_BASE_URL
+from utils.rate_limit import RateLimiter, HEADER_RATE_LIMIT_REMAINING, HEADER_RATE_LIMIT_RESET
+from utils.retry import RetryPolicy
+from utils.cache import ResponseCache, MISS
+from utils.transport import get_http_client
+from utils.json_stream import iter_json_array, JSONStreamError
+from utils.planner import SupersetPlanner
+from utils.metrics import Metrics, get_metrics
+from services.endpoints import Endpoint, find_endpoint
+
+logger = get_logger(__name__)
+
+
+# 計測が無効な場合のスパン (何もしない)
+_NO_SPAN = contextlib.nullcontext()
 
 
 class ApiClient:
     """
     汎用的な非同期APIクライアント。
     HTTPリクエストの送信、認証ヘッダーの付与、エラーハンドリングを行う。
+    リクエストはユーザーごとの RateLimiter を通して発行され、Fitbit のレート制限を超えないよう調整される。
+    429/5xx や通信エラーは RetryPolicy に従って再試行される (既定では GET などの冪等なメソッドのみ)。
+    cache を渡すと、GET のレスポンスは ResponseCache に保存・再利用される。キーには user_id を含むため、
+    キャッシュを複数ユーザーで共有する場合は user_id にアクセストークンの所有者を渡すこと。
+    on_unauthorized を渡すと、401 を受け取った際にそれで新しいトークンを取得して1回だけ再試行する。
+    同じ GET が同時に発行された場合は1回だけ送信し、結果 (同じオブジェクト) を共有する。
+    metrics (省略時は utils.metrics.configure_metrics で有効にしたプロセス共有の計測) があれば、
+    エンドポイントごとの所要時間・転送量・ステータス・再試行・キャッシュヒットとレート制限の残数を記録する。
     """
-    def __init__(self, access_token: str, base_url: str = API_BASE_URL, http_client: Optional[httpx.AsyncClient] = None):
+    def __init__(
+        self,
+        access_token: str,
+        base_url: str = API_BASE_URL,
+        http_client: Optional[httpx.AsyncClient] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        cache: Optional[ResponseCache] = None,
+        on_unauthorized: Optional[Callable[[str], Awaitable[Optional[str]]]] = None,
+        planner: Optional[SupersetPlanner] = None,
+        metrics: Optional[Metrics] = None,
+        user_id: str = "-"
+    ):
         if not access_token:
             logger.error("Access token is missing for ApiClient initialization.")
             raise APIRequestSetupError("Access token is required for ApiClient.")
 
         self.access_token = access_token
         self.base_url = base_url
-        self._http_client = http_client if http_client else httpx.AsyncClient()
-        self._should_close_client = http_client is None
+        # 省略時はプロセス共有の長寿命クライアントを使う (共有クライアントは close しない)
+        self._http_client = http_client if http_client else get_http_client()
+        # 同じユーザーの ApiClient 間で予算を共有する場合は同じ RateLimiter を渡す
+        self.rate_limiter = rate_limiter if rate_limiter else RateLimiter()
+        self.retry_policy = retry_policy if retry_policy else RetryPolicy()
+        self.cache = cache
+        # 拒否されたアクセストークンを受け取り、新しいアクセストークン (取得できなければ None) を返す
+        self.on_unauthorized = on_unauthorized
+        # 日付範囲のレスポンスに含まれる単日の GET は、範囲のレスポンスから切り出して応答する
+        self.planner = planner if planner else SupersetPlanner()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # 実行ごとのリクエスト統計 (requests は再試行を含む送信回数、coalesced は実行中のリクエストに相乗りした回数、
+        # derived は範囲のレスポンスから応答した回数)
+        self.stats = {"requests": 0, "retries": 0, "retries_exhausted": 0, "coalesced": 0, "derived": 0}
+        # エンドポイント (services.endpoints の名前) ごとのレート制限の消費量
+        self.cost_by_endpoint: Dict[str, int] = {}
+        # 無効な場合は None (計測のコストはこの判定だけになる)
+        self.metrics = metrics if metrics else get_metrics()
+        # アクセストークンの所有者。キャッシュ・相乗りのキーとレート制限の残数のラベルに使う
+        self.user_id = user_id
         self._default_headers = {
             "Authorization": f"Bearer {self.access_token}",
             "Accept": "application/json"
         }
-        logger.debug(f"ApiClient initialized for base_url: {self.base_url}")
+        logger.debug("ApiClient initialized for base_url: %s", self.base_url)
+
+    def set_access_token(self, access_token: str) -> None:
+        """
+        以降のリクエストで使うアクセストークンを差し替える。
+        送信中のリクエストはヘッダーをコピー済みなので影響を受けない。
+        """
+        if not access_token or access_token == self.access_token:
+            return
+        self.access_token = access_token
+        self._default_headers = {**self._default_headers, "Authorization": f"Bearer {access_token}"}
+        logger.debug("ApiClient access token replaced.")
 
     async def request(
         self,
@@ -36,56 +102,334 @@ class ApiClient:
     ) -> Any:
         url = f"{self.base_url}{endpoint}"
         headers = self._default_headers.copy()
+        request_token = self.access_token
         if custom_headers:
             headers.update(custom_headers)
 
-        logger.debug(f"Sending {method} request to {url} with params: {params}, data: {json_data}")
+        cache_key = None
+        spec = find_endpoint(endpoint)
+        if self.cache is not None and method == "GET" and (spec is None or spec.cacheable):
+            cache_key = ResponseCache.make_key(self.user_id, endpoint, params)
+            cached = self.cache.get(cache_key)
+            if self.metrics is not None:
+                self.metrics.cache.inc(_endpoint_name(spec), "miss" if cached is MISS else "hit")
+            if cached is not MISS:
+                logger.debug("Cache hit for %s %s.", method, url)
+                if not params and self.planner is not None:
+                    done = asyncio.get_running_loop().create_future()
+                    done.set_result(cached)
+                    self.planner.register(endpoint, done)
+                return cached
+
+        if method != "GET" or custom_headers:
+            return await self._request_with_retries(method, endpoint, url, headers, request_token, params, json_data, cache_key)
+
+        if not params and self.planner is not None:
+            derived = await self._derive_from_superset(endpoint)
+            if derived is not MISS:
+                return derived
+
+        # 同じ GET が実行中であれば、その結果を共有する
+        coalesce_key = ResponseCache.make_key(self.user_id, endpoint, params)
+        inflight = self._inflight.get(coalesce_key)
+        if inflight is not None:
+            self.stats["coalesced"] += 1
+            if self.metrics is not None:
+                self.metrics.shared.inc(_endpoint_name(spec), "coalesced")
+            logger.debug("Joining in-flight request for %s %s.", method, url)
+            return await asyncio.shield(inflight)
+
+        inflight = asyncio.ensure_future(
+            self._request_with_retries(method, endpoint, url, headers, request_token, params, json_data, cache_key)
+        )
+        self._inflight[coalesce_key] = inflight
+        inflight.add_done_callback(lambda future: self._finish_inflight(coalesce_key, future))
+        if not params and self.planner is not None:
+            self.planner.register(endpoint, inflight)
+        # 待っている側がキャンセルされても、他の待機者のためにリクエスト自体は継続する
+        return await asyncio.shield(inflight)
+
+    def _finish_inflight(self, key: str, future: "asyncio.Future[Any]") -> None:
+        self._inflight.pop(key, None)
+        if not future.cancelled():
+            # 待機者が全てキャンセルされた場合に "exception was never retrieved" とならないよう取り出しておく
+            future.exception()
+
+    async def _derive_from_superset(self, endpoint: str) -> Any:
+        """取得済み・取得中の日付範囲レスポンスから単日のレスポンスを作る。使えなければ MISS を返す。"""
+        match = self.planner.lookup(endpoint)
+        if match is None:
+            return MISS
+        future, extract, date = match
+        try:
+            response = await asyncio.shield(future)
+        except Exception:
+            # 範囲の取得に失敗した場合は単日のエンドポイントを直接呼ぶ
+            return MISS
+        if response is None:
+            return MISS
+        self.stats["derived"] += 1
+        if self.metrics is not None:
+            self.metrics.shared.inc(_endpoint_name(find_endpoint(endpoint)), "derived")
+        return extract(response, date)
+
+    async def _request_with_retries(
+        self,
+        method: str,
+        endpoint: str,
+        url: str,
+        headers: Dict[str, str],
+        request_token: str,
+        params: Optional[Dict[str, Any]],
+        json_data: Optional[Dict[str, Any]],
+        cache_key: Optional[str]
+    ) -> Any:
+        """401 時の再認証と RetryPolicy による再試行を含めてリクエストを実行し、成功した GET の結果をキャッシュする。"""
+        logger.debug("Sending %s request to %s with params: %s, data: %s", method, url, params, json_data)
+
+        spec = find_endpoint(endpoint)
+        attempt = 0
+        reauthenticated = False
+        while True:
+            try:
+                self._charge(spec)
+                result = await self._send(method, url, headers, params, json_data, spec)
+                if cache_key is not None:
+                    self.cache.set(cache_key, endpoint, result, settle_days=spec.settle_days if spec else None)
+                return result
+            except APIUnauthorizedError:
+                if reauthenticated:
+                    raise
+                reauthenticated = True
+                new_token = await self._reauthenticate(method, url, request_token, headers, spec)
+                if not new_token:
+                    raise
+                request_token = new_token
+            except (APIHttpError, APICommunicationError) as e:
+                if not await self._wait_for_retry(method, url, attempt, e, spec):
+                    raise
+                attempt += 1
+
+    async def _reauthenticate(
+        self,
+        method: str,
+        url: str,
+        rejected_token: str,
+        headers: Dict[str, str],
+        spec: Optional[Endpoint]
+    ) -> Optional[str]:
+        """
+        401 を受け取ったリクエストを1回だけ再試行するため、on_unauthorized でアクセストークンを取得し直して headers を書き換える。
+        :return: 新しいアクセストークン。再認証できない場合は None (呼び出し元は 401 のエラーをそのまま送出する)
+        """
+        if self.on_unauthorized is None:
+            return None
+        if self.metrics is not None:
+            self.metrics.retries.inc(_endpoint_name(spec), "unauthorized")
+        new_token = await self.on_unauthorized(rejected_token)
+        if not new_token:
+            return None
+        self.set_access_token(new_token)
+        headers["Authorization"] = f"Bearer {new_token}"
+        logger.info("Retrying %s %s with a refreshed access token.", method, url)
+        return new_token
+
+    async def stream_json_array(
+        self,
+        endpoint: str,
+        path: Sequence[str],
+        params: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Any]:
+        """
+        GET のレスポンスボディを受信しながら、path のキーが指す JSON 配列の要素を1つずつ返す。
+        レスポンス全体をバッファしないため、1秒単位の日中データのような大きな配列でもメモリ使用量が一定に保たれる。
+        レート制限・認証の再試行・RetryPolicy は request() と同様に適用されるが、
+        要素を返し始めた後に失敗した場合は重複を避けるため再試行せずに例外を送出する。
+        結果はキャッシュしない。
+        """
+        method = "GET"
+        url = f"{self.base_url}{endpoint}"
+        headers = self._default_headers.copy()
+        request_token = self.access_token
+        logger.debug("Streaming %s request to %s with params: %s", method, url, params)
+
+        spec = find_endpoint(endpoint)
+        attempt = 0
+        reauthenticated = False
+        yielded = False
+        while True:
+            try:
+                self.stats["requests"] += 1
+                self._charge(spec)
+                await self.rate_limiter.acquire()
+                released = False
+                started = time.perf_counter() if self.metrics is not None else 0.0
+                streamed: Optional[httpx.Response] = None
+                try:
+                    async with self._http_client.stream(method, url, headers=headers, params=params) as response:
+                        self.rate_limiter.release(response.headers)
+                        released = True
+                        streamed = response
+                        self._check_rate_limited(response)
+                        if response.is_error:
+                            await response.aread()
+                            raise _http_error(method, url, response)
+                        if response.status_code == 204:
+                            logger.debug("Request to %s returned 204 No Content.", url)
+                            return
+                        async for item in iter_json_array(response.aiter_bytes(), path):
+                            yielded = True
+                            yield item
+                        return
+                finally:
+                    if not released:
+                        self.rate_limiter.release(None)
+                    if self.metrics is not None:
+                        # ストリーミングは受信完了 (または中断) までの時間を記録する
+                        self._record(spec, method, started, streamed)
+            except httpx.RequestError as e:
+                logger.error("API Request (Communication) Error for %s %s: %s", method, url, e, exc_info=True)
+                error = APICommunicationError(f"Failed to connect to API: {type(e).__name__}", underlying_exception=e)
+                if yielded or not await self._wait_for_retry(method, url, attempt, error, spec):
+                    raise error
+                attempt += 1
+            except APIUnauthorizedError:
+                if reauthenticated:
+                    raise
+                reauthenticated = True
+                new_token = await self._reauthenticate(method, url, request_token, headers, spec)
+                if not new_token:
+                    raise
+                request_token = new_token
+            except APIHttpError as e:
+                if not await self._wait_for_retry(method, url, attempt, e, spec):
+                    raise
+                attempt += 1
+            except JSONStreamError as e:
+                raise APIError(f"Malformed streaming response from {url}: {e}")
+
+    async def _wait_for_retry(self, method: str, url: str, attempt: int, error: APIError, spec: Optional[Endpoint] = None) -> bool:
+        """RetryPolicy に従って再試行するか判断し、再試行する場合はバックオフの分だけ待機して True を返す。"""
+        status_code = error.status_code if isinstance(error, APIHttpError) else None
+        if not self.retry_policy.should_retry(method, attempt, status_code):
+            if attempt > 0:
+                self.stats["retries_exhausted"] += 1
+            return False
+        retry_after = error.retry_after if isinstance(error, APIHttpError) else None
+        delay = self.retry_policy.compute_delay(attempt, retry_after)
+        self.stats["retries"] += 1
+        if self.metrics is not None:
+            self.metrics.retries.inc(_endpoint_name(spec), str(status_code) if status_code else "communication")
+        logger.info("Retrying %s %s in %.2fs (attempt %s/%s) after: %s", method, url, delay, attempt + 1, self.retry_policy.max_retries, error)
+        # asyncio.sleep なので、待機中も他のリクエストはイベントループ上で進行する
+        await asyncio.sleep(delay)
+        return True
+
+    def _charge(self, spec: Optional[Endpoint]) -> None:
+        """エンドポイントごとのレート制限の消費量を記録する。"""
+        name = _endpoint_name(spec)
+        self.cost_by_endpoint[name] = self.cost_by_endpoint.get(name, 0) + (spec.cost if spec else 1)
 
+    def _record(
+        self,
+        spec: Optional[Endpoint],
+        method: str,
+        started: float,
+        response: Optional[httpx.Response],
+        span: Any = None
+    ) -> None:
+        """1回分の送信の計測値を記録する (計測が有効な場合のみ呼ばれる)。レスポンスが無い場合は通信エラーとして記録する。"""
+        metrics = self.metrics
+        name = _endpoint_name(spec)
+        metrics.request_duration.observe(name, method, value=time.perf_counter() - started)
+        if response is None:
+            metrics.requests.inc(name, method, "error")
+            return
+        status = str(response.status_code)
+        metrics.requests.inc(name, method, status)
+        metrics.bytes_received.inc(name, amount=_received_bytes(response))
+        sent = response.request.headers.get("Content-Length")
+        if sent:
+            metrics.bytes_sent.inc(name, amount=int(sent))
+        remaining = _parse_seconds(response.headers.get(HEADER_RATE_LIMIT_REMAINING))
+        if remaining is not None:
+            metrics.rate_limit_remaining.set(self.user_id, value=remaining)
+        reset = _parse_seconds(response.headers.get(HEADER_RATE_LIMIT_RESET))
+        if reset is not None:
+            metrics.rate_limit_reset.set(self.user_id, value=reset)
+        if span is not None:
+            span.set_attribute("http.response.status_code", response.status_code)
+
+    def _check_rate_limited(self, response: httpx.Response) -> None:
+        if response.status_code == 429:
+            # 予算の見積もりがずれていた場合でも、リセットまで後続のリクエストを保留する
+            self.rate_limiter.exhaust(_parse_seconds(response.headers.get(HEADER_RATE_LIMIT_RESET)))
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        headers: Dict[str, str],
+        params: Optional[Dict[str, Any]],
+        json_data: Optional[Dict[str, Any]],
+        spec: Optional[Endpoint] = None
+    ) -> Any:
+        """1回分のリクエストを送信し、レスポンスを解釈する。"""
+        self.stats["requests"] += 1
         try:
-            response = await self._http_client.request(
-                method,
-                url,
-                headers=headers,
-                params=params,
-                json=json_data
-            )
+            await self.rate_limiter.acquire()
+            response = None
+            metrics = self.metrics
+            span = _NO_SPAN
+            if metrics is not None:
+                started = time.perf_counter()
+                if metrics.tracer is not None:
+                    span = metrics.span(f"{method} {_endpoint_name(spec)}", {
+                        "http.request.method": method,
+                        "url.template": spec.path if spec else "",
+                        "fitbit.endpoint": _endpoint_name(spec),
+                    })
+            with span as current_span:
+                try:
+                    response = await self._http_client.request(
+                        method,
+                        url,
+                        headers=headers,
+                        params=params,
+                        json=json_data
+                    )
+                finally:
+                    self.rate_limiter.release(response.headers if response is not None else None)
+                    if metrics is not None:
+                        self._record(spec, method, started, response, current_span)
+
+            self._check_rate_limited(response)
             response.raise_for_status()
 
             if response.status_code == 204:
-                logger.debug(f"Request to {url} returned 204 No Content.")
+                logger.debug("Request to %s returned 204 No Content.", url)
                 return None
 
             if 'application/json' in response.headers.get('Content-Type', ''):
                 if response.content: # レスポンスボディが空でないことを確認
                     return response.json()
                 else:
-                    logger.debug(f"Request to {url} returned JSON content type but empty body.")
+                    logger.debug("Request to %s returned JSON content type but empty body.", url)
                     return None 
             else:
-                logger.debug(f"Request to {url} returned non-JSON content type: {response.headers.get('Content-Type')}. Returning raw text.")
+                logger.debug("Request to %s returned non-JSON content type: %s. Returning raw text.", url, response.headers.get('Content-Type'))
                 return response.text
 
         except httpx.HTTPStatusError as e:
-            status_code = e.response.status_code
-            response_text = e.response.text
-            logger.warning(
-                f"API HTTP Error: Status {status_code} for {method} {url}. Response: {response_text}",
-            )
-            if status_code == 401:
-                raise APIUnauthorizedError(response_text=response_text)
-            elif status_code == 403:
-                raise APIForbiddenError(response_text=response_text)
-            else:
-                raise APIHttpError(status_code=status_code, response_text=response_text)
+            raise _http_error(method, url, e.response)
         except httpx.RequestError as e:
-            logger.error(f"API Request (Communication) Error for {method} {url}: {e}", exc_info=True)
+            logger.error("API Request (Communication) Error for %s %s: %s", method, url, e, exc_info=True)
             raise APICommunicationError(f"Failed to connect to API: {type(e).__name__}", underlying_exception=e)
         except Exception as e: # JSONDecodeErrorなどもここに該当する可能性
-            logger.exception(f"An unexpected error occurred during API request to {url}: {e}")
+            logger.exception("An unexpected error occurred during API request to %s: %s", url, e)
             # APIErrorにラップして、エラーの発生源がAPIClientであることを示す
             raise APIError(f"An unexpected error occurred in APIClient: {type(e).__name__} - {e}")
 
-
     async def get(self, endpoint: str, params: Optional[Dict[str, Any]] = None, **kwargs) -> Any:
         return await self.request("GET", endpoint, params=params, **kwargs)
 
@@ -99,12 +443,53 @@ class ApiClient:
         return await self.request("DELETE", endpoint, **kwargs)
 
     async def close(self):
-        if self._http_client and self._should_close_client:
-            await self._http_client.aclose()
-            logger.debug("Internal httpx.AsyncClient closed.")
+        """
+        ApiClient は httpx.AsyncClient を所有しない (渡されたものかプロセス共有のものを使う) ため、何もしない。
+        共有クライアントは utils.transport.close_http_client で閉じる。
+        """
 
     async def __aenter__(self):
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self.close()
+
+
+def _http_error(method: str, url: str, response: httpx.Response) -> APIError:
+    """エラーレスポンスを対応する APIError に変換する。"""
+    status_code = response.status_code
+    response_text = response.text
+    logger.warning(
+        "API HTTP Error: Status %s for %s %s. Response: %s", status_code, method, url, response_text,
+    )
+    if status_code == 401:
+        return APIUnauthorizedError(response_text=response_text)
+    elif status_code == 403:
+        return APIForbiddenError(response_text=response_text)
+    retry_after = _parse_seconds(response.headers.get("Retry-After"))
+    if retry_after is None and status_code == 429:
+        retry_after = _parse_seconds(response.headers.get(HEADER_RATE_LIMIT_RESET))
+    return APIHttpError(status_code=status_code, response_text=response_text, retry_after=retry_after)
+
+
+def _received_bytes(response: httpx.Response) -> int:
+    """受信したボディのバイト数 (転送時のサイズ。分からない場合は読み込んだボディのサイズ)"""
+    if response.num_bytes_downloaded:
+        return response.num_bytes_downloaded
+    try:
+        return len(response.content)
+    except httpx.ResponseNotRead:
+        return 0
+
+
+def _endpoint_name(spec: Optional[Endpoint]) -> str:
+    return spec.name if spec else "other"
+
+
+def _parse_seconds(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
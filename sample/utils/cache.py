@@ -0,0 +1,142 @@
+import datetime
+import json
+import os
+import re
+import sqlite3
+import time
+from typing import Any, Dict, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "responses.sqlite3")
+
+_DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# キャッシュに存在しないことを表す番兵 (None は 204 No Content のキャッシュとして使う)
+MISS = object()
+
+
+class ResponseCache:
+    """
+    SQLite に保存する永続的なレスポンスキャッシュ。キーはデータの所有者 (ユーザー)・エンドポイント・クエリパラメータ。
+    エンドポイントのパスは認証済みユーザー ("/user/-/") なので、所有者をキーに含めないと
+    複数ユーザーで共有したキャッシュが他のユーザーのレスポンスを返してしまう。
+
+    Fitbit のデータはデバイスの同期が済めば変化しないため、
+    settle_days 日より前の日付だけを対象とするレスポンスは期限なし (不変) として保存し、
+    それ以外 (直近の日付や 'today' を含むもの) は recent_ttl 秒だけ保持する。
+    エントリ数が max_entries を超えると、最終アクセスが古いものから削除する。
+    """
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        settle_days: int = 3,
+        recent_ttl: float = 15 * 60,
+        max_entries: int = 50_000
+    ):
+        self.path = path
+        self.settle_days = settle_days
+        self.recent_ttl = recent_ttl
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                expires_at REAL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(user_id: str, endpoint: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """
+        :param user_id: データの所有者 (アクセストークンのユーザー)
+        """
+        key = f"{user_id}:{endpoint}"
+        if not params:
+            return key
+        return f"{key}?{json.dumps(params, sort_keys=True, default=str)}"
+
+    def expires_at_for(self, endpoint: str, now: Optional[float] = None, settle_days: Optional[int] = None) -> Optional[float]:
+        """
+        エンドポイントが対象とする日付から有効期限を決める。
+        確定済みの日付のみを対象とする場合は None (期限なし) を返す。
+        :param settle_days: エンドポイント固有の確定までの日数 (省略時はキャッシュの既定値)
+        """
+        now = time.time() if now is None else now
+        settle_days = self.settle_days if settle_days is None else settle_days
+        dates = _DATE_PATTERN.findall(endpoint)
+        if dates and "today" not in endpoint:
+            settled_before = datetime.date.today() - datetime.timedelta(days=settle_days)
+            if max(dates) < settled_before.strftime("%Y-%m-%d"):
+                return None
+        return now + self.recent_ttl
+
+    def get(self, key: str) -> Any:
+        """キャッシュされたレスポンスを返す。無い場合・期限切れの場合は MISS を返す。"""
+        now = time.time()
+        row = self._conn.execute("SELECT body, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            self.stats["misses"] += 1
+            return MISS
+        self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+        self.stats["hits"] += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, endpoint: str, value: Any, settle_days: Optional[int] = None) -> None:
+        now = time.time()
+        expires_at = self.expires_at_for(endpoint, now, settle_days)
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO responses (key, body, expires_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), expires_at, now)
+        )
+        if cursor.rowcount:
+            self._size += 1
+        else:
+            self._conn.execute(
+                "UPDATE responses SET body = ?, expires_at = ?, last_access = ? WHERE key = ?",
+                (json.dumps(value), expires_at, now, key)
+            )
+        self.stats["stores"] += 1
+        self._evict()
+        self._conn.commit()
+
+    def _evict(self) -> None:
+        overflow = self._size - self.max_entries
+        if overflow <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+            (overflow,)
+        )
+        self._size -= overflow
+        self.stats["evictions"] += overflow
+        logger.debug("Evicted %s entries from response cache %s.", overflow, self.path)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {**self.stats, "entries": self._size, "hit_rate": self.stats["hits"] / lookups if lookups else 0.0}
+
+    def clear(self) -> None:
+        self._conn.execute("DELETE FROM responses")
+        self._conn.commit()
+        self._size = 0
+
+    def close(self) -> None:
+        self._conn.close()
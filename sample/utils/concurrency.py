@@ -0,0 +1,41 @@
+import asyncio
+from typing import Any, Awaitable, Dict, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+async def gather_bounded(
+    tasks: Dict[str, Awaitable[Any]],
+    max_concurrency: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    名前付きの awaitable をタスクグループとして並行実行し、完了した順に結果を集める。
+    max_concurrency で同時実行数を制限できる (None の場合は無制限)。
+
+    各タスクのエラーは他のタスクに波及しない。例外が発生したタスクの結果は None になる。
+
+    :param tasks: {メトリクス名: awaitable} の辞書 (辞書の順序で起動される)
+    :param max_concurrency: 同時実行数の上限
+    :return: {メトリクス名: 結果} の辞書 (tasks と同じ順序)
+    """
+    semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+    results: Dict[str, Any] = {}
+
+    async def run(name: str, awaitable: Awaitable[Any]) -> None:
+        try:
+            if semaphore:
+                async with semaphore:
+                    results[name] = await awaitable
+            else:
+                results[name] = await awaitable
+        except Exception as e:
+            logger.exception("Concurrent fetch for '%s' failed: %s", name, e)
+            results[name] = None
+
+    async with asyncio.TaskGroup() as group:
+        for name, awaitable in tasks.items():
+            group.create_task(run(name, awaitable))
+
+    return {name: results.get(name) for name in tasks}
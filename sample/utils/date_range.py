@@ -0,0 +1,197 @@
+import asyncio
+import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+DATE_FORMAT = "%Y-%m-%d"
+
+# レコードの日付を表すキー (メトリクスによって異なる)
+RECORD_DATE_KEYS = ("dateTime", "dateOfSleep", "date")
+
+
+def split_date_range(start_date: str, end_date: str, max_days: int) -> List[Tuple[str, str]]:
+    """
+    start_date から end_date まで (両端含む) の期間を、max_days 日以下のチャンクに分割する。
+
+    :return: (開始日, 終了日) のリスト (日付順)
+    """
+    start = datetime.datetime.strptime(start_date, DATE_FORMAT).date()
+    end = datetime.datetime.strptime(end_date, DATE_FORMAT).date()
+    if start > end:
+        raise ValueError(f"start_date must not be after end_date: {start_date} > {end_date}")
+
+    chunks = []
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(end, chunk_start + datetime.timedelta(days=max_days - 1))
+        chunks.append((chunk_start.strftime(DATE_FORMAT), chunk_end.strftime(DATE_FORMAT)))
+        chunk_start = chunk_end + datetime.timedelta(days=1)
+    return chunks
+
+
+# 複数チャンクの結合でチャンクごとの値を合計するキー (睡眠の "summary" の totalMinutesAsleep・stages など、期間内の合計値)
+ADDITIVE_KEYS = frozenset({"summary"})
+
+
+def _sum_numbers(values: List[Any]) -> Any:
+    """辞書の数値を (入れ子も含めて) キーごとに合計する。数値以外の値は全チャンクで同じ場合だけ残す。"""
+    if all(isinstance(value, dict) for value in values):
+        keys = dict.fromkeys(key for value in values for key in value)
+        summed = {key: _sum_numbers([value[key] for value in values if key in value]) for key in keys}
+        return {key: value for key, value in summed.items() if value is not None}
+    if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+        return sum(values)
+    return values[0] if all(value == values[0] for value in values) else None
+
+
+def merge_range_responses(responses: List[Any]) -> Any:
+    """
+    日付順に並んだチャンクのレスポンスを1つのレスポンスに結合する。
+    リストのレスポンス (SpO2 など) は連結し、辞書のレスポンスはリスト型の値 ("hrv" など) を連結する。
+    空のレスポンス (204 No Content) は無視する。
+
+    複数のチャンクを結合する場合、リスト以外の値はチャンクごとの期間の値なので、そのままでは期間全体の値にならない。
+    ADDITIVE_KEYS の値 (合計値) は数値をチャンク間で合計し、それ以外のキーは結合結果に含めない。
+    """
+    responses = [r for r in responses if r]
+    if not responses:
+        return None
+    if len(responses) == 1:
+        return responses[0]
+
+    if isinstance(responses[0], list):
+        merged_list: List[Any] = []
+        for response in responses:
+            merged_list.extend(response)
+        return merged_list
+
+    merged: Dict[str, Any] = {}
+    additive: Dict[str, List[Any]] = {}
+    for response in responses:
+        for key, value in response.items():
+            if isinstance(value, list):
+                merged.setdefault(key, []).extend(value)
+            elif key in ADDITIVE_KEYS:
+                additive.setdefault(key, []).append(value)
+    for key, values in additive.items():
+        total = _sum_numbers(values)
+        if total is not None:
+            merged[key] = total
+    return merged
+
+
+def record_date(record: Dict[str, Any]) -> Optional[str]:
+    """レコードの日付 (YYYY-MM-DD)。日付のキーはメトリクスによって異なる。無い場合は None"""
+    value = next((record[key] for key in RECORD_DATE_KEYS if isinstance(record.get(key), str)), None)
+    return value[:10] if value is not None else None
+
+
+def split_range_response(data: Any) -> Dict[str, Any]:
+    """
+    日付範囲のレスポンスを日ごとのレスポンスに分ける (merge_range_responses の逆)。
+    リストのレスポンスはレコードの日付で分け、辞書のレスポンスはリスト型の値 ("hrv" など) をそれぞれ日付で分ける。
+    日に分けられない値 (睡眠の "summary" などの期間の合計) と日付の無いレコードは含めない。
+
+    :return: {日付: その日のレスポンス} (レコードの無い日は含まない)
+    """
+    if isinstance(data, list):
+        days: Dict[str, Any] = {}
+        for record in data:
+            date = record_date(record) if isinstance(record, dict) else None
+            if date is not None:
+                days.setdefault(date, []).append(record)
+        return days
+    if not isinstance(data, dict):
+        return {}
+    days = {}
+    for key, value in data.items():
+        if not isinstance(value, list):
+            continue
+        for date, records in split_range_response(value).items():
+            days.setdefault(date, {})[key] = records
+    return days
+
+
+async def fetch_date_range(
+    client: Any,
+    build_endpoint: Callable[[str, str], str],
+    start_date: str,
+    end_date: str,
+    max_days: int,
+    params: Optional[Dict[str, Any]] = None
+) -> Any:
+    """
+    期間をエンドポイントの最大日数ごとに分割して並行取得し、日付順に結合して返す。
+    同時実行数は ApiClient のレート制限によって調整される。
+    いずれかのチャンクが失敗した場合は残りをキャンセルし、その例外を送出する。
+
+    :param client: ApiClient
+    :param build_endpoint: (開始日, 終了日) からエンドポイントのパスを組み立てる関数
+    """
+    chunks = split_date_range(start_date, end_date, max_days)
+    if len(chunks) > 1:
+        logger.debug("Splitting range %s to %s into %s chunks of up to %s days.", start_date, end_date, len(chunks), max_days)
+
+    responses = await fetch_endpoints(
+        client, [build_endpoint(chunk_start, chunk_end) for chunk_start, chunk_end in chunks], params=params
+    )
+    return merge_range_responses(responses)
+
+
+async def fetch_endpoints(client: Any, endpoints: List[str], params: Optional[Dict[str, Any]] = None) -> List[Any]:
+    """
+    複数のエンドポイントを並行に GET し、endpoints と同じ順でレスポンスを返す。
+    いずれかが失敗した場合は残りをキャンセルし、その例外を送出する。
+    """
+    if len(endpoints) == 1:
+        # 1件ならタスクを作らずに呼び出し元のタスクで実行する
+        # (リクエストが同じイベントループの周回で発行されるため、ApiClient の相乗り・範囲からの応答が効きやすい)
+        return [await client.get(endpoints[0], params=params)]
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(client.get(endpoint, params=params)) for endpoint in endpoints]
+    except ExceptionGroup as eg:
+        # サービス側の既存のエラーハンドリング (except APIError) がそのまま使えるよう、最初の例外を送出する
+        raise eg.exceptions[0]
+    return [task.result() for task in tasks]
+
+
+def parse_datetime(value: str | datetime.datetime | datetime.date, end_of_day: bool = False) -> datetime.datetime:
+    """
+    "YYYY-MM-DDTHH:MM[:SS]" / "YYYY-MM-DD" / datetime / date を datetime に変換する。
+    日付のみの場合は end_of_day に応じてその日の 00:00 または 23:59 とする。
+    """
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        day = value
+    elif len(value) > 10:
+        return datetime.datetime.fromisoformat(value)
+    else:
+        day = datetime.datetime.strptime(value, DATE_FORMAT).date()
+    return datetime.datetime.combine(day, datetime.time(23, 59) if end_of_day else datetime.time())
+
+
+def split_intraday_windows(
+    start: datetime.datetime,
+    end: datetime.datetime
+) -> List[Tuple[str, str, str]]:
+    """
+    start から end まで (分単位で両端含む) を、日中データのエンドポイントが1リクエストで扱える1日以内の区間に分割する。
+
+    :return: (日付, 開始時刻 HH:MM, 終了時刻 HH:MM) のリスト (日時順)
+    """
+    if start > end:
+        raise ValueError(f"start must not be after end: {start} > {end}")
+    windows = []
+    day = start.date()
+    while day <= end.date():
+        window_start = start.strftime("%H:%M") if day == start.date() else "00:00"
+        window_end = end.strftime("%H:%M") if day == end.date() else "23:59"
+        windows.append((day.strftime(DATE_FORMAT), window_start, window_end))
+        day += datetime.timedelta(days=1)
+    return windows
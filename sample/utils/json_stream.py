@@ -0,0 +1,115 @@
+import codecs
+import json
+from typing import Any, AsyncIterator, List, Sequence
+
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+class JSONStreamError(ValueError):
+    """ストリーム中の JSON が期待した構造になっていない場合に送出される。"""
+    pass
+
+
+def _skip_whitespace(buffer: str, pos: int) -> int:
+    while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+        pos += 1
+    return pos
+
+
+def _find_array_start(buffer: str, path: Sequence[str]) -> int:
+    """
+    path のキーを順に探し、最後のキーが指す配列の '[' の次の位置を返す。
+    まだ必要なバイトが届いていなければ -1 を返す。
+    """
+    pos = 0
+    for key in path:
+        needle = json.dumps(key)
+        while True:
+            index = buffer.find(needle, pos)
+            if index < 0:
+                return -1
+            pos = _skip_whitespace(buffer, index + len(needle))
+            if pos >= len(buffer):
+                return -1
+            if buffer[pos] == ":":
+                break
+            # キーではなく値の文字列として現れた場合は、その先を探し直す
+        pos = _skip_whitespace(buffer, pos + 1)
+    if pos >= len(buffer):
+        return -1
+    if buffer[pos] != "[":
+        raise JSONStreamError(f"Value at {'.'.join(path)} is not an array.")
+    return pos + 1
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes], path: Sequence[str]) -> AsyncIterator[Any]:
+    """
+    バイト列のストリームから、path のキーが指す JSON 配列の要素を1つずつデコードして返す。
+    レスポンス全体をメモリに載せないため、大きな配列でもピークメモリは要素数によらずほぼ一定になる。
+
+        async for point in iter_json_array(response.aiter_bytes(), ["activities-heart-intraday", "dataset"]):
+            ...
+
+    配列より前の部分はキーの検索にのみ使い、配列より後の部分は読み捨てる。
+    path のキーはレスポンス中で一意であることを前提とする。
+    """
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    pos = -1 # 配列内の次の要素の位置 (配列が見つかるまでは -1)
+    exhausted = False
+    iterator = chunks.__aiter__()
+
+    while True:
+        try:
+            chunk = await iterator.__anext__()
+            buffer += utf8.decode(chunk)
+        except StopAsyncIteration:
+            buffer += utf8.decode(b"", final=True)
+            exhausted = True
+
+        if pos < 0:
+            pos = _find_array_start(buffer, path)
+            if pos < 0:
+                if exhausted:
+                    return # 配列が含まれていない (データなし)
+                continue
+
+        while True:
+            pos = _skip_whitespace(buffer, pos)
+            if pos >= len(buffer):
+                break
+            if buffer[pos] == "]":
+                return
+            if buffer[pos] == ",":
+                pos += 1
+                continue
+            try:
+                item, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if exhausted:
+                    raise JSONStreamError(f"Truncated or malformed JSON array at {'.'.join(path)}.")
+                break # 要素の途中までしか届いていない
+            if end >= len(buffer) and not exhausted:
+                break # 数値などはバッファ末尾で切れていても解釈できてしまうため、後続の文字を待つ
+            pos = end
+            yield item
+
+        if exhausted:
+            raise JSONStreamError(f"Unterminated JSON array at {'.'.join(path)}.")
+        # 処理済みの部分を捨て、バッファが要素1つ分程度に収まるようにする
+        buffer = buffer[pos:]
+        pos = 0
+
+
+async def iter_batches(items: AsyncIterator[Any], batch_size: int) -> AsyncIterator[List[Any]]:
+    """要素を batch_size 件ずつのリストにまとめて返す。最後のバッチは batch_size 未満の場合がある。"""
+    batch: List[Any] = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -1,4 +1,191 @@
+"""
+プロジェクト共通のロギング。
+
+各モジュールは get_logger(__name__) で "fitbit.<モジュール名>" のロガーを取得する。
+import しただけでは何も設定しない (ライブラリとして使う側のロギング設定を上書きしない)。
+実行スクリプトは configure_logging() を呼び、出力先・形式・モジュールごとのレベル・間引きを設定する。
+
+configure_logging() の出力はキュー経由で別スレッドが書き出すため、ログの出力 (ファイルや端末への書き込み) で
+イベントループが止まらない。メッセージは %-形式の引数で渡す (例: logger.info("Fetched %s", subject))。
+レベルで除外されるログは整形されず、整形も書き出し側のスレッドで行う。
+"""
+import atexit
+import datetime
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from typing import Any, Dict, IO, Mapping, Optional, Union
+
+ROOT_LOGGER_NAME = "fitbit"
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# LogRecord の標準の属性。これ以外の属性 (extra で渡した値) は JSON の出力に含める
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+logger = logging.getLogger(ROOT_LOGGER_NAME)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """プロジェクトのロガー (例: get_logger("utils.api") -> "fitbit.utils.api")"""
+    if name in ("", "__main__", ROOT_LOGGER_NAME):
+        return logger
+    if name.startswith(ROOT_LOGGER_NAME + "."):
+        return logging.getLogger(name)
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+
+class JsonFormatter(logging.Formatter):
+    """1行1件の JSON。extra で渡した値はそのままフィールドになる (JSON にできない値は文字列にする)。"""
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    大量に出力されるログの間引き。指定したモジュールの INFO 以下のログを、メッセージの書式ごとに rate 件に1件だけ通す。
+    WARNING 以上は常に通す。通したログには sampled (何件に1件か) を付ける。
+
+    :param rates: {モジュール名 (例: "services.base"): rate}。サブモジュールにも適用される
+    """
+    def __init__(self, rates: Mapping[str, int]):
+        super().__init__()
+        self.rates = {_qualify(name): max(1, int(rate)) for name, rate in rates.items()}
+        self._counts: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def _rate(self, name: str) -> int:
+        while name:
+            rate = self.rates.get(name)
+            if rate is not None:
+                return rate
+            name = name.rpartition(".")[0]
+        return 1
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        rate = self._rate(record.name)
+        if rate == 1:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        if count % rate:
+            return False
+        record.sampled = rate
+        return True
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler は既定ではキューに入れる前に (呼び出し元のスレッドで) メッセージを整形する。
+    同じプロセス内の QueueListener に渡すだけなので、整形は書き出し側のスレッドに任せる。
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[logging.Handler] = None
+
+
+def _qualify(name: str) -> str:
+    return get_logger(name).name
+
+
+def _parse_mapping(value: Optional[str]) -> Dict[str, str]:
+    """"utils.api=DEBUG,services=WARNING" 形式の環境変数を辞書にする"""
+    result = {}
+    for item in (value or "").split(","):
+        name, sep, setting = item.partition("=")
+        if sep and name.strip():
+            result[name.strip()] = setting.strip()
+    return result
+
+
+def configure_logging(
+    level: Union[int, str, None] = None,
+    format: Optional[str] = None,
+    levels: Optional[Mapping[str, Union[int, str]]] = None,
+    sample: Optional[Mapping[str, int]] = None,
+    stream: Optional[IO[str]] = None
+) -> logging.Logger:
+    """
+    プロジェクトのロガーの出力を設定する。2回目以降の呼び出しは前の設定を置き換える。
+
+    省略した値は環境変数から読む (LOG_LEVEL, LOG_FORMAT, LOG_LEVELS, LOG_SAMPLE)。
+    :param level: プロジェクト全体のレベル (既定は INFO)
+    :param format: "text" (既定) または "json"
+    :param levels: モジュールごとのレベル (例: {"utils.api": "DEBUG", "services": "WARNING"})
+    :param sample: モジュールごとの間引きの割合 (例: {"services.base": 100} で INFO 以下を100件に1件にする)
+    :param stream: 出力先 (既定は標準エラー出力)
+    """
+    global _listener, _handler
+    level = level if level is not None else os.getenv("LOG_LEVEL", "INFO")
+    format = format if format is not None else os.getenv("LOG_FORMAT", "text")
+    levels = levels if levels is not None else _parse_mapping(os.getenv("LOG_LEVELS"))
+    sample = sample if sample is not None else {name: int(rate) for name, rate in _parse_mapping(os.getenv("LOG_SAMPLE")).items()}
+    if format not in ("text", "json"):
+        raise ValueError(f"Unsupported log format: {format}")
+
+    shutdown_logging()
+
+    output = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    output.setFormatter(JsonFormatter() if format == "json" else logging.Formatter(TEXT_FORMAT))
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _handler = _LazyQueueHandler(log_queue)
+    if sample:
+        _handler.addFilter(SamplingFilter(sample))
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+    logger.setLevel(_to_level(level))
+    logger.addHandler(_handler)
+    # ルートロガーに設定があっても二重に出力しない
+    logger.propagate = False
+    for name, module_level in levels.items():
+        get_logger(name).setLevel(_to_level(module_level))
+    return logger
+
+
+def _to_level(level: Union[int, str]) -> int:
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(level.upper())
+    if not isinstance(value, int):
+        raise ValueError(f"Unknown log level: {level}")
+    return value
+
+
+def shutdown_logging() -> None:
+    """キューに残っているログを書き出し、configure_logging() の設定を外す。"""
+    global _listener, _handler
+    if _handler is not None:
+        logger.removeHandler(_handler)
+        _handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
+atexit.register(shutdown_logging)
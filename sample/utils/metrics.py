@@ -0,0 +1,212 @@
+import bisect
+import contextlib
+import math
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+# リクエストの所要時間のヒストグラムの境界 (秒)
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        super().__init__(name, help_text, label_names)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self.values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, *labels: str, value: float) -> None:
+        self.values[labels] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # ラベル -> ([各バケットの件数 (累積ではない) ..., +Inf の件数], [合計, 件数])
+        self.values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, *labels: str, value: float) -> None:
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = ([0] * (len(self.buckets) + 1), [0.0, 0])
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+        entry[1][1] += 1
+
+    def count(self, *labels: str) -> int:
+        entry = self.values.get(labels)
+        return int(entry[1][1]) if entry else 0
+
+    def percentile(self, q: float, *labels: str) -> Optional[float]:
+        """バケットの上限から求めた近似のパーセンタイル (記録が無い場合は None)"""
+        entry = self.values.get(labels)
+        if not entry or not entry[1][1]:
+            return None
+        rank = entry[1][1] * q / 100
+        cumulative = 0
+        for bound, count in zip((*self.buckets, math.inf), entry[0]):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return math.inf
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for labels, (counts, (total, count)) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {int(count)}")
+        return lines
+
+
+class Metrics:
+    """
+    ApiClient とトークンのリフレッシュの計測値 (Prometheus のテキスト形式で出力できる)。
+
+    エンドポイントのラベルには services.endpoints の名前 (例: "hrv_by_date_range") を使うため、
+    日付などを含む具体的な URL ごとに系列が増えることはない。登録されていないエンドポイントは "other" になる。
+
+    tracing=True で OpenTelemetry (opentelemetry-api) がインストールされていれば、リクエストとトークンのリフレッシュごとに
+    スパンを記録する。インストールされていない場合はメトリクスのみを記録する。
+    """
+    def __init__(self, tracing: bool = False, latency_buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.request_duration = Histogram(
+            "fitbit_api_request_duration_seconds", "Duration of Fitbit API requests (one per attempt).",
+            ("endpoint", "method"), latency_buckets
+        )
+        self.requests = Counter("fitbit_api_requests_total", "Fitbit API requests by response status.", ("endpoint", "method", "status"))
+        self.bytes_received = Counter("fitbit_api_response_bytes_total", "Response body bytes received.", ("endpoint",))
+        self.bytes_sent = Counter("fitbit_api_request_bytes_total", "Request body bytes sent.", ("endpoint",))
+        self.retries = Counter("fitbit_api_retries_total", "Retried Fitbit API requests.", ("endpoint", "reason"))
+        self.cache = Counter("fitbit_api_cache_total", "Response cache lookups.", ("endpoint", "result"))
+        self.shared = Counter(
+            "fitbit_api_shared_responses_total", "Requests answered from an in-flight request or a date range response.",
+            ("endpoint", "kind")
+        )
+        self.rate_limit_remaining = Gauge(
+            "fitbit_api_rate_limit_remaining", "Last Fitbit-Rate-Limit-Remaining header value.", ("user",)
+        )
+        self.rate_limit_reset = Gauge(
+            "fitbit_api_rate_limit_reset_seconds", "Last Fitbit-Rate-Limit-Reset header value.", ("user",)
+        )
+        self.token_refreshes = Counter("fitbit_token_refreshes_total", "Access token refreshes.", ("outcome",))
+        self.token_refresh_duration = Histogram(
+            "fitbit_token_refresh_duration_seconds", "Duration of access token refreshes.", (), latency_buckets
+        )
+        self._metrics: List[_Metric] = [
+            self.request_duration, self.requests, self.bytes_received, self.bytes_sent, self.retries, self.cache,
+            self.shared, self.rate_limit_remaining, self.rate_limit_reset, self.token_refreshes, self.token_refresh_duration,
+        ]
+        self.tracer = _load_tracer() if tracing else None
+
+    def render_prometheus(self) -> str:
+        """Prometheus のテキスト形式 (text/plain; version=0.0.4)"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            if metric.values:
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """node_exporter の textfile collector などで読み込めるよう、ファイルに書き出す。"""
+        from tokens import atomic_write_text
+        atomic_write_text(path, self.render_prometheus(), mode=0o644)
+
+    @contextlib.contextmanager
+    def span(self, name: str, attributes: Optional[Dict[str, Any]] = None) -> Iterator[Any]:
+        """OpenTelemetry のスパン。トレースが無効な場合は None を返すだけで何もしない。"""
+        if self.tracer is None:
+            yield None
+            return
+        with self.tracer.start_as_current_span(name, attributes=attributes) as span:
+            yield span
+
+
+def _load_tracer() -> Any:
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning("Tracing was requested but 'opentelemetry-api' is not installed. Recording metrics only.")
+        return None
+    return trace.get_tracer("fitbit.api")
+
+
+_default_metrics: Optional[Metrics] = None
+
+
+def configure_metrics(**options) -> Metrics:
+    """
+    プロセス共有の計測を有効にする。以降に作成される ApiClient と Client が計測値を記録する
+    (呼び出さなければ計測は行わない)。
+    """
+    global _default_metrics
+    _default_metrics = Metrics(**options)
+    return _default_metrics
+
+
+def get_metrics() -> Optional[Metrics]:
+    """プロセス共有の計測。無効な場合は None"""
+    return _default_metrics
+
+
+def disable_metrics() -> None:
+    global _default_metrics
+    _default_metrics = None
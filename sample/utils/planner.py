@@ -0,0 +1,103 @@
+import asyncio
+import re
+from collections import deque
+from typing import Any, Callable, List, Optional, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+_DATE = r"\d{4}-\d{2}-\d{2}"
+
+
+def _filter_records(key: str) -> Callable[[Any, str], Any]:
+    """{key: [{"dateTime": ...}, ...]} 形式の範囲レスポンスから1日分を取り出す"""
+    def extract(response: Any, date: str) -> Any:
+        if not isinstance(response, dict):
+            return None
+        return {key: [r for r in response.get(key, []) if str(r.get("dateTime", ""))[:10] == date]}
+    return extract
+
+
+def _pick_day(response: Any, date: str) -> Any:
+    """[{"dateTime": ..., "value": ...}, ...] 形式の範囲レスポンスから1日分を取り出す (SpO2)"""
+    if not isinstance(response, list):
+        return None
+    for record in response:
+        if record.get("dateTime") == date:
+            return record
+    return {}
+
+
+class SupersetRule:
+    """単日エンドポイントと、その日を含む日付範囲エンドポイントの対応"""
+    def __init__(self, name: str, single_pattern: str, range_pattern: str, extract: Callable[[Any, str], Any]):
+        self.name = name
+        self.single = re.compile(single_pattern)
+        self.range = re.compile(range_pattern)
+        # (範囲レスポンス, 日付) から単日エンドポイントと同じ形のレスポンスを作る
+        self.extract = extract
+
+
+SUPERSET_RULES = [
+    SupersetRule(
+        "hrv",
+        rf"^/1/user/(?P<user>[^/]+)/hrv/date/(?P<date>{_DATE})\.json$",
+        rf"^/1/user/(?P<user>[^/]+)/hrv/date/(?P<start>{_DATE})/(?P<end>{_DATE})\.json$",
+        _filter_records("hrv")
+    ),
+    SupersetRule(
+        "spo2",
+        rf"^/1/user/(?P<user>[^/]+)/spo2/date/(?P<date>{_DATE})\.json$",
+        rf"^/1/user/(?P<user>[^/]+)/spo2/date/(?P<start>{_DATE})/(?P<end>{_DATE})\.json$",
+        _pick_day
+    ),
+    SupersetRule(
+        "temp_skin",
+        rf"^/1/user/(?P<user>[^/]+)/temp/skin/date/(?P<date>{_DATE})\.json$",
+        rf"^/1/user/(?P<user>[^/]+)/temp/skin/date/(?P<start>{_DATE})/(?P<end>{_DATE})\.json$",
+        _filter_records("tempSkin")
+    ),
+]
+
+
+class SupersetPlanner:
+    """
+    取得済み・取得中の日付範囲レスポンスを覚えておき、その範囲に含まれる単日のリクエストを
+    範囲レスポンスから切り出して応答する。同じ日のデータを2回転送しないためのもの。
+
+    範囲レスポンスは max_entries 件まで (古いものから) 保持する。
+    """
+    def __init__(self, rules: List[SupersetRule] = SUPERSET_RULES, max_entries: int = 256):
+        self.rules = rules
+        # (ルール, ユーザー, 開始日, 終了日, レスポンスの Future)
+        self._ranges: deque = deque(maxlen=max_entries)
+
+    def register(self, endpoint: str, future: "asyncio.Future[Any]") -> None:
+        """日付範囲のリクエストであれば、そのレスポンスの Future を登録する。"""
+        for rule in self.rules:
+            match = rule.range.match(endpoint)
+            if match:
+                self._ranges.append((rule, match["user"], match["start"], match["end"], future))
+                return
+
+    def lookup(self, endpoint: str) -> Optional[Tuple["asyncio.Future[Any]", Callable[[Any, str], Any], str]]:
+        """
+        単日のリクエストを含む範囲が登録されていれば (Future, 切り出し関数, 日付) を返す。
+        失敗した範囲は使わない。新しく登録されたものを優先する。
+        """
+        for rule in self.rules:
+            match = rule.single.match(endpoint)
+            if not match:
+                continue
+            date = match["date"]
+            for range_rule, user, start, end, future in reversed(self._ranges):
+                if range_rule is not rule or user != match["user"] or not (start <= date <= end):
+                    continue
+                if future.done() and (future.cancelled() or future.exception() is not None):
+                    continue
+                logger.debug("Answering %s from range %s to %s.", endpoint, start, end)
+                return future, rule.extract, date
+            return None
+        return None
@@ -0,0 +1,101 @@
+import asyncio
+import time
+from typing import Mapping, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+# Fitbit Web API のレート制限 (ユーザーごとに 1 時間あたり 150 リクエスト)
+DEFAULT_RATE_LIMIT = 150
+DEFAULT_RATE_LIMIT_WINDOW = 3600
+
+HEADER_RATE_LIMIT = "Fitbit-Rate-Limit-Limit"
+HEADER_RATE_LIMIT_REMAINING = "Fitbit-Rate-Limit-Remaining"
+HEADER_RATE_LIMIT_RESET = "Fitbit-Rate-Limit-Reset"
+
+
+class RateLimiter:
+    """
+    1ユーザー分のレート制限予算を管理するトークンバケット。
+
+    Fitbit の制限は固定ウィンドウ (毎時リセット) なので、バケットはウィンドウの開始時に満タンになり、
+    レスポンスヘッダー (Fitbit-Rate-Limit-Remaining / Fitbit-Rate-Limit-Reset) を受け取るたびに
+    サーバー側の残数とリセット時刻に合わせて補正される。
+    残数が無くなったリクエストはリセットまでキューで待機するため、429 を発生させずに予算を使い切れる。
+    """
+    def __init__(self, limit: int = DEFAULT_RATE_LIMIT, window: float = DEFAULT_RATE_LIMIT_WINDOW):
+        self.limit = limit
+        self.window = window
+        self._tokens = limit
+        self._reset_at = time.monotonic() + window
+        self._in_flight = 0
+        self._lock = asyncio.Lock()
+
+    @property
+    def remaining(self) -> int:
+        """現在のウィンドウで新たに発行できるリクエスト数"""
+        self._refill(time.monotonic())
+        return self._tokens
+
+    @property
+    def reset_in(self) -> float:
+        """現在のウィンドウがリセットされるまでの秒数"""
+        return max(0.0, self._reset_at - time.monotonic())
+
+    def _refill(self, now: float) -> None:
+        if now >= self._reset_at:
+            self._tokens = max(0, self.limit - self._in_flight)
+            self._reset_at = now + self.window
+
+    async def acquire(self) -> None:
+        """リクエスト1件分の予算を確保する。予算が無い場合はウィンドウのリセットまで待機する。"""
+        async with self._lock: # 待機中のリクエストは到着順に処理される
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens > 0:
+                    self._tokens -= 1
+                    self._in_flight += 1
+                    return
+                wait = self._reset_at - now
+                logger.info("Rate limit budget exhausted. Deferring request for %.1fs until reset.", wait)
+                await asyncio.sleep(wait)
+
+    def release(self, headers: Optional[Mapping[str, str]] = None) -> None:
+        """
+        リクエスト完了時に呼び出す。レスポンスヘッダーがあればサーバー側の残数で予算を補正する。
+        """
+        self._in_flight = max(0, self._in_flight - 1)
+        if headers:
+            self.update_from_headers(headers)
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        """Fitbit-Rate-Limit-* ヘッダーの値でバケットを同期する。"""
+        remaining = _parse_int(headers.get(HEADER_RATE_LIMIT_REMAINING))
+        reset = _parse_int(headers.get(HEADER_RATE_LIMIT_RESET))
+        limit = _parse_int(headers.get(HEADER_RATE_LIMIT))
+
+        if limit is not None:
+            self.limit = limit
+        if reset is not None:
+            self._reset_at = time.monotonic() + reset
+        if remaining is not None:
+            # サーバーにまだ届いていない送信中のリクエスト分を差し引く
+            self._tokens = max(0, remaining - self._in_flight)
+
+    def exhaust(self, reset: Optional[float] = None) -> None:
+        """429 を受け取った場合など、現在のウィンドウの予算を使い切ったものとして扱う。"""
+        self._tokens = 0
+        if reset is not None:
+            self._reset_at = time.monotonic() + reset
+
+
+def _parse_int(value: Optional[str]) -> Optional[int]:
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
@@ -0,0 +1,54 @@
+import random
+from typing import Iterable, Optional
+
+
+# 一時的な障害とみなして再試行する HTTP ステータス
+DEFAULT_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# 冪等なメソッドのみ再試行する (POST などは二重登録の恐れがあるため再試行しない)
+DEFAULT_RETRY_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class RetryPolicy:
+    """
+    ApiClient の再試行ポリシー。
+    ジッター付き指数バックオフで待機時間を決め、Retry-After が指定されていればそれを優先する。
+    """
+    def __init__(
+        self,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        retry_statuses: Iterable[int] = DEFAULT_RETRY_STATUSES,
+        retry_methods: Iterable[str] = DEFAULT_RETRY_METHODS,
+        retry_on_communication_error: bool = True
+    ):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_methods = frozenset(m.upper() for m in retry_methods)
+        self.retry_on_communication_error = retry_on_communication_error
+
+    def should_retry(self, method: str, attempt: int, status_code: Optional[int] = None) -> bool:
+        """
+        :param method: HTTPメソッド
+        :param attempt: これまでの再試行回数 (初回リクエストの失敗時は 0)
+        :param status_code: HTTPステータス。通信エラーの場合は None
+        """
+        if attempt >= self.max_retries or method.upper() not in self.retry_methods:
+            return False
+        if status_code is None:
+            return self.retry_on_communication_error
+        return status_code in self.retry_statuses
+
+    def compute_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """attempt 回目の再試行までの待機秒数 (full jitter)。Retry-After があればそれ以上待つ。"""
+        backoff = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        delay = random.uniform(0, backoff)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+# 再試行しないポリシー
+NO_RETRY = RetryPolicy(max_retries=0)
@@ -0,0 +1,255 @@
+import bisect
+from array import array
+from datetime import date, datetime, time, timedelta
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.date_range import DATE_FORMAT
+
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# 値の型 (array の typecode)。整数は収まる最小の型、小数は float32 で保持する
+TYPECODE_UINT8 = "B"
+TYPECODE_UINT16 = "H"
+TYPECODE_FLOAT32 = "f"
+
+_AGGREGATIONS = ("mean", "sum", "min", "max", "first", "last")
+
+# Fitbit の detail-level と点の間隔 (秒)
+DETAIL_LEVEL_SECONDS = {"1sec": 1, "1min": 60, "5min": 300, "15min": 900}
+
+
+def parse_time_of_day(value: str) -> int:
+    """"HH:MM:SS" または "HH:MM" を0時からの秒数に変換する。"""
+    parts = value.split(":")
+    seconds = int(parts[0]) * 3600 + int(parts[1]) * 60
+    if len(parts) > 2:
+        seconds += int(parts[2])
+    return seconds
+
+
+def format_time_of_day(seconds: int) -> str:
+    seconds %= SECONDS_PER_DAY
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def _typecode_for(values: Sequence[Any]) -> str:
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        high = max(values, default=0)
+        low = min(values, default=0)
+        if low >= 0 and high <= 0xFF:
+            return TYPECODE_UINT8
+        if low >= 0 and high <= 0xFFFF:
+            return TYPECODE_UINT16
+    return TYPECODE_FLOAT32
+
+
+class IntradaySeries:
+    """
+    日中の時系列データを型付き配列で保持する。
+    時刻は origin の0時からの秒数 (int32)、値は uint8 / uint16 / float32 で持つため、
+    1点あたり5〜8バイト程度で済む ({"time": ..., "value": ...} の dict では200バイト以上)。
+    複数日を連結した場合、2日目以降の秒数は 86400 以上になる。
+
+    時刻は昇順であることを前提とする (Fitbit の dataset は昇順で返される)。
+    """
+    def __init__(
+        self,
+        origin: date,
+        seconds: Optional[array] = None,
+        values: Optional[array] = None,
+        typecode: str = TYPECODE_UINT8,
+        interval: Optional[int] = None
+    ):
+        self.origin = origin
+        self.seconds = seconds if seconds is not None else array("i")
+        self.values = values if values is not None else array(typecode)
+        # 点の間隔 (秒)。不明な場合は None
+        self.interval = interval
+        if len(self.seconds) != len(self.values):
+            raise ValueError("seconds and values must have the same length.")
+
+    # --- 生成 ---
+    @classmethod
+    def from_dataset(
+        cls,
+        day: str | date,
+        dataset: Iterable[Dict[str, Any]],
+        interval: Optional[int] = None,
+        typecode: Optional[str] = None
+    ) -> "IntradaySeries":
+        """Fitbit の intraday dataset ([{"time": "HH:MM:SS", "value": n}, ...]) から生成する。"""
+        origin = _to_date(day)
+        dataset = list(dataset) if not isinstance(dataset, list) else dataset
+        raw_values = [point["value"] for point in dataset]
+        typecode = typecode if typecode else _typecode_for(raw_values)
+        seconds = array("i", (parse_time_of_day(point["time"]) for point in dataset))
+        return cls(origin, seconds, array(typecode, raw_values), typecode=typecode, interval=interval)
+
+    @classmethod
+    async def from_stream(
+        cls,
+        day: str | date,
+        points: AsyncIterator[Dict[str, Any]],
+        interval: Optional[int] = None,
+        typecode: str = TYPECODE_UINT8
+    ) -> "IntradaySeries":
+        """ストリーミングで受信した点を直接詰めて生成する。dict のリストを経由しないため、ピークメモリが小さい。"""
+        series = cls(_to_date(day), typecode=typecode, interval=interval)
+        async for point in points:
+            series.append(parse_time_of_day(point["time"]), point["value"])
+        return series
+
+    @classmethod
+    def concat(cls, series_list: Sequence["IntradaySeries"]) -> "IntradaySeries":
+        """
+        複数日の系列を、最も早い origin を基準に1つの系列に連結する。
+        時刻が重なる場合は入力順に並べたまま保持する (重複は除かない)。
+        """
+        series_list = sorted((s for s in series_list if s is not None), key=lambda s: s.origin)
+        if not series_list:
+            raise ValueError("concat requires at least one series.")
+        origin = series_list[0].origin
+        typecodes = {s.values.typecode for s in series_list}
+        typecode = typecodes.pop() if len(typecodes) == 1 else TYPECODE_FLOAT32
+        intervals = {s.interval for s in series_list}
+        result = cls(origin, typecode=typecode, interval=intervals.pop() if len(intervals) == 1 else None)
+        for s in series_list:
+            offset = (s.origin - origin).days * SECONDS_PER_DAY
+            if offset:
+                result.seconds.extend(second + offset for second in s.seconds)
+            else:
+                result.seconds.extend(s.seconds)
+            result.values.extend(s.values if s.values.typecode == typecode else array(typecode, s.values))
+        return result
+
+    def append(self, second: int, value: Any) -> None:
+        try:
+            self.values.append(value)
+        except (OverflowError, TypeError):
+            # 整数の型に収まらない値 (小数や大きな値) が来たら float32 に昇格する
+            self.values = array(TYPECODE_FLOAT32, self.values)
+            self.values.append(value)
+        self.seconds.append(second)
+
+    # --- 参照 ---
+    def __len__(self) -> int:
+        return len(self.seconds)
+
+    def __iter__(self) -> Iterator[Tuple[datetime, Any]]:
+        start = datetime.combine(self.origin, time())
+        for second, value in zip(self.seconds, self.values):
+            yield start + timedelta(seconds=second), value
+
+    def __repr__(self) -> str:
+        return (
+            f"IntradaySeries(origin={self.origin.isoformat()}, points={len(self)}, "
+            f"typecode={self.values.typecode!r}, interval={self.interval})"
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return self.seconds.itemsize * len(self.seconds) + self.values.itemsize * len(self.values)
+
+    def _to_seconds(self, value: int | str | datetime | time) -> int:
+        if isinstance(value, int):
+            return value
+        if isinstance(value, str):
+            return parse_time_of_day(value)
+        if isinstance(value, datetime):
+            delta = value - datetime.combine(self.origin, time(), tzinfo=value.tzinfo)
+            return int(delta.total_seconds())
+        if isinstance(value, time):
+            return value.hour * 3600 + value.minute * 60 + value.second
+        raise TypeError(f"Unsupported time value: {value!r}")
+
+    def slice(
+        self,
+        start: Optional[int | str | datetime | time] = None,
+        end: Optional[int | str | datetime | time] = None
+    ) -> "IntradaySeries":
+        """
+        start 以上 end 未満の点を返す。位置は二分探索で求め、配列はスライスでまとめてコピーする。
+        start / end には origin の0時からの秒数、"HH:MM[:SS]" (origin の日の時刻)、datetime、time を指定できる。
+        """
+        low = bisect.bisect_left(self.seconds, self._to_seconds(start)) if start is not None else 0
+        high = bisect.bisect_left(self.seconds, self._to_seconds(end)) if end is not None else len(self.seconds)
+        return IntradaySeries(
+            self.origin, self.seconds[low:high], self.values[low:high],
+            typecode=self.values.typecode, interval=self.interval
+        )
+
+    def day(self, day: str | date) -> "IntradaySeries":
+        """連結した系列から1日分を取り出す (origin はその日になる)。"""
+        target = _to_date(day)
+        offset = (target - self.origin).days * SECONDS_PER_DAY
+        part = self.slice(offset, offset + SECONDS_PER_DAY)
+        seconds = array("i", (second - offset for second in part.seconds)) if offset else part.seconds
+        return IntradaySeries(target, seconds, part.values, typecode=part.values.typecode, interval=self.interval)
+
+    # --- 変換 ---
+    def resample(self, interval: int, how: str = "mean") -> "IntradaySeries":
+        """
+        interval 秒ごとの区間に集約する (例: 1秒 → 60 で1分、900 で15分)。
+        点の無い区間は出力しない。区間の時刻は区間の先頭。
+        区間の境界を求めて reduceat でまとめて集約する。
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive.")
+        if how not in _AGGREGATIONS:
+            raise ValueError(f"Unsupported aggregation: {how}. Supported: {_AGGREGATIONS}")
+        # 平均は小数になり、合計は元の整数型に収まらないことがあるため float32 にする
+        typecode = TYPECODE_FLOAT32 if how in ("mean", "sum") else self.values.typecode
+        result = IntradaySeries(self.origin, typecode=typecode, interval=interval)
+        if not len(self.seconds):
+            return result
+
+        seconds, values = self.to_numpy()
+        buckets = seconds // interval
+        # 各区間の先頭の位置 (時刻は昇順なので、区間が変わる位置が境界になる)
+        starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+        if how in ("mean", "sum"):
+            aggregated = np.add.reduceat(values.astype(np.float64), starts)
+            if how == "mean":
+                aggregated /= np.diff(np.append(starts, len(values)))
+        elif how == "min":
+            aggregated = np.minimum.reduceat(values, starts)
+        elif how == "max":
+            aggregated = np.maximum.reduceat(values, starts)
+        elif how == "first":
+            aggregated = values[starts]
+        else:
+            aggregated = values[np.append(starts[1:], len(values)) - 1]
+        result.seconds.frombytes((buckets[starts] * interval).astype(np.int32).tobytes())
+        result.values.frombytes(aggregated.astype(np.dtype(typecode)).tobytes())
+        return result
+
+    def to_dataset(self) -> List[Dict[str, Any]]:
+        """Fitbit の dataset 形式に戻す (単一日の系列を想定)。"""
+        return [{"time": format_time_of_day(second), "value": value} for second, value in zip(self.seconds, self.values)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "origin": self.origin.strftime(DATE_FORMAT),
+            "interval": self.interval,
+            "dataset": self.to_dataset(),
+        }
+
+    def to_numpy(self):
+        """
+        (秒数, 値) の numpy 配列を返す。配列のバッファをコピーせずに参照する。
+        """
+        dtypes = {TYPECODE_UINT8: np.uint8, TYPECODE_UINT16: np.uint16, TYPECODE_FLOAT32: np.float32}
+        return np.frombuffer(self.seconds, dtype=np.int32), np.frombuffer(self.values, dtype=dtypes[self.values.typecode])
+
+
+def _to_date(value: str | date) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if value == "today":
+        return date.today()
+    return datetime.strptime(value, DATE_FORMAT).date()
@@ -0,0 +1,131 @@
+import importlib.util
+from typing import Any, Dict, Optional
+
+import httpx
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+DEFAULT_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60.0)
+DEFAULT_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+
+class TransportStats:
+    """コネクションの再利用状況。requests に対して connections_opened が小さいほどハンドシェイクが償却されている。"""
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+
+    @property
+    def reused_requests(self) -> int:
+        return max(0, self.requests - self.connections_opened)
+
+    @property
+    def reuse_ratio(self) -> float:
+        return self.reused_requests / self.requests if self.requests else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "tls_handshakes": self.tls_handshakes,
+            "reused_requests": self.reused_requests,
+            "reuse_ratio": self.reuse_ratio,
+        }
+
+
+class _TracingTransport(httpx.AsyncBaseTransport):
+    """httpcore の trace 拡張で新規接続と TLS ハンドシェイクを数えるトランスポート"""
+    def __init__(self, transport: httpx.AsyncBaseTransport, stats: TransportStats):
+        self._transport = transport
+        self._stats = stats
+
+    async def _trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            self._stats.connections_opened += 1
+        elif event_name == "connection.start_tls.complete":
+            self._stats.tls_handshakes += 1
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        inner_trace = request.extensions.get("trace")
+        if inner_trace is None:
+            trace = self._trace
+        else:
+            async def trace(event_name: str, info: Dict[str, Any]) -> None:
+                await self._trace(event_name, info)
+                await inner_trace(event_name, info)
+        request.extensions = {**request.extensions, "trace": trace}
+        response = await self._transport.handle_async_request(request)
+        self._stats.requests += 1
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class TransportManager:
+    """
+    プロセス内で共有する長寿命の httpx.AsyncClient を管理する。
+    全ての ApiClient とトークンのリフレッシュが同じコネクションプールを使うため、
+    実行をまたいで TCP/TLS のハンドシェイクが再利用される。
+    """
+    def __init__(
+        self,
+        limits: httpx.Limits = DEFAULT_LIMITS,
+        timeout: httpx.Timeout = DEFAULT_TIMEOUT,
+        http2: bool = False
+    ):
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 was requested but the 'h2' package is not installed. Falling back to HTTP/1.1.")
+            http2 = False
+        self.limits = limits
+        self.timeout = timeout
+        self.http2 = http2
+        self.stats = TransportStats()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            transport = httpx.AsyncHTTPTransport(limits=self.limits, http2=self.http2)
+            self._client = httpx.AsyncClient(
+                transport=_TracingTransport(transport, self.stats),
+                timeout=self.timeout
+            )
+            logger.debug("Created shared httpx.AsyncClient (http2=%s, limits=%s).", self.http2, self.limits)
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+_default_manager: Optional[TransportManager] = None
+
+
+def configure_transport(**options) -> TransportManager:
+    """プロセス共有のトランスポートを設定し直す (最初のリクエストの前に呼び出すこと)。"""
+    global _default_manager
+    _default_manager = TransportManager(**options)
+    return _default_manager
+
+
+def get_transport_manager() -> TransportManager:
+    global _default_manager
+    if _default_manager is None:
+        _default_manager = TransportManager()
+    return _default_manager
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """プロセス共有の httpx.AsyncClient を返す。呼び出し側で close しないこと。"""
+    return get_transport_manager().get_client()
+
+
+async def close_http_client() -> None:
+    """プロセス終了時に共有クライアントを閉じる。"""
+    if _default_manager is not None:
+        await _default_manager.aclose()
@@ -0,0 +1,67 @@
+import os
+import sqlite3
+from typing import Dict, Optional
+
+
+DEFAULT_STATE_PATH = os.path.join(".state", "sync.sqlite3")
+
+
+class WatermarkStore:
+    """
+    ユーザー・メトリクスごとの取得済み日付 (ハイウォーターマーク) を SQLite に保存する。
+    マークは「この日付まで取得・保存が完了している」ことを表す。
+    """
+    def __init__(self, path: str = DEFAULT_STATE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS watermarks (
+                user_id TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                last_date TEXT NOT NULL,
+                PRIMARY KEY (user_id, metric)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, user_id: str, metric: str) -> Optional[str]:
+        """取得済みの最終日 (YYYY-MM-DD形式)。未取得の場合は None"""
+        row = self._conn.execute(
+            "SELECT last_date FROM watermarks WHERE user_id = ? AND metric = ?", (user_id, metric)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_all(self, user_id: str) -> Dict[str, str]:
+        rows = self._conn.execute("SELECT metric, last_date FROM watermarks WHERE user_id = ?", (user_id,))
+        return dict(rows.fetchall())
+
+    def advance(self, user_id: str, metric: str, last_date: str) -> None:
+        """
+        マークを last_date まで進める。既存のマークより前の日付では巻き戻さない。
+        単一のトランザクションで更新するため、途中で中断されても古いマークが残るだけになる。
+        """
+        with self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO watermarks (user_id, metric, last_date) VALUES (?, ?, ?)
+                ON CONFLICT (user_id, metric) DO UPDATE SET last_date = excluded.last_date
+                WHERE excluded.last_date > watermarks.last_date
+                """,
+                (user_id, metric, last_date)
+            )
+
+    def reset(self, user_id: str, metric: Optional[str] = None) -> None:
+        with self._conn:
+            if metric is None:
+                self._conn.execute("DELETE FROM watermarks WHERE user_id = ?", (user_id,))
+            else:
+                self._conn.execute("DELETE FROM watermarks WHERE user_id = ? AND metric = ?", (user_id, metric))
+
+    def close(self) -> None:
+        self._conn.close()
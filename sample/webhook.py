@@ -0,0 +1,486 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+
+from client import Client
+from users import UserCredentials, UserRegistry, DEFAULT_USERS_PATH
+from sync import Sink, make_sink, range_fetchers
+from utils.api import ApiClient
+from utils.concurrency import gather_bounded
+from utils.logger import configure_logging, get_logger
+from utils.rate_limit import RateLimiter
+from utils.transport import get_http_client, close_http_client
+
+logger = get_logger(__name__)
+
+
+HEADER_SIGNATURE = "X-Fitbit-Signature"
+DEFAULT_PATH = "/webhook"
+
+# 通知のコレクションごとに取得し直すメトリクス (sync.range_fetchers の名前)。
+# HRV・SpO2・皮膚温は睡眠中に計測されるため、sleep の通知で取得する。
+COLLECTION_METRICS = {
+    "activities": ["activity:steps", "activity:calories", "activity:distance", "activity:floors", "heart_rate"],
+    "sleep": ["sleep", "hrv", "spo2", "temp_skin"],
+}
+
+# リクエスト (ヘッダー・ボディ) の上限
+_MAX_HEADER_BYTES = 16 * 1024
+_MAX_BODY_BYTES = 1024 * 1024
+_REASONS = {200: "OK", 204: "No Content", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large"}
+
+# 通知を受け取って処理する関数
+NotificationHandler = Callable[["Notification"], Awaitable[Any]]
+
+
+def sign(body: bytes, client_secret: str) -> str:
+    """Fitbit と同じ方法で通知のボディに署名する (キーは "<client_secret>&" の HMAC-SHA1 を Base64 にしたもの)。"""
+    digest = hmac.new(f"{client_secret}&".encode(), body, hashlib.sha1).digest()
+    return base64.b64encode(digest).decode()
+
+
+def verify_signature(body: bytes, signature: Optional[str], client_secret: str) -> bool:
+    if not signature:
+        return False
+    return hmac.compare_digest(sign(body, client_secret), signature)
+
+
+class Notification:
+    """
+    Subscriptions API の1件の通知。
+
+        {"collectionType": "sleep", "date": "2025-05-31", "ownerId": "ABC123", "ownerType": "user", "subscriptionId": "ABC123"}
+    """
+    def __init__(self, collection_type: str, date: str, owner_id: str, subscription_id: str, owner_type: str = "user"):
+        self.collection_type = collection_type
+        self.date = date
+        self.owner_id = owner_id
+        self.subscription_id = subscription_id
+        self.owner_type = owner_type
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Notification":
+        return cls(
+            data["collectionType"], data.get("date", ""), data["ownerId"], str(data.get("subscriptionId", "")),
+            data.get("ownerType", "user")
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "collectionType": self.collection_type,
+            "date": self.date,
+            "ownerId": self.owner_id,
+            "ownerType": self.owner_type,
+            "subscriptionId": self.subscription_id,
+        }
+
+    @property
+    def key(self) -> Tuple[str, str, str]:
+        """同じデータの更新を表す通知は同じキーになる"""
+        return self.owner_id, self.collection_type, self.date
+
+    def __repr__(self) -> str:
+        return f"Notification({self.owner_id}, {self.collection_type}, {self.date})"
+
+
+class NotificationQueue:
+    """
+    通知をキューに入れ、workers 個のタスクで handler を実行する。
+
+    同じ (ユーザー, コレクション, 日付) の通知は1回の取得にまとめる。
+    - キューで待っている通知と同じもの (Fitbit の再送を含む) は捨てる
+    - 処理中に届いた場合は、処理の完了後にもう1回だけ処理する (処理中に更新されたデータを取りこぼさない)
+    - 処理の完了から cooldown 秒以内に届いた場合は、cooldown が過ぎるまで待ってから処理する
+    """
+    def __init__(self, handler: NotificationHandler, workers: int = 4, cooldown: float = 60.0):
+        self.handler = handler
+        self.workers = workers
+        self.cooldown = cooldown
+        self._queue: "asyncio.Queue[Notification]" = asyncio.Queue()
+        self._queued: Dict[Tuple[str, str, str], Notification] = {}
+        self._running: set = set()
+        self._dirty: set = set()
+        # キー -> 最後に処理が完了した時刻 (古いものから並ぶ)
+        self._completed: "OrderedDict[Tuple[str, str, str], float]" = OrderedDict()
+        self._delayed: Dict[Tuple[str, str, str], asyncio.TimerHandle] = {}
+        self._tasks: List[asyncio.Task] = []
+        self.stats = {"received": 0, "duplicates": 0, "processed": 0, "failed": 0}
+
+    def put(self, notification: Notification) -> bool:
+        """
+        通知を追加する。
+        :return: 新たに処理を予約した場合は True、既存の処理にまとめた場合は False
+        """
+        self.stats["received"] += 1
+        key = notification.key
+        if key in self._queued:
+            self.stats["duplicates"] += 1
+            return False
+        if key in self._running:
+            self.stats["duplicates"] += 1
+            self._dirty.add(key)
+            return False
+        self._schedule(notification)
+        return True
+
+    def _schedule(self, notification: Notification) -> None:
+        key = notification.key
+        self._queued[key] = notification
+        now = time.monotonic()
+        while self._completed and next(iter(self._completed.values())) + self.cooldown <= now:
+            self._completed.popitem(last=False)
+        delay = self._completed[key] + self.cooldown - now if key in self._completed else 0
+        if delay > 0:
+            logger.debug("Delaying %s for %.1f seconds.", notification, delay)
+            self._delayed[key] = asyncio.get_running_loop().call_later(delay, self._enqueue, notification)
+        else:
+            self._enqueue(notification)
+
+    def _enqueue(self, notification: Notification) -> None:
+        self._delayed.pop(notification.key, None)
+        self._queue.put_nowait(notification)
+
+    async def _worker(self) -> None:
+        while True:
+            notification = await self._queue.get()
+            key = notification.key
+            self._queued.pop(key, None)
+            self._running.add(key)
+            try:
+                await self.handler(notification)
+                self.stats["processed"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.exception("Failed to handle %s: %s", notification, e)
+            finally:
+                self._running.discard(key)
+                self._completed.pop(key, None)
+                self._completed[key] = time.monotonic()
+                self._queue.task_done()
+            if key in self._dirty:
+                self._dirty.discard(key)
+                self._schedule(notification)
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def join(self) -> None:
+        """予約済み (cooldown で待機中のものを含む) の通知が全て処理されるまで待つ。"""
+        while True:
+            await self._queue.join()
+            if not self._delayed and not self._queued and not self._running:
+                return
+            await asyncio.sleep(0.05)
+
+    async def stop(self) -> None:
+        for handle in self._delayed.values():
+            handle.cancel()
+        self._delayed.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+class WebhookReceiver:
+    """
+    Subscriptions API の通知を受け取るローカルの HTTP サーバー (asyncio.start_server)。
+
+    - GET <path>?verify=<code>: サブスクライバーの検証。code が verification_code と一致すれば 204、しなければ 404
+    - POST <path>: 通知。X-Fitbit-Signature を検証し、正しければ通知をキューに入れてすぐに 204 を返す
+      (Fitbit は 5 秒以内の応答を求めるため、データの取得は応答の後に行う)。署名が正しくなければ 404
+    """
+    def __init__(
+        self,
+        client_secret: str,
+        verification_code: str,
+        queue: NotificationQueue,
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        path: str = DEFAULT_PATH
+    ):
+        self.client_secret = client_secret
+        self.verification_code = verification_code
+        self.queue = queue
+        self.host = host
+        self.port = port
+        self.path = path
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.stats = {"notifications": 0, "rejected": 0, "verifications": 0}
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}{self.path}"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # port=0 の場合は割り当てられたポートを使う
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.queue.start()
+        logger.info("Webhook receiver listening on %s.", self.url)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        await self.queue.stop()
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            status = await self._handle_request(reader)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+            logger.warning("Malformed webhook request: %s", e)
+            status = 400
+        try:
+            writer.write(f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, reader: asyncio.StreamReader) -> int:
+        head = await reader.readuntil(b"\r\n\r\n")
+        if len(head) > _MAX_HEADER_BYTES:
+            return 413
+        request_line, *header_lines = head.decode("latin-1").rstrip("\r\n").split("\r\n")
+        method, target, _ = request_line.split(" ", 2)
+        headers = {}
+        for line in header_lines:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", "0"))
+        if length > _MAX_BODY_BYTES:
+            return 413
+        body = await reader.readexactly(length) if length else b""
+
+        url = urlsplit(target)
+        if url.path != self.path:
+            return 404
+        if method == "GET":
+            return self._verify(parse_qs(url.query).get("verify", [None])[0])
+        if method == "POST":
+            return self._receive(body, headers.get(HEADER_SIGNATURE.lower()))
+        return 405
+
+    def _verify(self, code: Optional[str]) -> int:
+        self.stats["verifications"] += 1
+        if code is not None and hmac.compare_digest(code, self.verification_code):
+            logger.info("Subscriber verification succeeded.")
+            return 204
+        logger.info("Subscriber verification request with a non-matching code.")
+        return 404
+
+    def _receive(self, body: bytes, signature: Optional[str]) -> int:
+        if not verify_signature(body, signature, self.client_secret):
+            self.stats["rejected"] += 1
+            logger.warning("Rejected a webhook notification with an invalid signature.")
+            return 404
+        try:
+            notifications = [Notification.from_dict(item) for item in json.loads(body)]
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning("Invalid webhook notification body: %s", e)
+            return 400
+        self.stats["notifications"] += len(notifications)
+        queued = sum(self.queue.put(notification) for notification in notifications)
+        logger.debug("Received %s notifications (%s queued).", len(notifications), queued)
+        return 204
+
+
+class SubscriptionSync:
+    """
+    通知を受けたユーザーの、更新されたコレクションの該当日だけを取得して sink に保存する。
+    通知は直近のデータの更新を表すため、ResponseCache は使わずに毎回取得する。
+    """
+    def __init__(
+        self,
+        users: Iterable[UserCredentials],
+        sink: Sink,
+        http_client: Optional[httpx.AsyncClient] = None,
+        collection_metrics: Dict[str, List[str]] = COLLECTION_METRICS,
+        max_concurrency: Optional[int] = None
+    ):
+        # 通知の ownerId と、登録時に subscriptionId として使ったユーザーIDのどちらでも引けるようにする
+        self.users = {user.user_id: user for user in users}
+        self.sink = sink
+        self.collection_metrics = collection_metrics
+        self.max_concurrency = max_concurrency
+        self._http_client = http_client
+        self._clients: Dict[str, Client] = {}
+
+    def _client_for(self, user: UserCredentials) -> Client:
+        if user.user_id not in self._clients:
+            self._clients[user.user_id] = Client(user, rate_limiter=RateLimiter())
+        return self._clients[user.user_id]
+
+    async def _api_client(self, user: UserCredentials) -> Optional[ApiClient]:
+        http_client = self._http_client if self._http_client else get_http_client()
+        client = self._client_for(user)
+        access_token = await client.get_access_token(http_client)
+        if not access_token:
+            logger.error("Skipping notification for user %s: could not obtain an access token.", user.user_id)
+            return None
+        return client.create_api_client(http_client, access_token)
+
+    async def handle(self, notification: Notification) -> Dict[str, bool]:
+        """
+        通知を処理する。NotificationQueue の handler として使う。
+        :return: {メトリクス名: 保存できたか}
+        """
+        user = self.users.get(notification.owner_id) or self.users.get(notification.subscription_id)
+        if user is None:
+            logger.warning("Ignoring %s: unknown user.", notification)
+            return {}
+        if notification.collection_type in ("userRevokedAccess", "deleteUser"):
+            logger.warning("User %s revoked access or was deleted (%s).", user.user_id, notification.collection_type)
+            return {}
+        metrics = self.collection_metrics.get(notification.collection_type)
+        if not metrics:
+            logger.debug("No metrics to fetch for %s.", notification)
+            return {}
+
+        api_client = await self._api_client(user)
+        if api_client is None:
+            return {}
+        fetchers = range_fetchers(api_client, [metric.split(":", 1)[1] for metric in metrics if metric.startswith("activity:")])
+        date = notification.date
+
+        async def sync_metric(metric: str) -> bool:
+            fetch, _ = fetchers[metric]
+            try:
+                data = await fetch(date, date)
+            except Exception:
+                logger.warning("Targeted fetch of %s for user %s on %s failed.", metric, user.user_id, date)
+                return False
+            # データが無い (204 や空のレスポンス) 場合は保存するものが無いだけで、失敗ではない
+            if data is not None:
+                await self.sink(user.user_id, metric, date, date, data)
+            return True
+
+        results = await gather_bounded({metric: sync_metric(metric) for metric in metrics}, max_concurrency=self.max_concurrency)
+        logger.info("Synced %s of %s metrics for %s.", sum(1 for ok in results.values() if ok), len(metrics), notification)
+        return results
+
+
+class LocalNotifier:
+    """
+    Fitbit の代わりに通知を送るテスト用のクライアント。WebhookReceiver を端から端まで確認するのに使う。
+
+        async with WebhookReceiver(secret, code, queue, port=0) as receiver:
+            notifier = LocalNotifier(receiver.url, secret)
+            await notifier.verify(code)                       # 204
+            await notifier.notify([Notification("sleep", "2025-05-31", "ABC123", "ABC123")])
+    """
+    def __init__(self, url: str, client_secret: str, http_client: Optional[httpx.AsyncClient] = None):
+        self.url = url
+        self.client_secret = client_secret
+        self._http_client = http_client
+
+    async def _send(self, method: str, **kwargs) -> int:
+        if self._http_client is not None:
+            response = await self._http_client.request(method, self.url, **kwargs)
+            return response.status_code
+        async with httpx.AsyncClient() as client:
+            response = await client.request(method, self.url, **kwargs)
+            return response.status_code
+
+    async def verify(self, code: str) -> int:
+        return await self._send("GET", params={"verify": code})
+
+    async def notify(self, notifications: Iterable[Notification], signature: Optional[str] = None) -> int:
+        """通知を署名して送る。signature を渡すとその値を使う (不正な署名の確認用)。"""
+        body = json.dumps([notification.to_dict() for notification in notifications]).encode()
+        headers = {"Content-Type": "application/json", HEADER_SIGNATURE: signature or sign(body, self.client_secret)}
+        return await self._send("POST", content=body, headers=headers)
+
+
+async def subscribe_users(users: Iterable[UserCredentials], collection: Optional[str] = None, subscriber_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    各ユーザーを、ユーザーIDを subscriptionId としてサブスクリプションに登録する。
+    :return: {ユーザーID: 登録結果} (失敗したユーザーは None)
+    """
+    from services.subscriptions import Subscriptions
+
+    http_client = get_http_client()
+
+    async def subscribe(user: UserCredentials) -> Any:
+        client = Client(user)
+        access_token = await client.get_access_token(http_client)
+        if not access_token:
+            logger.error("Skipping user %s: could not obtain an access token.", user.user_id)
+            return None
+        return await Subscriptions(client.create_api_client(http_client, access_token)).add(user.user_id, collection, subscriber_id)
+
+    return await gather_bounded({user.user_id: subscribe(user) for user in users})
+
+
+async def main(args: argparse.Namespace) -> None:
+    from config import get_config
+    from settings import get_settings
+
+    settings = get_settings()
+    registry = UserRegistry(args.users, settings.client_id, settings.client_secret)
+    try:
+        if args.command == "subscribe":
+            results = await subscribe_users(registry.users, args.collection, args.subscriber_id)
+            failed = [user_id for user_id, result in results.items() if result is None]
+            logger.info("Subscribed %s of %s users. Failed: %s", len(results) - len(failed), len(results), failed)
+            return
+        sync = SubscriptionSync(registry.users, make_sink(args.out, args.format))
+        receiver = WebhookReceiver(
+            settings.client_secret,
+            get_config().get("SUBSCRIBER_VERIFICATION_CODE"),
+            NotificationQueue(sync.handle, workers=args.workers),
+            host=args.host,
+            port=args.port,
+            path=args.path
+        )
+        await receiver.serve_forever()
+    finally:
+        await close_http_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fitbit Subscriptions API の通知を受けて差分を取得する")
+    parser.add_argument("--users", default=DEFAULT_USERS_PATH, help="ユーザーの認証情報ファイル (JSON)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="通知を受け取るサーバーを起動する")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.add_argument("--path", default=DEFAULT_PATH)
+    serve.add_argument("--out", default="sync", help="出力ディレクトリ")
+    serve.add_argument("--format", choices=["json", "parquet", "arrow"], default="json", help="保存形式")
+    serve.add_argument("--workers", type=int, default=4, help="同時に処理する通知の数")
+
+    subscribe = commands.add_parser("subscribe", help="ユーザーをサブスクリプションに登録する")
+    subscribe.add_argument("--collection", default=None, help="購読するコレクション (省略時は全て)")
+    subscribe.add_argument("--subscriber-id", default=None, help="通知先のサブスクライバーID")
+    args = parser.parse_args()
+    configure_logging()
+    asyncio.run(main(args))